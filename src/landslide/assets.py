@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+import hashlib
+import tempfile
+
+from landslide.cache import FileCache, make_key
+
+from logging import getLogger
+logger = getLogger('landslide.assets')
+
+# Bump this whenever minifiers output changes
+MINIFIER_VERSION = 1
+
+css_strings_re = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+css_comments_re = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+css_class_rule_re = re.compile(r'(?:^|(?<=\}))(\s*)\.([\w-]+)\s*\{[^{}]*\}')
+
+# characters after which a slash starts a regular expression literal rather
+# than a division
+js_regexp_prefixes = '(,=:[!&|?{};+-*%~^<>'
+
+
+def get_pygments_classes():
+    """Returns the css class names of pygments tokens"""
+    from pygments.token import STANDARD_TYPES
+    return set([name for name in STANDARD_TYPES.values() if name])
+
+
+def minify_css(css, used_classes=None):
+    """Strips comments and superfluous whitespace of a stylesheet. Rules
+    styling a single pygments token class are also dropped if that class is
+    not in ``used_classes``, unless it is None."""
+    css = css_comments_re.sub(lambda m: m.group(1) or ' ', css)
+    if used_classes is not None:
+        unused_classes = get_pygments_classes() - set(used_classes)
+        def drop_unused_rule(match):
+            if match.group(2) in unused_classes:
+                return match.group(1)
+            return match.group(0)
+        css = css_class_rule_re.sub(drop_unused_rule, css)
+    parts = css_strings_re.split(css)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        parts[index] = re.sub(r' ?([{};,>]) ?', r'\1', part)
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+def minify_js(js):
+    """Strips comments, indentation and blank lines of some javascript code.
+    Line breaks are kept so that automatic semicolon insertion is not
+    affected. Returns the original code if it cannot be safely parsed."""
+    output = []
+    length = len(js)
+    index = 0
+    last = ''
+    while index < length:
+        char = js[index]
+        if char in ' \t\r\n':
+            end = index
+            while end < length and js[end] in ' \t\r\n':
+                end += 1
+            if '\n' in js[index:end]:
+                if last not in ('', '\n'):
+                    output.append('\n')
+                    last = '\n'
+            elif last not in ('', '\n') and end < length:
+                output.append(' ')
+            index = end
+        elif js.startswith('//', index):
+            end = js.find('\n', index)
+            index = length if end == -1 else end
+        elif js.startswith('/*', index):
+            end = js.find('*/', index + 2)
+            if end == -1:
+                return js
+            index = end + 2
+            output.append(' ')
+        elif char in '"\'`' or (char == '/' and _starts_regexp(output, last)):
+            end = _skip_literal(js, index)
+            if end == -1:
+                return js
+            output.append(js[index:end])
+            last = js[end - 1]
+            index = end
+        else:
+            output.append(char)
+            last = char
+            index += 1
+    # drops the spaces left next to line breaks by removed comments
+    lines = [line.strip() for line in ''.join(output).split('\n')]
+    return '\n'.join([line for line in lines if line])
+
+
+def _starts_regexp(output, last):
+    return (last in js_regexp_prefixes
+            or ''.join(output[-8:]).rstrip().endswith('return'))
+
+
+def _skip_literal(js, start):
+    """Returns the index following the string or regular expression literal
+    starting at ``start``, or -1 if it does not end"""
+    delimiter = js[start]
+    in_class = False
+    index = start + 1
+    while index < len(js):
+        char = js[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == '\n' and delimiter != '`':
+            return -1
+        if delimiter == '/' and char == '[':
+            in_class = True
+        elif delimiter == '/' and char == ']':
+            in_class = False
+        elif char == delimiter and not in_class:
+            index += 1
+            if delimiter == '/':
+                # regular expression flags
+                while index < len(js) and js[index].isalpha():
+                    index += 1
+            return index
+        index += 1
+    return -1
+
+
+class AssetCache(FileCache):
+    """Stores minified theme assets as plain files, named after a hash of
+    their original contents, so that they are minified only once.
+    Presentations never link to this cache, whose entries may be evicted at
+    any time; see ``write_asset()``.
+    """
+    extensions = ('.css', '.js')
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def is_entry(self, name):
+        return os.path.splitext(name)[1] in self.extensions
+
+    def minify(self, path, contents, used_classes=None):
+        """Returns the minified contents of an asset"""
+        extension = os.path.splitext(path)[1]
+        if used_classes is not None:
+            used_classes = sorted(get_pygments_classes() & set(used_classes))
+        key = make_key(MINIFIER_VERSION, hashlib.sha1(contents).hexdigest(),
+                       used_classes) + extension
+        minified = self.get(key)
+        if minified is None:
+            if extension == '.css':
+                minified = minify_css(contents, used_classes)
+            else:
+                minified = minify_js(contents)
+            logger.debug(u"Minified %s: %d bytes saved", path,
+                         len(contents) - len(minified))
+            self.set(key, minified)
+        return minified
+
+    def load(self, path):
+        fh = open(path, 'rb')
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+
+    def dump(self, value, fh):
+        fh.write(value)
+
+
+def write_asset(destination, path, contents):
+    """Writes a minified asset next to the ``destination`` file of a
+    presentation, named after both (eg. ``slides.screen.min.css`` for
+    ``slides.html``) so that each build replaces the copies of the previous
+    one. Returns the path of the copy, or None if it cannot be written."""
+    directory, destination_name = os.path.split(os.path.abspath(destination))
+    name, extension = os.path.splitext(os.path.basename(path))
+    asset_path = os.path.join(directory, '%s.%s.min%s' % (
+        os.path.splitext(destination_name)[0], name, extension))
+    try:
+        with open(asset_path, 'rb') as fh:
+            if fh.read() == contents:
+                return asset_path
+    except IOError:
+        pass
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        fh = os.fdopen(fd, 'wb')
+        try:
+            fh.write(contents)
+        finally:
+            fh.close()
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, asset_path)
+    except (IOError, OSError), e:
+        logger.warning(u"Unable to write minified asset in %s: %s",
+                       directory, e)
+        return None
+    logger.info(u"Writing  %s", asset_path)
+    return asset_path
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import glob
+import time
+import traceback
+import ConfigParser
+
+from landslide.generator import get_generator
+from landslide.utils import record_logs
+
+from logging import getLogger
+logger = getLogger('landslide.batch')
+
+
+def find_decks(patterns):
+    """Returns the configuration files matching some paths or glob patterns,
+    in order and without duplicates"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                logger.warning(u"No configuration file matches %s", pattern)
+        else:
+            matches = [pattern]
+        for path in matches:
+            if os.path.abspath(path) not in seen:
+                seen.add(os.path.abspath(path))
+                paths.append(path)
+    return paths
+
+
+def build_deck(path, **options):
+    """Builds the presentation configured by a cfg file, from the directory
+    of this file as if landslide was run there. ``options`` are passed to
+    the generator. Returns a summary of the build; errors are reported in
+    its ``error`` item rather than raised.
+    """
+    result = {'path': path, 'destination': None, 'slides': 0, 'time': 0.0,
+              'error': None}
+    start = time.time()
+    cwd = os.getcwd()
+    try:
+        os.chdir(os.path.dirname(os.path.abspath(path)))
+        config_file = os.path.basename(path)
+        destination_file = get_destination(config_file)
+        generator_class = get_generator(destination_file.rsplit('.', 1)[-1])
+        generator = generator_class(config_file, destination_file,
+                                    **options)
+        generator.execute()
+        result['destination'] = os.path.abspath(generator.destination_file)
+        result['slides'] = generator.num_slides
+    except Exception, e:
+        logger.debug(traceback.format_exc())
+        result['error'] = u"%s: %s" % (e.__class__.__name__, e)
+    finally:
+        os.chdir(cwd)
+    result['time'] = time.time() - start
+    return result
+
+
+def get_destination(config_file):
+    """Returns the destination file set in a cfg file, if any"""
+    config = ConfigParser.RawConfigParser()
+    config.read(config_file)
+    if config.has_option('landslide', 'destination'):
+        return config.get('landslide', 'destination')
+    return 'presentation.html'
+
+
+def build_decks(paths, jobs=1, **options):
+    """Builds many presentations, yielding their build summaries in order.
+    Presentations are built in the current process, or in a pool of
+    ``jobs`` worker processes, so that themes, compiled templates,
+    highlighted code and encoded images are shared by the presentations a
+    process builds.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield build_deck(path, **options)
+        return
+    import multiprocessing
+    processes = min(jobs, len(paths))
+    logger.debug(u"Building %d presentations using %d jobs", len(paths),
+                 processes)
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        for result, records in pool.imap(_build_job,
+                                         [(path, options) for path in paths]):
+            for record in records:
+                getLogger(record.name).handle(record)
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+_worker_log_handler = None
+
+def _init_worker():
+    global _worker_log_handler
+    _worker_log_handler = record_logs()
+
+def _build_job(job):
+    """Builds a presentation in a worker process"""
+    path, options = job
+    _worker_log_handler.records = []
+    result = build_deck(path, **options)
+    return result, _worker_log_handler.records
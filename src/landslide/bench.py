@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Benchmarks landslide on synthetic presentations.
+
+Run ``python -m landslide.bench --help`` for the available options. The
+presentation is built by the generator itself, each build phase being timed
+by its profiler, and results are written as JSON so that they can be
+compared with those of another run, eg. of a previous commit.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import zlib
+import shutil
+import struct
+import tempfile
+import platform
+from optparse import OptionParser
+
+from landslide import highlight, images
+from landslide.generator import HTMLGenerator
+from landslide.profiler import Profiler, get_memory
+
+import logging
+logger = logging.getLogger('landslide.bench')
+
+RESULTS_VERSION = 3
+# phases faster than this many seconds are not compared, their timings
+# being mostly noise
+MIN_COMPARED_TIME = 0.01
+
+CODE_SAMPLES = {
+    'python': [u"def fibonacci(n):",
+               u"    a, b = 0, 1",
+               u"    for i in range(n):",
+               u"        a, b = b, a + b",
+               u"    return a  # %d"],
+    'javascript': [u"function fibonacci(n) {",
+                   u"  var a = 0, b = 1;",
+                   u"  for (var i = 0; i < n; i++) { b = a + (a = b); }",
+                   u"  return a;  // %d",
+                   u"}"],
+    'c': [u"int fibonacci(int n) {",
+          u"    int a = 0, b = 1, t;",
+          u"    while (n--) { t = a + b; a = b; b = t; }",
+          u"    return a;  /* %d */",
+          u"}"],
+    'html': [u"<ul class=\"items\">",
+             u"  <li><a href=\"#%d\">First &amp; last</a></li>",
+             u"  <li>Second</li>",
+             u"</ul>"],
+}
+
+
+def make_png(size, seed=0):
+    """Returns the contents of a ``size`` pixels wide square PNG image, a
+    gradient whose blue channel depends on ``seed``"""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    rows = []
+    for y in range(size):
+        rows.append('\x00' + ''.join(chr((x * 255 // size) & 0xff)
+                                     + chr((y * 255 // size) & 0xff)
+                                     + chr(seed & 0xff)
+                                     for x in range(size)))
+    return ('\x89PNG\r\n\x1a\n'
+            + chunk('IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk('IDAT', zlib.compress(''.join(rows)))
+            + chunk('IEND', ''))
+
+
+def make_deck(directory, slides=100, slides_per_file=10, files_per_dir=10,
+              code_blocks=1, languages=('python',), images=0, image_size=64,
+              format='md'):
+    """Writes a synthetic presentation of ``slides`` slides into
+    ``directory``: Markdown or reStructuredText source files (``format`` is
+    ``md`` or ``rst``) of ``slides_per_file`` slides each, grouped in
+    subdirectories of ``files_per_dir`` files. Each slide holds
+    ``code_blocks`` code blocks cycling through ``languages``, and
+    ``images`` images of ``image_size`` pixels are spread over the slides.
+    Returns the directory of the source files, next to that of the images.
+    """
+    if format not in ('md', 'rst'):
+        raise ValueError(u"Unsupported benchmark format %s" % format)
+    source_dir = os.path.join(directory, 'slides')
+    images_dir = os.path.join(directory, 'images')
+    if images:
+        os.makedirs(images_dir)
+    for number in range(images):
+        with open(os.path.join(images_dir, 'image%d.png' % number),
+                  'wb') as fh:
+            fh.write(make_png(image_size, number))
+
+    languages = languages or ['python']
+    slides_per_file = max(1, slides_per_file)
+    files_per_dir = max(1, files_per_dir)
+    image_step = max(1, slides // max(1, images))
+    num_files = max(1, -(-slides // slides_per_file))
+    slide_number = 0
+    code_number = 0
+    for file_number in range(num_files):
+        file_dir = os.path.join(source_dir,
+                                'part%04d' % (file_number // files_per_dir))
+        if not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        texts = []
+        while slide_number < slides and len(texts) < slides_per_file:
+            image = None
+            if images and not slide_number % image_step:
+                image = os.path.relpath(
+                    os.path.join(images_dir, 'image%d.png'
+                                 % (slide_number // image_step % images)),
+                    file_dir)
+            codes = []
+            for block in range(code_blocks):
+                language = languages[code_number % len(languages)]
+                lines = CODE_SAMPLES.get(language, CODE_SAMPLES['python'])
+                codes.append((language, [line.replace(u'%d', unicode(code_number))
+                                         for line in lines]))
+                code_number += 1
+            texts.append(_make_slide(slide_number, codes, image, format))
+            slide_number += 1
+        separator = u'\n\n---\n\n' if format == 'md' else u'\n\n----\n\n'
+        source = os.path.join(file_dir, 'slides%04d.%s' % (file_number,
+                                                           format))
+        with open(source, 'wb') as fh:
+            fh.write(separator.join(texts).encode('utf-8'))
+    return source_dir
+
+
+def _make_slide(number, codes, image, format):
+    """Returns the source code of a synthetic slide"""
+    if format == 'md':
+        lines = [u"# Slide %d" % number, u"",
+                 u"- first item", u"- second item", u"",
+                 u"Some *emphasized* text and a [link](#%d)." % number, u""]
+        for language, code in codes:
+            lines.append(u"    !%s" % language)
+            lines.extend(u"    " + line for line in code)
+            lines.append(u"")
+        if image:
+            lines.extend([u"![image %d](%s)" % (number, image), u""])
+        lines.append(u".notes: notes of slide %d" % number)
+    else:
+        title = u"Slide %d" % number
+        lines = [title, u"=" * len(title), u"",
+                 u"- first item", u"- second item", u"",
+                 u"Some *emphasized* text and a `link <#%d>`__." % number,
+                 u""]
+        for language, code in codes:
+            lines.extend([u".. sourcecode:: %s" % language, u""])
+            lines.extend(u"    " + line for line in code)
+            lines.append(u"")
+        if image:
+            lines.extend([u".. image:: %s" % image, u""])
+    return u'\n'.join(lines)
+
+
+def get_phases(profiler):
+    """Returns the ``{'name', 'time', 'memory', 'calls'}`` of each phase
+    timed by a profiler, in the order they started. Times and memory growths
+    exclude those of the phases they contain, so that they add up to those
+    of the build."""
+    phases = {}
+    starts = {}
+    for event in profiler.events:
+        name = event['name']
+        if event['category'] != 'build':
+            name = u"%s:%s" % (event['category'], name)
+        phase = phases.setdefault(name, {'name': name, 'time': 0.0,
+                                         'memory': 0, 'calls': 0})
+        phase['time'] += event['self']
+        phase['memory'] += event.get('self_memory', 0)
+        phase['calls'] += 1
+        starts[name] = min(starts.get(name, event['start']), event['start'])
+    return sorted(phases.values(), key=lambda phase: starts[phase['name']])
+
+
+def build(source, destination, embed=False, markdown_extensions=None):
+    """Builds a presentation as landslide does, timing its phases and
+    measuring their memory with a profiler. Returns the phases, in order
+    (see ``get_phases()``), the time and retained memory of the whole build,
+    and the numbers of slides and source files built."""
+    # caches shared by the builds of a process would make later runs faster
+    highlight.memory_cache.clear()
+    images.memory_cache.clear()
+    profiler = Profiler(memory=True)
+    generator = HTMLGenerator(source, destination, embed=embed,
+                              markdown_extensions=markdown_extensions,
+                              profiler=profiler)
+    gc.collect()
+    memory = get_memory()
+    start = time.time()
+    generator.execute()
+    elapsed = time.time() - start
+    memory = get_memory() - memory
+    files = profiler.get_totals().get('source', {}).get('calls', 0)
+    return (get_phases(profiler), elapsed, memory, generator.num_slides,
+            files)
+
+
+def run(slides=100, slides_per_file=10, files_per_dir=10, code_blocks=1,
+        languages=('python',), images=0, image_size=64, format='md',
+        embed=False, repeat=1, markdown_extensions=()):
+    """Builds a synthetic presentation ``repeat`` times, and returns the
+    best time of the build and of each of its phases, along with the memory
+    retained by the first build and each of its phases, later builds
+    reusing it"""
+    params = {'slides': slides, 'slides_per_file': slides_per_file,
+              'files_per_dir': files_per_dir, 'code_blocks': code_blocks,
+              'languages': list(languages), 'images': images,
+              'image_size': image_size, 'format': format, 'embed': embed,
+              'repeat': repeat,
+              'markdown_extensions': list(markdown_extensions)}
+    directory = tempfile.mkdtemp(prefix='landslide-bench-')
+    try:
+        source = make_deck(directory, slides, slides_per_file, files_per_dir,
+                          code_blocks, languages, images, image_size, format)
+        destination = os.path.join(directory, 'presentation.html')
+        results = total = memory = None
+        for iteration in range(max(1, repeat)):
+            phases, elapsed, build_memory, num_slides, files = build(
+                source, destination, embed, markdown_extensions)
+            if results is None:
+                results, total, memory = phases, elapsed, build_memory
+            else:
+                times = dict((phase['name'], phase['time'])
+                             for phase in phases)
+                for phase in results:
+                    phase['time'] = min(phase['time'],
+                                        times.get(phase['name'],
+                                                  phase['time']))
+                total = min(total, elapsed)
+        size = os.path.getsize(destination)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {'version': RESULTS_VERSION, 'params': params,
+            'python': platform.python_version(),
+            'platform': platform.platform(), 'date': time.time(),
+            'slides': num_slides, 'files': files, 'output_size': size,
+            'total': total, 'memory': memory, 'phases': results}
+
+
+def compare(results, baseline, threshold=0.2, min_time=MIN_COMPARED_TIME):
+    """Returns the ``(phase, baseline time, time)`` of the phases at least
+    ``threshold`` (a ratio) slower than in the ``baseline`` results. Phases
+    taking less than ``min_time`` seconds in both are not compared."""
+    baseline_times = dict((phase['name'], phase['time'])
+                          for phase in baseline['phases'])
+    baseline_times['total'] = baseline.get('total', 0.0)
+    times = [(phase['name'], phase['time']) for phase in results['phases']]
+    times.append(('total', results['total']))
+    slowdowns = []
+    for name, elapsed in times:
+        old = baseline_times.get(name)
+        if old is None or max(old, elapsed) < min_time:
+            continue
+        if elapsed > old * (1 + threshold):
+            slowdowns.append((name, old, elapsed))
+    return slowdowns
+
+
+def format_results(results, baseline=None):
+    """Returns a human readable table of the results"""
+    baseline_times = {}
+    if baseline:
+        baseline_times = dict((phase['name'], phase['time'])
+                              for phase in baseline['phases'])
+        baseline_times['total'] = baseline.get('total')
+    lines = [u"%d slides in %d files, %d bytes of html, %d kB of memory "
+             u"retained"
+             % (results['slides'], results['files'], results['output_size'],
+                results['memory'] // 1024),
+             u"%-34s %10s %10s %11s" % (u"phase", u"calls", u"time (ms)",
+                                        u"memory (kB)")]
+    rows = [(phase['name'], phase['calls'], phase['time'],
+             phase.get('memory', 0))
+            for phase in results['phases']]
+    rows.append(('total', None, results['total'], results['memory']))
+    for name, calls, elapsed, memory in rows:
+        line = u"%-34s %10s %10.1f %11d" % (name,
+                                            u'' if calls is None else calls,
+                                            elapsed * 1000, memory // 1024)
+        old = baseline_times.get(name)
+        if old:
+            line += u" %+7.1f%%" % ((elapsed / old - 1) * 100)
+        lines.append(line)
+    return u'\n'.join(lines)
+
+
+def _parse_options(args=None):
+    parser = OptionParser(
+        usage="python -m landslide.bench [options]",
+        description="Builds a synthetic presentation, timing each phase of "
+                    "the build and measuring its memory use")
+    parser.add_option("--slides", type="int", dest="slides", default=100,
+                      help="Number of slides (defaults to 100)")
+    parser.add_option("--slides-per-file", type="int",
+                      dest="slides_per_file", default=10,
+                      help="Number of slides per source file (defaults to "
+                           "10)")
+    parser.add_option("--files-per-dir", type="int", dest="files_per_dir",
+                      default=10,
+                      help="Number of source files per directory (defaults "
+                           "to 10)")
+    parser.add_option("--code-blocks", type="int", dest="code_blocks",
+                      default=1,
+                      help="Number of code blocks per slide (defaults to 1)")
+    parser.add_option("--languages", dest="languages", default="python",
+                      help="Comma separated languages of the code blocks, "
+                           "among %s (defaults to python)"
+                           % ", ".join(sorted(CODE_SAMPLES)))
+    parser.add_option("--images", type="int", dest="images", default=0,
+                      help="Number of distinct images (defaults to 0)")
+    parser.add_option("--image-size", type="int", dest="image_size",
+                      default=64,
+                      help="Width and height of images, in pixels (defaults "
+                           "to 64)")
+    parser.add_option("--format", dest="format", default="md",
+                      choices=["md", "rst"],
+                      help="Source format, md or rst (defaults to md)")
+    parser.add_option("-i", "--embed", action="store_true", dest="embed",
+                      default=False, help="Embeds images")
+    parser.add_option("--markdown-extensions", dest="markdown_extensions",
+                      default="",
+                      help="Comma separated Markdown extensions to convert "
+                           "sources with")
+    parser.add_option("--repeat", type="int", dest="repeat", default=3,
+                      help="Number of builds, of which the fastest phases "
+                           "are kept (defaults to 3)")
+    parser.add_option("-o", "--output", dest="output",
+                      help="Writes results to this JSON file")
+    parser.add_option("--compare", dest="baseline",
+                      help="Compares results with those of this JSON file, "
+                           "failing if a phase is slower by more than the "
+                           "threshold")
+    parser.add_option("--threshold", type="float", dest="threshold",
+                      default=0.2,
+                      help="Ratio by which a phase may be slower than in "
+                           "the compared results (defaults to 0.2)")
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error(u"unexpected arguments: %s" % u" ".join(args))
+    return options
+
+
+def main(args=None):
+    options = _parse_options(args)
+    log_handler = logging.StreamHandler(sys.stderr)
+    log_handler.setLevel(logging.WARNING)
+    logging.getLogger('landslide').addHandler(log_handler)
+    results = run(options.slides, options.slides_per_file,
+                  options.files_per_dir, options.code_blocks,
+                  [language.strip() for language
+                   in options.languages.split(',') if language.strip()],
+                  options.images, options.image_size, options.format,
+                  options.embed, options.repeat,
+                  [extension.strip() for extension
+                   in options.markdown_extensions.split(',')
+                   if extension.strip()])
+    if options.output:
+        with open(options.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as fh:
+            baseline = json.load(fh)
+    print format_results(results, baseline)
+    if baseline:
+        slowdowns = compare(results, baseline, options.threshold)
+        for name, old, elapsed in slowdowns:
+            print u"Slower:  %s took %.1fms instead of %.1fms" % (
+                name, elapsed * 1000, old * 1000)
+        if slowdowns:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from logging import getLogger
+logger = getLogger('landslide.cache')
+
+# Bump this whenever the format of cached values changes
+CACHE_VERSION = 5
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'landslide')
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def make_key(*parts):
+    """Computes a cache key from any number of values having a stable
+    ``repr()``"""
+    digest = hashlib.sha1(repr((CACHE_VERSION,) + parts))
+    return digest.hexdigest()
+
+
+def clear_cache(directory=DEFAULT_CACHE_DIR):
+    """Removes the whole cache directory"""
+    if os.path.isdir(directory):
+        logger.info(u"Clearing cache %s", directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class LRUCache(object):
+    """An in-memory mapping holding at most ``size`` values, discarding the
+    least recently used ones first"""
+    def __init__(self, size=1024):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            return default
+        self.items[key] = value
+        return value
+
+    def set(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+class FileCache(object):
+    """A pickle-based key/value store living in a directory. Entries are
+    evicted when older than ``max_age`` seconds, or least recently used
+    first when the directory grows beyond ``max_size`` bytes.
+
+    With ``memory`` enabled, entries are also kept in memory between two
+    calls to ``prune()``, which is useful for long running processes
+    building the same presentation again and again. A cache with neither a
+    directory nor memory stores nothing.
+    """
+    suffix = '.cache'
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE,
+                 max_age=DEFAULT_MAX_AGE, memory=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.memory = {} if memory else None
+        self.used_keys = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key, default=None):
+        """Returns the value stored for ``key``, or ``default``"""
+        self.used_keys.add(key)
+        if self.memory is not None and key in self.memory:
+            value = self.memory[key]
+            if self.is_valid(value):
+                self.hits += 1
+                return value
+            del self.memory[key]
+        if not self.directory:
+            self.misses += 1
+            return default
+        path = self.get_path(key)
+        try:
+            value = self.load(path)
+        except IOError:
+            self.misses += 1
+            return default
+        except Exception, e:
+            logger.debug(u"Dropping unreadable cache entry %s: %s", path, e)
+            self.delete(key)
+            self.misses += 1
+            return default
+        if not self.is_valid(value):
+            self.delete(key)
+            self.misses += 1
+            return default
+        try:
+            # keeps track of last use for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        if self.memory is not None:
+            self.memory[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Stores ``value`` for ``key``; cache write failures are logged but
+        never fatal"""
+        self.used_keys.add(key)
+        if self.memory is not None:
+            self.memory[key] = value
+        if not self.directory:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+            fh = os.fdopen(fd, 'wb')
+            try:
+                self.dump(value, fh)
+            finally:
+                fh.close()
+            os.rename(tmp_path, self.get_path(key))
+        except (IOError, OSError), e:
+            logger.warning(u"Unable to write cache entry in %s: %s",
+                           self.directory, e)
+
+    def load(self, path):
+        fh = open(path, 'rb')
+        try:
+            return pickle.load(fh)
+        finally:
+            fh.close()
+
+    def dump(self, value, fh):
+        pickle.dump(value, fh, pickle.HIGHEST_PROTOCOL)
+
+    def is_entry(self, name):
+        """Tells whether a file of the cache directory is a cache entry"""
+        return name.endswith(self.suffix)
+
+    def delete(self, key):
+        if self.memory is not None:
+            self.memory.pop(key, None)
+        if not self.directory:
+            return
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    def is_valid(self, value):
+        """Tells whether a loaded value can still be used"""
+        return True
+
+    def clear(self):
+        """Removes every entry of this cache"""
+        if self.memory is not None:
+            self.memory.clear()
+        if self.directory:
+            clear_cache(self.directory)
+
+    def prune(self):
+        """Evicts stale entries, then least recently used ones until the
+        cache fits in ``max_size``. Memory only keeps the entries used since
+        the previous call."""
+        if self.memory is not None:
+            for key in self.memory.keys():
+                if key not in self.used_keys:
+                    del self.memory[key]
+        self.used_keys = set()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not self.is_entry(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum([size for mtime, size, path in entries])
+        if not self.max_size or total_size <= self.max_size:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def _remove(self, path):
+        logger.debug(u"Evicting cache entry %s", path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class SlideCache(FileCache):
+    """Stores the slides computed from a source file. Each entry records the
+    modification times of the files it depends on (eg. embedded images), and
+    is discarded as soon as one of them changes.
+    """
+    def is_valid(self, value):
+        for path, mtime in value.get('depends', {}).items():
+            if get_mtime(path) != mtime:
+                return False
+        return True
+
+
+def get_mtime(path):
+    """Returns the modification time of a file, None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
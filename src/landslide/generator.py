@@ -16,42 +16,98 @@
 
 import re
 import os.path
-import codecs
-import jinja2
+import time
+import json
+import hashlib
 import ConfigParser
-import subprocess
-
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
+import traceback
 
 from landslide.macro import (Macro, CodeHighlightingMacro,
                              EmbedImagesMacro, FixImagePathsMacro,
                              FxMacro, NotesMacro)
-from landslide.parser import Parser
-from landslide import utils
+from landslide.parser import Parser, split_header, parse_extension_configs
+from landslide.profiler import Profiler, null_span
+from landslide.assets import AssetCache, write_asset
+from landslide.cache import FileCache, SlideCache, make_key, get_mtime
+from landslide.images import ImageTable
+from landslide.manifest import SourceManifest
+from landslide.search import SearchIndex, get_terms
+from landslide.spool import SlideSpool
+from landslide.theme import THEMES_DIR, get_theme
+from landslide import highlight, pdf, utils
 
-BASE_DIR = os.path.dirname(__file__)
-THEMES_DIR = os.path.join(BASE_DIR, 'themes')
 TOC_MAX_LEVEL = 2
+# number of template output pieces to join before encoding and writing them
+RENDER_BUFFER_SIZE = 64
 
 from logging import getLogger
 logger = getLogger('landslide.generator')
 
 class BaseGenerator(object):
+    # whether embedded images are output once in a table referenced by the
+    # slides, which requires javascript, instead of inlined in each slide
+    share_embedded_images = True
+    # whether slide contents may be output as fragments materialized by
+    # javascript, which also requires it
+    lazy_slides = True
+    # whether a search index of the slides is output, for the search box
+    # implemented in javascript
+    search_slides = True
+
     def __init__(self, source, destination_file='presentation.html',
                  theme='default', direct=False,
-                 embed=False, encoding='utf8'):
-        """Configures this generator from its properties."""
+                 embed=False, encoding='utf8', cache_dir=None,
+                 memory_cache=False, jobs=1, max_image_size=None,
+                 image_quality=None, minify=False, screen_only=False,
+                 url_prefix=None, lazy=False, profiler=None,
+                 markdown_extensions=None, markdown_extension_configs=None,
+                 include=None, exclude=None, pdf_backend=None,
+                 pdf_chunk_size=None, pdf_merge_command=None, search=True):
+        """Configures this generator from its properties. Processed slides
+        are stored in ``cache_dir`` if provided, and kept in memory between
+        two builds if ``memory_cache`` is set, so that sources which did not
+        change since a previous build are not processed again. Up to ``jobs``
+        source files are processed in parallel. Embedded images are
+        downscaled to ``max_image_size`` pixels and encoded again using
+        ``image_quality`` if these are set. Theme stylesheets and scripts
+        are minified when ``minify`` is set, and the print stylesheet is
+        left out when ``screen_only`` is. Local files are linked to using
+        file:// urls, or if ``url_prefix`` is set, as served by an http
+        server under this prefix. With ``lazy`` set, slide contents are
+        output as fragments which are only added to the page when their
+        slide is about to be shown. Build phases are timed by ``profiler``
+        if provided. Markdown sources are converted using the
+        ``markdown_extensions``, configured by ``markdown_extension_configs``.
+        Source directories only contribute the files matching the
+        ``include`` glob patterns, if any, and none of the ``exclude`` ones;
+        see ``SourceManifest``. PDF files are converted by ``pdf_backend``,
+        in documents of ``pdf_chunk_size`` slides if set, up to ``jobs`` at
+        once, merged by ``pdf_merge_command``; see ``landslide.pdf``. An
+        index of the words of the slides is output for the search box of
+        the theme if ``search`` is set.
+        """
         self.direct = direct
         self.encoding = encoding
         self.embed = embed
+        self.jobs = jobs
+        self.url_prefix = url_prefix
+        self.profiler = profiler
         self.num_slides = 0
         self.__toc = []
+        self.cache = SlideCache(cache_dir and os.path.join(cache_dir, 'slides'),
+                                memory=memory_cache)
+        self.config_file = None
+        self.depends = set()
+        # the highlighting cache is shared by the module, it is pointed at
+        # the cache directory of the generator building, or at none
+        self.highlight_cache_dir = (cache_dir
+                                    and os.path.join(cache_dir, 'highlight'))
+        highlight.set_cache_dir(self.highlight_cache_dir)
 
         # macros registering
         self.macros = []
+        self.macro_instances = None
+        self.macro_stats = {}
         default_macros = [
             CodeHighlightingMacro,
             EmbedImagesMacro,
@@ -67,6 +123,7 @@ class BaseGenerator(object):
             self.source_base_dir = os.path.split(os.path.abspath(source))[0]
             if source.endswith('.cfg'):
                 logger.info("Config    %s", source)
+                self.config_file = source
                 try:
                     config = ConfigParser.RawConfigParser()
                     config.read(source)
@@ -79,6 +136,45 @@ class BaseGenerator(object):
                     logger.info(u"Using    configured theme %s", theme)
                 if config.has_option('landslide', 'destination'):
                     destination_file = config.get('landslide', 'destination')
+                if config.has_option('landslide', 'max_image_size'):
+                    max_image_size = config.getint('landslide',
+                                                   'max_image_size')
+                if config.has_option('landslide', 'image_quality'):
+                    image_quality = config.getint('landslide',
+                                                  'image_quality')
+                if config.has_option('landslide', 'minify'):
+                    minify = config.getboolean('landslide', 'minify')
+                if config.has_option('landslide', 'screen_only'):
+                    screen_only = config.getboolean('landslide',
+                                                    'screen_only')
+                if config.has_option('landslide', 'lazy'):
+                    lazy = config.getboolean('landslide', 'lazy')
+                if config.has_option('landslide', 'markdown_extensions'):
+                    markdown_extensions = re.split(r'[\s,]+', config.get(
+                        'landslide', 'markdown_extensions').strip())
+                if config.has_option('landslide',
+                                     'markdown_extension_configs'):
+                    try:
+                        markdown_extension_configs = parse_extension_configs(
+                            config.get('landslide',
+                                       'markdown_extension_configs').split())
+                    except ValueError, e:
+                        raise RuntimeError(u"Invalid configuration file: %s"
+                                           % e)
+                if config.has_option('landslide', 'pdf_backend'):
+                    pdf_backend = config.get('landslide', 'pdf_backend')
+                if config.has_option('landslide', 'pdf_chunk_size'):
+                    pdf_chunk_size = config.getint('landslide',
+                                                   'pdf_chunk_size')
+                if config.has_option('landslide', 'pdf_merge_command'):
+                    pdf_merge_command = config.get('landslide',
+                                                   'pdf_merge_command')
+                if config.has_option('landslide', 'search'):
+                    search = config.getboolean('landslide', 'search')
+                if config.has_option('landslide', 'include'):
+                    include = config.get('landslide', 'include').split()
+                if config.has_option('landslide', 'exclude'):
+                    exclude = config.get('landslide', 'exclude').split()
             else:
                 self.source = source
         else:
@@ -93,6 +189,34 @@ class BaseGenerator(object):
                           % destination_file)
         self.destination_file = destination_file
         self.theme = theme if theme else 'default'
+        self.max_image_size = max_image_size
+        self.image_quality = image_quality
+        images_cache = FileCache(cache_dir and os.path.join(cache_dir,
+                                                             'images'))
+        self.embedded_images = ImageTable(max_image_size, image_quality,
+                                          images_cache)
+        self.minify = minify
+        self.screen_only = screen_only
+        self.lazy = lazy and self.lazy_slides
+        self.search = search and self.search_slides
+        self.markdown_extensions = [extension for extension
+                                    in markdown_extensions or []
+                                    if extension]
+        self.markdown_extension_configs = markdown_extension_configs or {}
+        self.include = include or []
+        self.exclude = exclude or []
+        self.manifest = SourceManifest(
+            self.source, self.include, self.exclude,
+            FileCache(cache_dir and os.path.join(cache_dir, 'manifest'),
+                      memory=memory_cache))
+        self.parsers = {}
+        self.pdf_backend = pdf_backend or pdf.DEFAULT_BACKEND
+        self.pdf_chunk_size = pdf_chunk_size
+        self.pdf_merge_command = (pdf_merge_command
+                                  or pdf.DEFAULT_MERGE_COMMAND)
+        self.assets_cache = AssetCache(cache_dir and os.path.join(cache_dir,
+                                                                  'assets'))
+        self.css_classes = None
 
         if os.path.exists(theme):
             self.theme_dir = theme
@@ -101,15 +225,31 @@ class BaseGenerator(object):
         else:
             raise IOError(u"Theme %s not found or invalid" % theme)
 
-        if not os.path.exists(os.path.join(self.theme_dir, 'base.html')):
-            default_dir = os.path.join(THEMES_DIR, 'default')
-
-            if not os.path.exists(os.path.join(default_dir, 'base.html')):
-                raise IOError(u"Cannot find base.html in default theme")
-            else:
-                self.template_file = os.path.join(default_dir, 'base.html')
-        else:
-            self.template_file = os.path.join(self.theme_dir, 'base.html')
+        self.load_theme()
+        self.template_cache_dir = (cache_dir
+                                   and os.path.join(cache_dir, 'templates'))
+
+    def load_theme(self):
+        """Looks the theme up again, so that files added to or removed from
+        it since the previous build are taken into account"""
+        self.theme_assets = get_theme(self.theme_dir)
+        self.template_file = self.theme_assets.get_path('base.html')
+        if not self.template_file:
+            raise IOError(u"Cannot find base.html in default theme")
+        share_embedded_images = self.shares_embedded_images()
+        if share_embedded_images != getattr(self, 'share_embedded_images',
+                                            share_embedded_images):
+            # macros embed images depending on it
+            self.macro_instances = None
+        self.share_embedded_images = share_embedded_images
+
+    def shares_embedded_images(self):
+        """Tells whether embedded images are output once, in the
+        ``embedded_images`` table of the template, and referenced by id.
+        Templates which do not output this table, such as those of custom
+        themes predating it, get images inlined as data urls."""
+        return (self.__class__.share_embedded_images
+                and self.theme_assets.uses_variable('embedded_images'))
 
     def add_toc_entry(self, title, level, slide_number):
         """Adds a new entry to current presentation Table of Contents"""
@@ -134,44 +274,204 @@ class BaseGenerator(object):
 
     toc = property(get_toc, set_toc)
 
+    def __getstate__(self):
+        """Generators are sent to worker processes without their output
+        and cache, which both stay in the main process"""
+        state = self.__dict__.copy()
+        state['destination_file'] = None
+        state['cache'] = SlideCache()
+        # worker timings are sent back as events, callbacks stay here
+        state['profiler'] = self.profiler and Profiler(
+            memory=self.profiler.memory)
+        return state
+
+    def profile(self, name, category='build', **args):
+        """Returns a context manager timing a build phase if profiling"""
+        if self.profiler is None:
+            return null_span
+        return self.profiler.span(name, category, **args)
+
     def fetch_contents(self, source):
         """Recursively fetches Markdown contents from a single file or
         directory containing itself Markdown files
         """
-        slides = []
-
-        if type(source) is list:
-            for entry in source:
-                slides.extend(self.fetch_contents(entry))
-        elif os.path.isdir(source):
-            logger.info(u"Entering %s", source)
-            entries = os.listdir(source)
-            entries.sort()
-            for entry in entries:
-                slides.extend(self.fetch_contents(os.path.join(source, entry)))
+        with self.profile('contents'):
+            return list(self.iter_contents(source))
+
+    def iter_contents(self, source):
+        """Lazily fetches contents as ``fetch_contents()`` does, yielding
+        slides vars one source file at a time"""
+        with self.profile('walk'):
+            sources = self.walk_sources(source)
+        for source, entry in self.process_sources(sources):
+            if entry:
+                self.depends.update(entry['depends'])
+                if self.share_embedded_images:
+                    self.embedded_images.update(entry['images'])
+                if self.css_classes is not None:
+                    self.css_classes.update(entry['css_classes'])
+                for slide_vars in entry['slides']:
+                    yield slide_vars
+            if not entry or not entry['slides']:
+                logger.warn(u"Exiting  %s: no contents found", source)
+
+    def walk_sources(self, source):
+        """Recursively lists the supported source files found in a single
+        file or directory, in presentation order, along with their parser"""
+        if source == self.source:
+            manifest = self.manifest
         else:
-            try:
-                parser = Parser(os.path.splitext(source)[1], self.encoding)
-            except NotImplementedError:
-                return slides
-
-            logger.info(u"Adding   %s (%s)", source, parser.format)
-
-            try:
-                file = codecs.open(source, encoding=self.encoding)
-                file_contents = file.read()
-            except UnicodeDecodeError:
-                self.log(u"Unable to decode source %s: skipping" % source,
-                         'warning')
+            manifest = SourceManifest(source, self.include, self.exclude)
+        sources = []
+        for path, format in manifest.resolve():
+            sources.append((path, self.get_parser(path)))
+        return sources
+
+    def get_parser(self, path):
+        """Returns the parser of a source file, shared by the files having
+        the same extension"""
+        extension = os.path.splitext(path)[1]
+        parser = self.parsers.get(extension)
+        if parser is None:
+            parser = self.parsers[extension] = Parser(
+                extension, self.encoding, self.markdown_extensions,
+                self.markdown_extension_configs)
+        return parser
+
+    def process_sources(self, sources):
+        """Yields the ``(source, entry)`` pairs of some source files, in
+        order. Sources missing from the cache are processed, using a pool of
+        ``jobs`` worker processes if allowed to.
+        """
+        lookups = self.lookup_sources(sources)
+        results = None
+        if self.jobs > 1:
+            lookups = list(lookups)
+            jobs = [(source, parser, file_contents)
+                    for source, parser, cache_key, entry, file_contents
+                    in lookups if entry is None]
+            if len(jobs) > 1:
+                results = self._process_parallel(jobs)
+
+        for source, parser, cache_key, entry, file_contents in lookups:
+            if entry is None:
+                if results is None:
+                    entry = self.process_source(source, parser, file_contents)
+                else:
+                    entry = results.next()
+                if entry is not None:
+                    self.cache.set(cache_key, entry)
+            yield source, entry
+
+    def lookup_sources(self, sources):
+        """Reads source files one at a time, yielding their cache entry if
+        any, or their contents to be processed"""
+        for source, parser in sources:
+            with self.profile('read', source=source):
+                file_contents = open(source, 'rb').read()
+            cache_key = self.get_cache_key(source, file_contents, parser)
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                yield source, parser, cache_key, None, file_contents
             else:
-                inner_slides = re.split(r'<hr.+>', parser.parse(file_contents))
-                for inner_slide in inner_slides:
-                    slides.append(self.get_slide_vars(inner_slide, source))
+                logger.debug(u"Using    cached slides for %s", source)
+                yield source, parser, cache_key, entry, None
+
+    def _process_parallel(self, jobs):
+        """Processes source files in worker processes, yielding their entries
+        in order. Log records emitted while processing a file are replayed
+        here once it is done, so they are never interleaved."""
+        processes = min(self.jobs, len(jobs))
+        logger.debug(u"Processing %d files using %d jobs", len(jobs),
+                     processes)
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init_worker, (self,))
+        try:
+            for (source, entry, records, macro_stats, events,
+                 error) in pool.imap(_process_job, jobs):
+                for record in records:
+                    getLogger(record.name).handle(record)
+                self.merge_macro_stats(macro_stats)
+                if self.profiler is not None:
+                    self.profiler.merge(events)
+                if error:
+                    raise RuntimeError(u"Unable to process %s: %s"
+                                       % (source, error))
+                yield entry
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
 
-        if not slides:
-            logger.warn(u"Exiting  %s: no contents found", source)
+    def process_source(self, source, parser, file_contents):
+        """Parses the raw contents of a source file and computes its slides
+        vars. Returns a cacheable entry also listing the files these slides
+        depend on, or None if the source cannot be decoded.
+        """
+        with self.profile('source', source=source, format=parser.format):
+            return self._process_source(source, parser, file_contents)
 
-        return slides
+    def _process_source(self, source, parser, file_contents):
+        try:
+            text = file_contents.decode(self.encoding)
+        except UnicodeDecodeError:
+            logger.warning(u"Unable to decode source %s: skipping", source)
+            return None
+        with self.profile('parse', source=source, format=parser.format):
+            slides_src = parser.parse_slides(text)
+        slides = []
+        image_ids = set()
+        css_classes = set()
+        for index, slide_src in enumerate(slides_src):
+            with self.profile('slide', source=source, index=index) as args:
+                slide_vars = self.make_slide_vars(*slide_src, source=source)
+                if slide_vars and slide_vars['title']:
+                    args['title'] = utils.get_text(slide_vars['title'])
+            if slide_vars and slide_vars['content']:
+                image_ids.update(re.findall(r'data-embedded-image="(\w+)"',
+                                            slide_vars['content']))
+                for classes in re.findall(r'class="([^"]+)"',
+                                          slide_vars['content']):
+                    css_classes.update(classes.split())
+            slides.append(slide_vars)
+        images = {}
+        if self.share_embedded_images:
+            images = self.embedded_images.subset(image_ids)
+        html = u''.join((header or u'') + (content or u'')
+                        for header, level, title, content in slides_src)
+        return {'slides': slides, 'images': images,
+                'css_classes': css_classes,
+                'depends': self.get_dependencies(html, source)}
+
+    def get_dependencies(self, html, source):
+        """Returns modification times of the local images referenced in some
+        html code, which may end up embedded in the slides"""
+        depends = {}
+        for image_url in re.findall(r'<img\s[^>]*?src="([^"]+)"', html,
+                                    re.UNICODE):
+            if image_url.startswith('data:') or '://' in image_url:
+                continue
+            if not os.path.isabs(image_url):
+                image_url = os.path.join(os.path.dirname(source), image_url)
+            depends[image_url] = get_mtime(image_url)
+        return depends
+
+    def get_cache_key(self, source, file_contents, parser=None):
+        """Computes the cache key of a source file, from everything that may
+        alter its processed slides, including the versions of the libraries
+        its ``parser`` uses"""
+        macros = ['%s.%s' % (macro.__module__, macro.__name__)
+                  for macro in self.macros]
+        if parser is None:
+            parser = self.get_parser(source)
+        return make_key(source, os.path.abspath(source),
+                        hashlib.sha1(file_contents).hexdigest(),
+                        self.encoding, self.theme_dir, self.embed, macros,
+                        self.share_embedded_images, self.max_image_size,
+                        self.image_quality, self.url_prefix,
+                        self.markdown_extensions,
+                        sorted(self.markdown_extension_configs.items()),
+                        self.search, parser.get_versions())
 
     def get_css(self):
         """Fetches and returns stylesheet file path or contents, for both print
@@ -180,22 +480,17 @@ class BaseGenerator(object):
         """
         css = {}
 
-        print_css = os.path.join(self.theme_dir, 'css', 'print.css')
-        if not os.path.exists(print_css):
-            # Fall back to default theme
-            print_css = os.path.join(THEMES_DIR, 'default', 'css', 'print.css')
-
-            if not os.path.exists(print_css):
-                raise IOError(u"Cannot find css/print.css in default theme")
-
-        css['print'] = {'path_url': utils.get_abs_path_url(print_css),
-                        'contents': open(print_css).read()}
+        print_css = self.theme_assets.get_path('css/print.css')
+        if not print_css:
+            raise IOError(u"Cannot find css/print.css in default theme")
 
+        if not self.screen_only:
+            css['print'] = self.get_asset(print_css, self.css_classes)
 
-        screen_css = os.path.join(self.theme_dir, 'css', 'screen.css')
-        if (os.path.exists(screen_css)):
-            css['screen'] = {'path_url': utils.get_abs_path_url(screen_css),
-                             'contents': open(screen_css).read()}
+        screen_css = self.theme_assets.get_path('css/screen.css',
+                                                fallback=False)
+        if screen_css:
+            css['screen'] = self.get_asset(screen_css, self.css_classes)
         else:
             logger.warn(u"No screen stylesheet provided in current theme")
 
@@ -205,34 +500,47 @@ class BaseGenerator(object):
         """Fetches and returns javascript file path or contents, depending if
         we want a standalone presentation or not
         """
-        js_file = os.path.join(self.theme_dir, 'js', 'slides.js')
-
-        if not os.path.exists(js_file):
-            js_file = os.path.join(THEMES_DIR, 'default', 'js', 'slides.js')
-
-            if not os.path.exists(js_file):
-                raise IOError(u"Cannot find slides.js in default theme")
-
-        return {'path_url': utils.get_abs_path_url(js_file),
-                'contents': open(js_file).read()}
+        js_file = self.theme_assets.get_path('js/slides.js')
+        if not js_file:
+            raise IOError(u"Cannot find slides.js in default theme")
+
+        return self.get_asset(js_file)
+
+    def get_asset(self, path, used_classes=None):
+        """Returns the path url and contents of a theme stylesheet or
+        script, minified if requested. Stylesheets drop the pygments rules of
+        token classes missing from ``used_classes``, unless it is None.
+        Minified copies are cached, and presentations which are not
+        standalone link to copies written next to the destination file, if
+        they can be moved away from the theme, ie. if they do not reference
+        relative urls.
+        """
+        contents = open(path, 'rb').read()
+        if not self.minify:
+            return {'path_url': utils.get_path_url(path, self.url_prefix),
+                    'contents': contents}
+        contents = self.assets_cache.minify(path, contents, used_classes)
+        linked_path = path
+        if (not self.embed and 'url(' not in contents
+                and isinstance(self.destination_file, basestring)):
+            linked_path = (write_asset(self.destination_file, path, contents)
+                           or path)
+        return {'path_url': utils.get_path_url(linked_path, self.url_prefix),
+                'contents': contents}
 
     def get_slide_vars(self, slide_src, source=None):
         """Computes a single slide template vars from its html source code.
            Also extracts slide informations for the table of contents.
         """
-        vars = {'header': None, 'content': None}
-
-        find = re.search(r'(<h(\d+?).*?>(.+?)</h\d>)\s?(.+)?', slide_src,
-                         re.DOTALL | re.UNICODE)
+        find = split_header(slide_src)
         if not find:
-            header = level = title = None
-            content = slide_src.strip()
-        else:
-            header = find.group(1)
-            level = int(find.group(2))
-            title = find.group(3)
-            content = find.group(4).strip() if find.group(4) else find.group(4)
+            return self.make_slide_vars(None, None, None, slide_src.strip(),
+                                        source)
+        return self.make_slide_vars(*find, source=source)
 
+    def make_slide_vars(self, header, level, title, content, source=None):
+        """Computes a single slide template vars from its heading html code,
+        level and title, and from the html code of its contents"""
         slide_classes = []
 
         if content:
@@ -245,68 +553,264 @@ class BaseGenerator(object):
                            'abs_path': os.path.abspath(source)}
 
         if header or content:
-            return {'header': header, 'title': title, 'level': level,
-                    'content': content, 'classes': slide_classes,
-                    'source': source_dict}
-
-    def get_template_vars(self, slides):
-        """Computes template vars from slides html source code"""
+            slide_vars = {'header': header, 'title': title, 'level': level,
+                          'content': content, 'classes': slide_classes,
+                          'source': source_dict}
+            if self.search:
+                with self.profile('index', source=source):
+                    slide_vars['terms'] = get_terms(header, content)
+            return slide_vars
+
+    def get_template_vars(self, slides, search_index=None):
+        """Computes template vars from slides html source code. Slides may be
+        a ``SlideSpool``, in which case only their metadata is looked up.
+        The search index of the slides is built from their ``terms`` unless
+        given, eg. built while they were spooled (see ``iter_indexed()``).
+        """
+        self.num_slides = 0
+        self.__toc = []
+        metadata = getattr(slides, 'metadata', slides)
         try:
-            head_title = slides[0]['title']
+            head_title = metadata[0]['title']
         except (IndexError, TypeError):
             head_title = "Untitled Presentation"
 
-        for slide_index, slide_vars in enumerate(slides):
+        if not self.search:
+            search_index = None
+        elif search_index is None:
+            search_index = SearchIndex()
+            for slide_vars in self.iter_indexed(slides, search_index):
+                pass
+
+        slides_metadata = []
+        for slide_index, slide_vars in enumerate(metadata):
             if not slide_vars:
+                slides_metadata.append(None)
                 continue
             self.num_slides += 1
             slide_number = slide_vars['number'] = self.num_slides
             if slide_vars['level'] and slide_vars['level'] <= TOC_MAX_LEVEL:
                 self.add_toc_entry(slide_vars['title'], slide_vars['level'],
                                    slide_number)
+            title = slide_vars['title']
+            slides_metadata.append({'number': slide_number,
+                                    'title': title and utils.get_text(title)})
+
+        embedded_images = None
+        if self.share_embedded_images and self.embedded_images:
+            embedded_images = self.embedded_images.to_json()
 
         return {'head_title': head_title, 'num_slides': str(self.num_slides),
                 'slides': slides, 'toc': self.toc, 'embed': self.embed,
-                'css': self.get_css(), 'js': self.get_js()}
+                'css': self.get_css(), 'js': self.get_js(),
+                'embedded_images': embedded_images, 'lazy': self.lazy,
+                'to_fragment': to_fragment,
+                'slides_metadata': to_fragment(slides_metadata),
+                'search_index': self.get_search_index(search_index)}
+
+    def iter_indexed(self, slides, search_index):
+        """Yields slides vars, adding the ``terms`` of each slide to a
+        search index as it goes, under the number the slide gets in the
+        presentation"""
+        number = 0
+        for slide_vars in slides:
+            if slide_vars:
+                number += 1
+                search_index.add(number, slide_vars.get('terms') or ())
+            yield slide_vars
+
+    def get_search_index(self, search_index):
+        """Returns the JSON of a search index to be output in a script
+        element, logging its size and the time it took to encode"""
+        if search_index is None:
+            return None
+        start = time.time()
+        with self.profile('search_index'):
+            fragment = to_fragment(search_index.to_json())
+        logger.info(u"Indexed  %d words of %d slides: %d bytes in %.1fms",
+                    len(search_index.postings), search_index.num_slides,
+                    len(fragment), (time.time() - start) * 1000)
+        return fragment
 
     def process_macros(self, content, source=None):
-        """Processed all macros"""
+        """Processed all macros, skipping those which cannot apply to some
+        contents. Per macro counters of processed (hits) and skipped
+        (misses) contents, and of processing time, are kept in
+        ``macro_stats``.
+        """
         classes = []
-        for macro_class in self.macros:
-            macro = macro_class(embed=self.embed)
+        for macro in self.get_macros():
+            stats = self.get_macro_stats(macro.__class__.__name__)
+            if not macro.accepts(content):
+                stats['misses'] += 1
+                continue
+            stats['hits'] += 1
+            start = time.time()
             try:
-                content, add_classes = macro.process(content, source)
+                with self.profile(macro.__class__.__name__, 'macro',
+                                  source=source):
+                    content, add_classes = macro.process(content, source)
                 if add_classes:
                     classes += add_classes
             except Exception, e:
                 logger.info(u"%s processing failed in %s: %s",
                          macro, source, e)
+            stats['time'] += time.time() - start
         return content, classes
 
+    def get_macros(self):
+        """Returns the instances of registered macros, creating them on first
+        use"""
+        if self.macro_instances is None:
+            self.macro_instances = []
+            for macro_class in self.macros:
+                macro = macro_class(embed=self.embed)
+                macro.setup(self)
+                self.macro_instances.append(macro)
+        return self.macro_instances
+
+    def get_macro_stats(self, name):
+        """Returns the counters of the macro class named ``name``"""
+        return self.macro_stats.setdefault(name, {'hits': 0, 'misses': 0,
+                                                  'time': 0.0})
+
+    def merge_macro_stats(self, macro_stats):
+        """Adds macro counters collected by another generator, eg. in a
+        worker process"""
+        for name, stats in macro_stats.items():
+            own_stats = self.get_macro_stats(name)
+            for counter, value in stats.items():
+                own_stats[counter] += value
+
+    def get_watched_paths(self):
+        """Returns the files and directories the last build depends on:
+        sources, configuration file, theme and referenced local images"""
+        paths = self.manifest.get_watched_paths()
+        paths.update(self.depends)
+        paths.update(self.theme_assets.dirs)
+        if self.config_file:
+            paths.add(self.config_file)
+        return paths
+
     def register_macro(self, macro_class):
         """Registers a new macro"""
         if not issubclass(macro_class, Macro):
             raise TypeError("A macro must inherit from landslide.macro.Macro")
         self.macros.append(macro_class)
+        self.macro_instances = None
 
     def render(self):
         """Returns generated html code"""
-        template_src = codecs.open(self.template_file, encoding=self.encoding)
-        template = jinja2.Template(template_src.read())
-        slides = self.fetch_contents(self.source)
-        return template.render(self.get_template_vars(slides))
+        return u''.join(self.iter_render())
+
+    def iter_render(self):
+        """Returns an iterator over chunks of generated html code, rendering
+        the template as they are consumed"""
+        template, template_vars, slides = self.prepare_render()
+        stream = template.stream(template_vars)
+        stream.enable_buffering(RENDER_BUFFER_SIZE)
+        return self._close_when_rendered(stream, slides)
+
+    def iter_render_documents(self, size):
+        """Returns an iterator over presentations of ``size`` slides at
+        most, themselves iterators over chunks of html code as
+        ``iter_render()`` returns. Slides keep their number within the
+        whole presentation."""
+        template, template_vars, slides = self.prepare_render()
+        return self._iter_documents(template, template_vars, slides, size)
+
+    def _iter_documents(self, template, template_vars, slides, size):
+        try:
+            # an empty presentation still makes a document
+            for start in xrange(0, max(len(slides), 1), size):
+                document_slides = (slides[index] for index
+                                   in xrange(start, min(start + size,
+                                                        len(slides))))
+                stream = template.stream(dict(template_vars,
+                                              slides=document_slides))
+                stream.enable_buffering(RENDER_BUFFER_SIZE)
+                yield self._iter_stream(stream)
+        finally:
+            slides.close()
+
+    def prepare_render(self):
+        """Processes the sources, and returns the template, its vars and
+        the spooled slides, to be closed once rendered"""
+        self.load_theme()
+        template = self.theme_assets.get_template('base.html', self.encoding,
+                                                  self.template_cache_dir)
+        highlight.set_cache_dir(self.highlight_cache_dir)
+        self.depends = set()
+        self.embedded_images.clear()
+        self.css_classes = set() if self.minify else None
+        search_index = SearchIndex() if self.search else None
+        with self.profile('contents'):
+            slides = self.iter_contents(self.source)
+            if search_index is not None:
+                # terms are only kept in the spool file, not in memory
+                slides = self.iter_indexed(slides, search_index)
+            slides = SlideSpool(slides)
+        self.cache.prune()
+        self.manifest.cache.prune()
+        self.embedded_images.cache.prune()
+        highlight.disk_cache.prune()
+        with self.profile('template_vars'):
+            template_vars = self.get_template_vars(slides, search_index)
+        self.assets_cache.prune()
+        return template, template_vars, slides
+
+    def _close_when_rendered(self, stream, slides):
+        try:
+            for chunk in self._iter_stream(stream):
+                yield chunk
+        finally:
+            slides.close()
+
+    def _iter_stream(self, stream):
+        while True:
+            with self.profile('render'):
+                chunk = next(stream, None)
+            if chunk is None:
+                break
+            yield chunk
 
     def write(self, output, html):
-        """Writes generated presentation code into the destination file"""
-        output.write(html.encode('utf-8'))
+        """Writes generated presentation code into the destination file;
+        ``html`` is either a string or an iterable of strings, encoded and
+        written one at a time"""
+        if isinstance(html, basestring):
+            html = [html]
+        for chunk in html:
+            output.write(chunk.encode('utf-8'))
+        output.flush()
 
     def execute(self):
         """Execute this generator regarding its current configuration"""
+        self.write_destination(self.iter_render(), self.write)
+
+    def write_destination(self, html, write):
+        """Writes generated code to the destination file using a ``write``
+        method"""
+        # sources are processed before the destination file is opened, so
+        # that it is left untouched if one of them cannot be read, and it is
+        # removed if writing it fails rather than left incomplete
         if isinstance(self.destination_file, basestring):
-            outfile = open(self.destination_file, 'w')
+            outfile = open(self.destination_file, 'wb')
+            written = False
+            try:
+                with self.profile('write'):
+                    write(outfile, html)
+                written = True
+            finally:
+                outfile.close()
+                if not written:
+                    try:
+                        os.remove(self.destination_file)
+                    except OSError:
+                        pass
         else:
-            outfile = self.destination_file
-        self.write(outfile, self.render())
+            with self.profile('write'):
+                write(self.destination_file, html)
 
 
 class HTMLGenerator(BaseGenerator):
@@ -314,21 +818,61 @@ class HTMLGenerator(BaseGenerator):
 
 
 class PDFGenerator(BaseGenerator):
+    share_embedded_images = False
+    lazy_slides = False
+    search_slides = False
 
     def write(self, output, html):
-        """Tries to write a PDF export from the command line using PrinceXML if
-        available
-        """
-        input = StringIO(html)
-        try:
-            process = subprocess.Popen(["prince", "-", "-o -"],
-                    stdin=input, stdout=output, stderr=subprocess.PIPE)
-            process.communicate()
-        except Exception:
-            raise EnvironmentError(u"Unable to generate PDF file using "
-                                    "prince. Is it installed and available?")
-        finally:
-            dummy_fh.close()
+        """Converts generated html code to PDF using the configured backend,
+        streaming it to the converter as it is rendered"""
+        pdf.convert(pdf.PDFBackend(self.pdf_backend), html, output)
+
+    def write_documents(self, output, documents):
+        """Converts presentations to PDF files in parallel, then merges
+        them"""
+        pdf.convert_chunks(pdf.PDFBackend(self.pdf_backend), documents,
+                           output, self.jobs, self.pdf_merge_command)
+
+    def execute(self):
+        # a missing converter is reported before the destination is opened
+        pdf.PDFBackend(self.pdf_backend).check()
+        if not self.pdf_chunk_size:
+            return BaseGenerator.execute(self)
+        self.write_destination(self.iter_render_documents(self.pdf_chunk_size),
+                               self.write_documents)
+
+
+def to_fragment(value):
+    """Encodes some html code, or any value, as JSON which can be output
+    in a script element"""
+    return json.dumps(value).replace(u'<', u'\\u003c')
+
+
+_worker_generator = None
+_worker_log_handler = None
+
+def _init_worker(generator):
+    global _worker_generator, _worker_log_handler
+    _worker_generator = generator
+    highlight.set_cache_dir(generator.highlight_cache_dir)
+    _worker_log_handler = utils.record_logs()
+
+def _process_job(job):
+    """Processes a source file in a worker process"""
+    source = job[0]
+    _worker_log_handler.records = []
+    _worker_generator.macro_stats = {}
+    if _worker_generator.profiler is not None:
+        _worker_generator.profiler.clear()
+    entry = error = None
+    try:
+        entry = _worker_generator.process_source(*job)
+    except Exception, e:
+        logger.debug(traceback.format_exc())
+        error = u"%s: %s" % (e.__class__.__name__, e)
+    events = _worker_generator.profiler and _worker_generator.profiler.events
+    return (source, entry, _worker_log_handler.records,
+            _worker_generator.macro_stats, events, error)
 
 _generators = {
     'html': HTMLGenerator,
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from landslide.cache import FileCache, LRUCache, make_key
+
+# lexers, formatters and highlighted code are shared by Markdown code blocks
+# and ReST directives of every presentation built by the current process.
+# Pygments itself is only imported once some code has to be highlighted.
+_lexers = {}
+_formatters = {}
+
+memory_cache = LRUCache(1024)
+disk_cache = FileCache()
+
+
+def set_cache_dir(directory):
+    """Enables storing highlighted code in ``directory``, None disables
+    it"""
+    disk_cache.directory = directory
+
+
+def get_lexer(language, fallback=False):
+    """Returns the lexer for a language name. Raises ``ValueError`` for
+    unknown languages, unless ``fallback`` is set in which case a plain
+    text lexer is returned."""
+    try:
+        return _lexers[language]
+    except KeyError:
+        pass
+    from pygments.lexers import get_lexer_by_name, TextLexer
+    try:
+        lexer = get_lexer_by_name(language)
+    except ValueError:
+        if not fallback:
+            raise
+        return TextLexer()
+    _lexers[language] = lexer
+    return lexer
+
+
+def get_formatter(**options):
+    """Returns a html formatter configured with ``options``"""
+    key = tuple(sorted(options.items()))
+    try:
+        return _formatters[key]
+    except KeyError:
+        from pygments.formatters import HtmlFormatter
+        formatter = _formatters[key] = HtmlFormatter(**options)
+        return formatter
+
+
+def highlight(code, language, fallback=False, **options):
+    """Returns ``code`` highlighted as html, using the lexer named
+    ``language`` and a formatter configured with ``options``. See
+    ``get_lexer()`` for unknown languages handling."""
+    import pygments
+    key = (pygments.__version__, language, fallback, code,
+           tuple(sorted(options.items())))
+    html = memory_cache.get(key)
+    if html is not None:
+        return html
+    disk_key = make_key(*key)
+    html = disk_cache.get(disk_key)
+    if html is None:
+        html = pygments.highlight(code, get_lexer(language, fallback),
+                                  get_formatter(**options))
+        disk_cache.set(disk_key, html)
+    memory_cache.set(key, html)
+    return html
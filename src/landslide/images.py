@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import json
+import base64
+import hashlib
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+from landslide.cache import FileCache, LRUCache, make_key
+
+from logging import getLogger
+logger = getLogger('landslide.images')
+
+# PIL formats of the images which can be optimized, by mime-type
+OPTIMIZED_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png':  'PNG',
+}
+DEFAULT_QUALITY = 90
+EXIF_ORIENTATION = 0x0112
+# PIL transpose methods turning an image upright, by EXIF orientation
+ORIENTATION_TRANSPOSES = {
+    2: 'FLIP_LEFT_RIGHT',
+    3: 'ROTATE_180',
+    4: 'FLIP_TOP_BOTTOM',
+    5: 'TRANSPOSE',
+    6: 'ROTATE_270',
+    7: 'TRANSVERSE',
+    8: 'ROTATE_90',
+}
+
+# encoded images are shared by every presentation built by the current
+# process, by file path, size, modification time and optimization settings
+memory_cache = LRUCache(256)
+
+
+def get_data_url(contents, mime_type):
+    """Returns the base64-encoded data url of some image contents"""
+    return u"data:%s;base64,%s" % (mime_type, base64.b64encode(contents))
+
+
+def get_pil_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError(u"Looks like PIL is not installed")
+    return Image
+
+
+def optimize_image(contents, mime_type, max_size=None, quality=None):
+    """Downscales some image contents so that none of the image sides
+    exceeds ``max_size`` pixels, and encodes it again using ``quality``.
+    The image is turned upright according to its EXIF orientation, and its
+    metadata is always dropped, even when the encoded image is not
+    smaller."""
+    Image = get_pil_image()
+    format = OPTIMIZED_FORMATS.get(mime_type)
+    if not format:
+        return contents
+    image = Image.open(StringIO(contents))
+    if max_size and max(image.size) > max_size:
+        # lets the JPEG decoder itself skip most pixels of huge photos
+        image.draft(image.mode, (max_size, max_size))
+    image = apply_orientation(image)
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.ANTIALIAS)
+    options = {'optimize': True}
+    if format == 'JPEG':
+        options['quality'] = quality or DEFAULT_QUALITY
+        if image.mode not in ('L', 'RGB', 'CMYK'):
+            image = image.convert('RGB')
+    output = StringIO()
+    # no exif nor pnginfo is given, so that none of the metadata is kept
+    image.save(output, format, **options)
+    return output.getvalue()
+
+
+def apply_orientation(image):
+    """Returns an image rotated and flipped according to its EXIF
+    orientation tag, as cameras store portrait photos sideways"""
+    try:
+        from PIL import ImageOps
+        exif_transpose = ImageOps.exif_transpose
+    except (ImportError, AttributeError):
+        # Pillow < 6.0
+        exif_transpose = None
+    if exif_transpose is not None:
+        return exif_transpose(image)
+    try:
+        orientation = (image._getexif() or {}).get(EXIF_ORIENTATION)
+    except (AttributeError, IndexError, KeyError, IOError, SyntaxError):
+        return image
+    method = ORIENTATION_TRANSPOSES.get(orientation)
+    if method is None:
+        return image
+    return image.transpose(getattr(get_pil_image(), method))
+
+
+class ImageTable(object):
+    """Content-addressed table of the images embedded in a presentation.
+    Each distinct image is read and encoded once, whatever the number of
+    times it is referenced, and is identified by the hash of its contents.
+
+    If ``max_size`` or ``quality`` are set, images are optimized before
+    being encoded (see ``optimize_image()``), optimized contents being
+    stored in ``cache`` by hash of the original ones.
+    """
+    def __init__(self, max_size=None, quality=None, cache=None):
+        if max_size or quality:
+            get_pil_image()
+        self.max_size = max_size
+        self.quality = quality
+        self.cache = cache or FileCache()
+        self.data_urls = {}
+        # image ids by file path, size and modification time, to avoid
+        # reading the same file twice
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.data_urls)
+
+    def add(self, path, mime_type):
+        """Adds an image file to the table and returns its id"""
+        stat = os.stat(path)
+        file_key = (os.path.abspath(path), stat.st_size, stat.st_mtime,
+                    mime_type)
+        image_id = self.ids.get(file_key)
+        if image_id in self.data_urls:
+            return image_id
+        memory_key = file_key + (self.max_size, self.quality)
+        encoded = memory_cache.get(memory_key)
+        if encoded is not None:
+            image_id = self.ids[file_key] = encoded[0]
+            self.data_urls[image_id] = encoded[1]
+        else:
+            fh = open(path, 'rb')
+            try:
+                contents = fh.read()
+            finally:
+                fh.close()
+            image_id = self.ids[file_key] = hashlib.sha1(contents).hexdigest()
+            if self.max_size or self.quality:
+                contents = self.optimize(path, image_id, contents, mime_type)
+            self.data_urls[image_id] = get_data_url(contents, mime_type)
+            memory_cache.set(memory_key, (image_id, self.data_urls[image_id]))
+        return image_id
+
+    def optimize(self, path, image_id, contents, mime_type):
+        cache_key = make_key(image_id, mime_type, self.max_size,
+                             self.quality)
+        optimized = self.cache.get(cache_key)
+        if optimized is None:
+            try:
+                optimized = optimize_image(contents, mime_type, self.max_size,
+                                           self.quality)
+            except IOError, e:
+                logger.warning(u"Unable to optimize image %s: %s", path, e)
+                return contents
+            self.cache.set(cache_key, optimized)
+        if len(optimized) < len(contents):
+            logger.info(u"Optimized image %s: %d bytes saved (%d%%)", path,
+                        len(contents) - len(optimized),
+                        100 - 100 * len(optimized) / len(contents))
+        return optimized
+
+    def update(self, data_urls):
+        """Adds images already encoded, by id"""
+        self.data_urls.update(data_urls)
+
+    def subset(self, image_ids):
+        """Returns the data urls of some images of this table, by id"""
+        return dict([(image_id, self.data_urls[image_id])
+                     for image_id in image_ids
+                     if image_id in self.data_urls])
+
+    def clear(self):
+        self.data_urls = {}
+
+    def to_json(self):
+        return json.dumps(self.data_urls, sort_keys=True)
@@ -16,15 +16,11 @@
 
 import os
 import re
-import base64
 import htmlentitydefs
-import mimetypes
-import pygments
-
-from pygments.lexers import get_lexer_by_name
-from pygments.formatters import HtmlFormatter
 
 from landslide import utils
+from landslide.highlight import highlight
+from landslide.images import get_data_url
 from logging import getLogger
 logger = getLogger('landslide.macro')
 
@@ -32,10 +28,30 @@ class Macro(object):
     """Base class for Macros. A Macro aims to analyse, process and eventually
     alter some provided HTML contents and to provide supplementary informations
     to the slide context.
+
+    A macro is instantiated once per generator, then used to process every
+    slide. Slides containing none of its ``triggers`` substrings are not
+    processed at all, unless ``triggers`` is None.
     """
+    triggers = None
+
     def __init__(self, embed=False):
         self.embed = embed
 
+    def setup(self, generator):
+        """Called once the macro is instantiated by a generator, to let it
+        use build wide resources"""
+        pass
+
+    def accepts(self, content):
+        """Cheaply tells whether this macro may alter some slide contents"""
+        if self.triggers is None:
+            return True
+        for trigger in self.triggers:
+            if trigger in content:
+                return True
+        return False
+
     def process(self, content, source=None):
         """Generic processor (does actually nothing)"""
         return content, []
@@ -45,6 +61,8 @@ class CodeHighlightingMacro(Macro):
     """This Macro performs syntax coloration in slide code blocks using
     Pygments.
     """
+    triggers = ('<pre',)
+
     code_blocks_re = re.compile(
         r'(<pre.+?>(<code>)?\s?!(\w+?)\n(.*?)(</code>)?</pre>)',
         re.UNICODE | re.MULTILINE | re.DOTALL
@@ -58,30 +76,45 @@ class CodeHighlightingMacro(Macro):
         return self.html_entity_re.sub(f, string)
 
     def process(self, content, source=None):
-        code_blocks = self.code_blocks_re.findall(content)
-        if not code_blocks:
-            return content, []
-
         classes = []
-        for block, void1, lang, code, void2 in code_blocks:
+
+        def highlight_block(match):
+            lang, code = match.group(3), match.group(4)
             try:
-                lexer = get_lexer_by_name(lang)
-            except Exception:
-                self.logger(u"Unknown pygment lexer \"%s\", skipping"
-                            % lang, 'warning')
-                return content, classes
-            formatter = HtmlFormatter(linenos='inline', nobackground=True)
-            pretty_code = pygments.highlight(self.descape(code), lexer,
-                                             formatter)
-            content = content.replace(block, pretty_code, 1)
+                pretty_code = highlight(self.descape(code), lang,
+                                        linenos='inline', nobackground=True)
+            except ValueError:
+                logger.warning(u"%s: unknown pygments lexer \"%s\", skipping"
+                               % (source, lang))
+                return match.group(0)
+            classes[:] = [u'has_code']
+            return pretty_code
+
+        content = self.code_blocks_re.sub(highlight_block, content)
 
-        return content, [u'has_code']
+        return content, classes
 
 
 class EmbedImagesMacro(Macro):
     """This Macro extracts images url and embed them using the base64
     algorithm.
+
+    When the generator provides an image table, images are added to it and,
+    if the generator shares embedded images, referenced by id so that the
+    presentation contains each of them only once; otherwise, they are inlined
+    as data urls.
     """
+    triggers = ('<img',)
+    images = None
+    inline = True
+
+    def setup(self, generator):
+        self.images = generator.embedded_images
+        self.inline = not generator.share_embedded_images
+
+    def accepts(self, content):
+        return self.embed and Macro.accepts(self, content)
+
     def process(self, content, source=None):
         classes = []
 
@@ -94,6 +127,9 @@ class EmbedImagesMacro(Macro):
         if not images:
             return content, []
 
+        # mimetypes pulls in urllib and the network modules
+        import mimetypes
+
         for image_url in images:
             if not image_url or image_url.startswith('data:'):
                 continue
@@ -125,9 +161,13 @@ class EmbedImagesMacro(Macro):
                 continue
 
             try:
-                image_contents = open(image_real_path).read()
-                encoded_image = base64.b64encode(image_contents)
-            except IOError:
+                if self.images is None:
+                    image_contents = open(image_real_path, 'rb').read()
+                    encoded_url = get_data_url(image_contents, mime_type)
+                else:
+                    image_id = self.images.add(image_real_path, mime_type)
+                    encoded_url = self.images.data_urls[image_id]
+            except (IOError, OSError):
                 logger.warn(u"%s: unable to read image %s: skipping"
                             % (source, image_real_path))
                 continue
@@ -136,8 +176,12 @@ class EmbedImagesMacro(Macro):
                             % (source, image_real_path))
                 continue
 
-            encoded_url = u"data:%s;base64,%s" % (mime_type, encoded_image)
-            content = content.replace(image_url, encoded_url, 1)
+            if self.inline:
+                content = content.replace(image_url, encoded_url, 1)
+            else:
+                content = content.replace(u'src="%s"' % image_url,
+                                          u'src="data:," data-embedded-image='
+                                          u'"%s"' % image_id, 1)
             logger.info(u"Embedded image %s" % image_real_path)
 
         return content, classes
@@ -147,13 +191,23 @@ class FixImagePathsMacro(Macro):
     """This Macro replaces html image paths with fully qualified absolute
     urls.
     """
+    triggers = ('<img',)
+    url_prefix = None
+
+    def setup(self, generator):
+        self.url_prefix = generator.url_prefix
+
+    def accepts(self, content):
+        return not self.embed and Macro.accepts(self, content)
+
     def process(self, content, source=None):
         classes = []
 
         if self.embed:
             return content, classes
 
-        base_url = os.path.split(utils.get_abs_path_url(source))[0]
+        base_url = os.path.split(utils.get_path_url(source,
+                                                    self.url_prefix))[0]
         fn = lambda p: r'<img src="%s" />' % os.path.join(base_url, p.group(1))
 
         sub_regex = r'<img.*?src="(?!http://)(.*?)".*/?>'
@@ -167,6 +221,8 @@ class FxMacro(Macro):
     """This Macro processes fx directives, ie adds specific css classes
     named after what the parser found in them.
     """
+    triggers = ('.fx:',)
+
     def process(self, content, source=None):
         classes = []
 
@@ -181,6 +237,8 @@ class FxMacro(Macro):
 
 class NotesMacro(Macro):
     """This Macro processes Notes."""
+    triggers = ('.notes:',)
+
     def process(self, content, source=None):
         classes = []
 
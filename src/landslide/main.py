@@ -15,9 +15,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import os
 import sys
+import time
 from optparse import OptionParser
 from landslide.generator import get_generator
+from landslide.parser import parse_extension_configs
+from landslide.cache import DEFAULT_CACHE_DIR, clear_cache
 
 import logging
 logger = logging.getLogger("landslide")
@@ -31,9 +35,19 @@ def _parse_options():
         description="Generates an HTML5 or PDF "
                     "slideshow from Markdown or other formats",
         epilog="Note: PDF export requires the `prince` program: "
-               "http://princexml.com/"
+               "http://princexml.com/, or another --pdf-backend"
         )
 
+    parser.add_option(
+        "--batch",
+        action="store_true",
+        dest="batch",
+        help="Builds the presentations configured by each of the given cfg "
+             "files or glob patterns, in one process or -j worker "
+             "processes, and prints a summary",
+        default=False
+    )
+
     parser.add_option(
         "-b", "--debug",
         action="store_true",
@@ -42,6 +56,14 @@ def _parse_options():
         default=False
     )
 
+    parser.add_option(
+        "--clear-cache",
+        action="store_true",
+        dest="clear_cache",
+        help="Empties the build cache before generating the presentation",
+        default=False
+    )
+
     parser.add_option(
         "-d", "--destination",
         dest="destination_file",
@@ -59,6 +81,17 @@ def _parse_options():
         default="utf8"
     )
 
+    parser.add_option(
+        "--exclude",
+        action="append",
+        dest="exclude",
+        help="Skips the files and directories of source directories "
+             "matching this glob pattern, eg. drafts or '*.rest'; may be "
+             "repeated",
+        metavar="PATTERN",
+        default=[]
+    )
+
     parser.add_option(
         "-i", "--embed",
         action="store_true",
@@ -69,6 +102,179 @@ def _parse_options():
         default=False
     )
 
+    parser.add_option(
+        "--image-quality",
+        type="int",
+        dest="image_quality",
+        help="With --embed, encodes JPEG images again using this quality, "
+             "from 1 to 95 (requires PIL)",
+        metavar="QUALITY",
+        default=None
+    )
+
+    parser.add_option(
+        "--include",
+        action="append",
+        dest="include",
+        help="Only takes the files of source directories matching this "
+             "glob pattern, eg. 'chapter*/*.md'; may be repeated",
+        metavar="PATTERN",
+        default=[]
+    )
+
+    parser.add_option(
+        "-j", "--jobs",
+        type="int",
+        dest="jobs",
+        help="The number of source files, or with --batch of "
+             "presentations, to process in parallel (defaults to 1)",
+        metavar="N",
+        default=1
+    )
+
+    parser.add_option(
+        "-l", "--lazy",
+        action="store_true",
+        dest="lazy",
+        help="Only adds the contents of the current slide and its "
+             "neighbours to the page, which opens large presentations faster",
+        default=False
+    )
+
+    parser.add_option(
+        "--markdown-extensions",
+        dest="markdown_extensions",
+        help="Comma separated Markdown extensions to convert sources with, "
+             "eg. extra,toc",
+        metavar="EXTENSIONS",
+        default=""
+    )
+
+    parser.add_option(
+        "--markdown-extension-config",
+        action="append",
+        dest="markdown_extension_configs",
+        help="Sets an option of a Markdown extension, eg. "
+             "toc:permalink=true; may be repeated",
+        metavar="EXTENSION:OPTION=VALUE",
+        default=[]
+    )
+
+    parser.add_option(
+        "--max-image-size",
+        type="int",
+        dest="max_image_size",
+        help="With --embed, downscales images so that none of their sides "
+             "exceeds this number of pixels (requires PIL)",
+        metavar="PIXELS",
+        default=None
+    )
+
+    parser.add_option(
+        "--minify",
+        action="store_true",
+        dest="minify",
+        help="Strips comments and whitespace of the theme stylesheets and "
+             "scripts, and the styles of unused code highlighting tokens",
+        default=False
+    )
+
+    parser.add_option(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        help="Processes every source file again instead of reusing the "
+             "slides cached by previous builds (cached in %s)"
+             % DEFAULT_CACHE_DIR,
+        default=False
+    )
+
+    parser.add_option(
+        "--no-search",
+        action="store_false",
+        dest="search",
+        help="Leaves the index of the words of the slides, used by the "
+             "search box, out of the presentation",
+        default=True
+    )
+
+    parser.add_option(
+        "--pdf-backend",
+        dest="pdf_backend",
+        help="The program converting to PDF: prince, weasyprint, "
+             "wkhtmltopdf, or a command reading html on its standard input "
+             "and writing PDF to its standard output (defaults to prince)",
+        metavar="BACKEND",
+        default=None
+    )
+
+    parser.add_option(
+        "--pdf-chunk-size",
+        type="int",
+        dest="pdf_chunk_size",
+        help="Converts the slides to PDF N at a time, in -j parallel "
+             "processes, then merges the resulting files",
+        metavar="N",
+        default=None
+    )
+
+    parser.add_option(
+        "--pdf-merge-command",
+        dest="pdf_merge_command",
+        help="The command merging the PDF files of --pdf-chunk-size, where "
+             "{inputs} and {output} stand for their paths (defaults to "
+             "'pdfunite {inputs} {output}')",
+        metavar="COMMAND",
+        default=None
+    )
+
+    parser.add_option(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        help="Reports the time spent in each phase of the build, and the "
+             "slowest source files and slides",
+        default=False
+    )
+
+    parser.add_option(
+        "--profile-output",
+        dest="profile_output",
+        help="Writes build timings to a JSON file in the Trace Event "
+             "Format, which chrome://tracing can load",
+        metavar="FILE",
+        default=None
+    )
+
+    parser.add_option(
+        "--profile-top",
+        type="int",
+        dest="profile_top",
+        help="The number of slowest source files and slides --profile "
+             "reports (defaults to 10)",
+        metavar="N",
+        default=10
+    )
+
+    parser.add_option(
+        "--screen-only",
+        action="store_true",
+        dest="screen_only",
+        help="Leaves the print stylesheet out of the presentation",
+        default=False
+    )
+
+    parser.add_option(
+        "-s", "--serve",
+        action="store_true",
+        dest="serve",
+        help="Serves the presentation on http://localhost:PORT/ instead of "
+             "writing it, building it again and updating open browsers "
+             "each time a source file, image, configuration or theme file "
+             "changes",
+        default=False
+    )
+
     parser.add_option(
         "-t", "--theme",
         dest="theme",
@@ -85,6 +291,15 @@ def _parse_options():
         default=False
     )
 
+    parser.add_option(
+        "-p", "--port",
+        type="int",
+        dest="port",
+        help="The port --serve listens on (defaults to 8000)",
+        metavar="PORT",
+        default=8000
+    )
+
     parser.add_option(
         "-q", "--quiet",
         action="store_true",
@@ -102,16 +317,35 @@ def _parse_options():
         default=True
     )
 
+    parser.add_option(
+        "-w", "--watch",
+        action="store_true",
+        dest="watch",
+        help="Keeps running and generates the presentation again each time "
+             "a source file, image, configuration or theme file changes",
+        default=False
+    )
+
     (options, args) = parser.parse_args()
 
     if not args:
         parser.print_help()
         sys.exit(1)
 
-    return options, args[0]
+    options.markdown_extensions = [extension.strip() for extension
+                                   in options.markdown_extensions.split(',')
+                                   if extension.strip()]
+    try:
+        options.markdown_extension_configs = parse_extension_configs(
+            options.markdown_extension_configs)
+    except ValueError, e:
+        parser.error(e)
+
+    return options, args
 
 def main():
-    options, input_file = _parse_options()
+    options, args = _parse_options()
+    input_file = args[0]
     log_handler = logging.StreamHandler(sys.stderr if options.direct else sys.stdout)
     log_handler.setLevel(logging.WARNING)
     if options.verbose:
@@ -129,16 +363,148 @@ def main():
         output = options.destination_file
         format = options.destination_file.rsplit('.', 1)[1]
 
+    if options.clear_cache:
+        clear_cache(DEFAULT_CACHE_DIR)
+
+    if options.batch:
+        failures = _batch(options, args)
+        sys.exit(1 if failures else 0)
+
+    if options.serve:
+        from landslide.server import serve, FILES_PREFIX
+        serve(lambda: _get_generator(options, input_file, None, 'html',
+                                     url_prefix=FILES_PREFIX),
+              port=options.port)
+        return
+
+    generator = _get_generator(options, input_file, output, format)
+    generator.execute()
+    logger.info("Done.    Output written to %s",
+                output if not options.direct else "stdout")
+    _report_profile(options, generator)
+
+    if options.watch:
+        _watch(options, input_file, output, format, generator)
+
+def _get_generator(options, input_file, output, format, url_prefix=None):
     generator_class = get_generator(format)
-    generator = generator_class(input_file,
+    return generator_class(input_file,
                     destination_file=output,
                     theme=options.theme,
                     direct=options.direct,
                     embed=options.embed,
-                    encoding=options.encoding)
-    generator.execute()
-    logger.info("Done.    Output written to %s",
-                output if not options.direct else "stdout")
+                    encoding=options.encoding,
+                    cache_dir=None if options.no_cache else DEFAULT_CACHE_DIR,
+                    memory_cache=options.watch or options.serve,
+                    jobs=options.jobs,
+                    max_image_size=options.max_image_size,
+                    image_quality=options.image_quality,
+                    minify=options.minify,
+                    screen_only=options.screen_only,
+                    url_prefix=url_prefix,
+                    lazy=options.lazy,
+                    profiler=_get_profiler(options),
+                    markdown_extensions=options.markdown_extensions,
+                    markdown_extension_configs=(
+                        options.markdown_extension_configs),
+                    include=options.include,
+                    exclude=options.exclude,
+                    pdf_backend=options.pdf_backend,
+                    pdf_chunk_size=options.pdf_chunk_size,
+                    pdf_merge_command=options.pdf_merge_command,
+                    search=options.search)
+
+def _get_profiler(options):
+    if not options.profile and not options.profile_output:
+        return None
+    from landslide.profiler import Profiler
+    return Profiler()
+
+def _report_profile(options, generator):
+    """Logs and writes the timings of the last build, if profiled"""
+    profiler = generator.profiler
+    if profiler is None:
+        return
+    if options.profile:
+        for line in profiler.summary(options.profile_top).splitlines():
+            logger.info(u"Profile  %s", line)
+    if options.profile_output:
+        profiler.write(options.profile_output)
+        logger.info(u"Profile  written to %s", options.profile_output)
+    profiler.clear()
+
+def _batch(options, patterns):
+    """Builds many presentations in a single run, logging a summary of
+    each build. Returns the number of failed builds."""
+    from landslide.batch import find_decks, build_decks
+    theme = options.theme
+    if os.path.exists(theme):
+        # presentations are built from their own directory
+        theme = os.path.abspath(theme)
+    start = time.time()
+    failures = 0
+    paths = find_decks(patterns)
+    for result in build_decks(paths, jobs=options.jobs,
+                    theme=theme,
+                    embed=options.embed,
+                    encoding=options.encoding,
+                    cache_dir=None if options.no_cache else DEFAULT_CACHE_DIR,
+                    max_image_size=options.max_image_size,
+                    image_quality=options.image_quality,
+                    minify=options.minify,
+                    screen_only=options.screen_only,
+                    lazy=options.lazy,
+                    markdown_extensions=options.markdown_extensions,
+                    markdown_extension_configs=(
+                        options.markdown_extension_configs),
+                    include=options.include,
+                    exclude=options.exclude,
+                    pdf_backend=options.pdf_backend,
+                    pdf_chunk_size=options.pdf_chunk_size,
+                    pdf_merge_command=options.pdf_merge_command,
+                    search=options.search):
+        if result['error']:
+            failures += 1
+            logger.error(u"Failed   %s: %s", result['path'], result['error'])
+        else:
+            logger.info(u"Built    %s: %d slides written to %s in %.2fs",
+                        result['path'], result['slides'],
+                        result['destination'], result['time'])
+    logger.info(u"Done.    %d presentations built, %d failed, in %.2fs",
+                len(paths) - failures, failures, time.time() - start)
+    return failures
+
+def _watch(options, input_file, output, format, generator):
+    """Generates the presentation again on each change, reusing the slides
+    of unchanged sources kept in memory by the generator"""
+    from landslide.watcher import get_watcher
+    ignore = []
+    if isinstance(generator.destination_file, basestring):
+        ignore.append(generator.destination_file)
+    watcher = get_watcher(ignore=ignore)
+    logger.info("Watching %s for changes, press Ctrl-C to stop", input_file)
+    try:
+        while True:
+            watcher.watch(generator.get_watched_paths())
+            changed = watcher.wait()
+            for path in sorted(changed):
+                logger.info(u"Changed  %s", path)
+            start = time.time()
+            try:
+                if (generator.config_file and
+                    os.path.abspath(generator.config_file) in changed):
+                    generator = _get_generator(options, input_file, output,
+                                               format)
+                generator.execute()
+            except Exception, e:
+                logger.error(u"Build failed: %s", e)
+            else:
+                logger.info("Done.    Output written to %s in %.2fs",
+                            output if not options.direct else "stdout",
+                            time.time() - start)
+                _report_profile(options, generator)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import glob
+import stat
+import time
+import fnmatch
+
+from landslide.cache import FileCache, make_key
+from landslide.parser import EXTENSION_FORMATS
+
+from logging import getLogger
+logger = getLogger('landslide.manifest')
+
+# directories modified this recently may change again within the
+# resolution of their modification time, their listing is not cached
+RACY_DELAY = 2
+
+
+class SourceManifest(object):
+    """Resolves the source files of a presentation, in presentation order,
+    from the paths and glob patterns it is configured with. Directories are
+    walked recursively, skipping symbolic links leading back to one of the
+    directories being walked; the files found there are kept if they match
+    one of the ``include`` patterns, if any, and none of the ``exclude``
+    patterns, which also prune directories. Patterns holding a ``/`` are
+    matched against paths relative to the walked directory, others against
+    file and directory names; files given explicitly are always kept.
+
+    Directory listings are stored in ``cache`` along with the modification
+    time of their directory, so that a later scan only needs to stat the
+    directories of an unchanged tree.
+    """
+    def __init__(self, sources, include=None, exclude=None, cache=None):
+        if isinstance(sources, basestring):
+            sources = [sources]
+        self.sources = [source for source in sources if source]
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.cache = cache or FileCache()
+        self.key = make_key('manifest', [os.path.abspath(source)
+                                         for source in self.sources])
+        self.listings = None
+        self.stats = {'listed': 0, 'cached': 0}
+
+    def resolve(self):
+        """Returns the ``(path, format)`` of the source files. Raises
+        ``IOError`` if one of the paths given does not exist."""
+        if self.listings is None:
+            entry = self.cache.get(self.key)
+            self.listings = entry['listings'] if entry else {}
+        self.used_listings = {}
+        # directories being walked, from the source directory down
+        self.walking = set()
+        self.stats = {'listed': 0, 'cached': 0}
+        files = []
+        for source in self.sources:
+            if glob.has_magic(source):
+                paths = sorted(glob.glob(source))
+                if not paths:
+                    logger.warn(u"No source matches %s", source)
+            else:
+                paths = [source]
+            for path in paths:
+                files.extend(self.walk(path))
+        if self.used_listings != self.listings:
+            self.listings = self.used_listings
+            self.cache.set(self.key, {'listings': self.listings})
+        del self.used_listings, self.walking
+        return files
+
+    def walk(self, source):
+        try:
+            source_stat = os.stat(source)
+        except OSError:
+            raise IOError(u"Source file/directory %s does not exist"
+                          % source)
+        if stat.S_ISDIR(source_stat.st_mode):
+            files = []
+            self._walk_dir(source, '', source_stat, files)
+            return files
+        format = get_format(source)
+        if format is None:
+            return []
+        logger.info(u"Adding   %s (%s)", source, format)
+        return [(source, format)]
+
+    def _walk_dir(self, path, rel_path, dir_stat, files):
+        identity = get_identity(path, dir_stat)
+        if identity in self.walking:
+            logger.warn(u"Skipping %s: symbolic link to a parent directory",
+                        path)
+            return
+        self.walking.add(identity)
+        try:
+            self._walk_entries(path, rel_path, dir_stat, files)
+        finally:
+            self.walking.discard(identity)
+
+    def _walk_entries(self, path, rel_path, dir_stat, files):
+        logger.info(u"Entering %s", path)
+        found = len(files)
+        for name, is_dir in self.list_dir(path, dir_stat):
+            entry_path = os.path.join(path, name)
+            entry_rel_path = rel_path + name
+            if self.is_excluded(entry_rel_path, name):
+                continue
+            if is_dir:
+                try:
+                    entry_stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                self._walk_dir(entry_path, entry_rel_path + '/', entry_stat,
+                               files)
+            elif self.is_included(entry_rel_path, name):
+                format = get_format(name)
+                logger.info(u"Adding   %s (%s)", entry_path, format)
+                files.append((entry_path, format))
+        if len(files) == found:
+            logger.warn(u"Exiting  %s: no contents found", path)
+
+    def list_dir(self, path, dir_stat):
+        """Returns the sorted ``(name, is_dir)`` of the entries of a
+        directory which are either directories or supported source files,
+        using the cached listing while the directory is unchanged"""
+        mtime = dir_stat.st_mtime
+        listing = self.listings.get(path)
+        if listing is not None and listing[0] == mtime:
+            self.stats['cached'] += 1
+            self.used_listings[path] = listing
+            return listing[1]
+        self.stats['listed'] += 1
+        entries = []
+        try:
+            names = os.listdir(path)
+        except OSError, e:
+            logger.warn(u"Skipping %s: %s", path, e)
+            return entries
+        names.sort()
+        for name in names:
+            try:
+                is_dir = stat.S_ISDIR(os.stat(os.path.join(path, name))
+                                      .st_mode)
+            except OSError:
+                continue
+            if is_dir or get_format(name):
+                entries.append((name, is_dir))
+        if time.time() - mtime > RACY_DELAY:
+            self.used_listings[path] = (mtime, entries)
+        return entries
+
+    def is_excluded(self, rel_path, name):
+        return match_any(self.exclude, rel_path, name)
+
+    def is_included(self, rel_path, name):
+        return not self.include or match_any(self.include, rel_path, name)
+
+    def get_watched_paths(self):
+        """Returns the paths to watch for sources to be added or removed:
+        the paths given, and the base directory of the patterns"""
+        paths = set()
+        for source in self.sources:
+            while glob.has_magic(source):
+                source = os.path.dirname(source)
+            paths.add(source or os.curdir)
+        return paths
+
+
+def get_format(path):
+    """Returns the format of a source file from its extension, None if it is
+    not supported"""
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1])
+
+
+def get_identity(path, path_stat):
+    """Identifies a directory regardless of the links leading to it"""
+    if path_stat.st_ino:
+        return (path_stat.st_dev, path_stat.st_ino)
+    # no inode numbers, eg. on Windows
+    return os.path.realpath(path)
+
+
+def match_any(patterns, rel_path, name):
+    for pattern in patterns:
+        if '/' in pattern:
+            if fnmatch.fnmatch(rel_path, pattern):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
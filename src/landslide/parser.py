@@ -14,13 +14,170 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import re
+import json
+import threading
 
 SUPPORTED_FORMATS = {
     'markdown':         ['.mdown', '.markdown', '.markdn', '.md'],
     'restructuredtext': ['.rst', '.rest'],
 }
 
+# format of each supported file extension
+EXTENSION_FORMATS = dict([(extension, supp_format)
+                          for supp_format, supp_extensions
+                          in SUPPORTED_FORMATS.items()
+                          for extension in supp_extensions])
+
+DIGITS = u'0123456789'
+
+# libraries the html code of each format depends on, code being highlighted
+# using pygments whatever the format
+FORMAT_LIBRARIES = {
+    'markdown':         ('markdown', 'pygments'),
+    'restructuredtext': ('docutils', 'pygments'),
+}
+
+# Markdown converters of each thread, by configuration
+_local = threading.local()
+# versions of the libraries, by format
+_versions = {}
+
+
+def split_slides(html):
+    """Splits the html code of a source file at its ``<hr>`` tags, in a
+    single pass"""
+    slides = []
+    start = position = 0
+    while True:
+        position = html.find(u'<hr', position)
+        if position == -1:
+            break
+        position += 3
+        if html[position:position + 1] not in (u' ', u'\t', u'\r', u'\n',
+                                                u'/', u'>'):
+            # another tag starting with hr
+            continue
+        end = html.find(u'>', position)
+        if end == -1:
+            break
+        slides.append(html[start:position - 3])
+        start = position = end + 1
+    slides.append(html[start:])
+    return slides
+
+
+def split_header(html):
+    """Finds the first heading of the html code of a slide, in a single
+    pass. Returns its html code, level and title, along with the html code
+    following it, or None if there is no heading."""
+    position = 0
+    while True:
+        position = html.find(u'<h', position)
+        if position == -1:
+            return None
+        if _is_digit(html, position + 2):
+            break
+        position += 2
+    level = int(html[position + 2])
+    title_start = html.find(u'>', position + 3) + 1
+    if not title_start:
+        return None
+    # a title is never empty
+    close = title_start + 1
+    while True:
+        close = html.find(u'</h', close)
+        if close == -1:
+            return None
+        if _is_digit(html, close + 3) and html[close + 4:close + 5] == u'>':
+            break
+        close += 3
+    end = close + 5
+    rest = html[end:]
+    if rest[:1].isspace():
+        rest = rest[1:]
+    return (html[position:end], level, html[title_start:close],
+            rest.strip() if rest else None)
+
+
+def split_html_slides(html):
+    """Splits the html code of a source file into the ``(header, level,
+    title, content)`` of its slides"""
+    slides = []
+    for slide_html in split_slides(html):
+        slides.append(split_header(slide_html)
+                      or (None, None, None, slide_html.strip()))
+    return slides
+
+
+def _is_digit(html, index):
+    return index < len(html) and html[index] in DIGITS
+
+
+def get_markdown(extensions=(), extension_configs=None):
+    """Returns the Markdown converter of the current thread using some
+    extensions, creating it on first use. Converters must be reset before
+    converting another document."""
+    extensions = list(extensions or ())
+    extension_configs = extension_configs or {}
+    key = repr((extensions, sorted((name, sorted(config.items()))
+                                   for name, config
+                                   in extension_configs.items())))
+    converters = getattr(_local, 'markdown', None)
+    if converters is None:
+        converters = _local.markdown = {}
+    converter = converters.get(key)
+    if converter is None:
+        try:
+            import markdown
+        except ImportError:
+            raise RuntimeError(u"Looks like markdown is not installed")
+        try:
+            converter = markdown.Markdown(extensions=extensions,
+                                          extension_configs=extension_configs)
+        except (ImportError, AttributeError, TypeError), e:
+            raise RuntimeError(u"Unable to load Markdown extensions: %s" % e)
+        converters[key] = converter
+    return converter
+
+
+def get_library_versions(format):
+    """Returns the ``(name, version)`` of the libraries the html code of a
+    source format depends on, the version being None for those not
+    installed. Libraries are imported on first call."""
+    versions = _versions.get(format)
+    if versions is None:
+        versions = []
+        for name in FORMAT_LIBRARIES.get(format, ()):
+            try:
+                module = __import__(name)
+            except ImportError:
+                version = None
+            else:
+                version = getattr(module, '__version__',
+                                  getattr(module, 'version', None))
+            versions.append((name, version))
+        versions = _versions[format] = tuple(versions)
+    return versions
+
+
+def parse_extension_configs(items):
+    """Parses ``extension:option=value`` settings into the configurations
+    of Markdown extensions. Values are decoded as JSON if possible, eg.
+    ``toc:permalink=true``, and kept as strings otherwise."""
+    configs = {}
+    for item in items:
+        name, _, setting = item.partition(':')
+        option, equal, value = setting.partition('=')
+        if not name.strip() or not option.strip() or not equal:
+            raise ValueError(u"Invalid Markdown extension setting %s, "
+                             "expected extension:option=value" % item)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.strip()
+        configs.setdefault(name.strip(), {})[option.strip()] = value
+    return configs
+
 
 class Parser(object):
     """This class generates the HTML code depending on which syntax is used in
@@ -28,44 +185,48 @@ class Parser(object):
 
     The Parser currently supports both Markdown and restructuredText syntaxes.
     """
-    def __init__(self, extension, encoding='utf8'):
-        """Configures this parser"""
+    def __init__(self, extension, encoding='utf8', markdown_extensions=None,
+                 markdown_extension_configs=None):
+        """Configures this parser. Markdown is converted using
+        ``markdown_extensions``, configured by ``markdown_extension_configs``
+        """
         self.encoding = encoding
-        self.format = None
-        for supp_format, supp_extensions in SUPPORTED_FORMATS.items():
-            for supp_extension in supp_extensions:
-                if supp_extension == extension:
-                    self.format = supp_format
+        self.markdown_extensions = markdown_extensions or []
+        self.markdown_extension_configs = markdown_extension_configs or {}
+        self.format = EXTENSION_FORMATS.get(extension)
         if not self.format:
             raise NotImplementedError(u"Unsupported format %s" % extension)
 
+    def get_versions(self):
+        """Returns the versions of the libraries converting the current
+        format (see ``get_library_versions()``)"""
+        return get_library_versions(self.format)
+
     def parse(self, text):
         """Parses and renders a text as HTML regarding current format."""
         if self.format == 'markdown':
-            try:
-                import markdown
-            except ImportError:
-                raise RuntimeError(u"Looks like markdown is not installed")
-
-            return markdown.markdown(text)
+            converter = get_markdown(self.markdown_extensions,
+                                     self.markdown_extension_configs)
+            converter.reset()
+            return converter.convert(text)
         elif self.format == 'restructuredtext':
-            try:
-                from landslide.rst import html_body
-            except ImportError:
-                raise RuntimeError(u"Looks like docutils are not installed")
-            html = html_body(text, input_encoding=self.encoding)
-            html = re.sub(r'<div.*?>', r'', html, re.UNICODE)
-            html = re.sub(r'</div>', r'', html, re.UNICODE)
-            html = re.sub(r'<p class="system-message-\w+">.*?</p>', r'', html,
-                          re.UNICODE)
-            html = re.sub(r'Document or section may not begin with a transition\.',
-                          r'', html, re.UNICODE)
-            html = re.sub(r'<h(\d+?).*?>', r'<h\1>', html,
-                          re.DOTALL | re.UNICODE)
-            html = re.sub(r'<hr.*?>\n', r'<hr />\n', html,
-                          re.DOTALL | re.UNICODE)
-
-            return html.strip()
+            slides = []
+            for header, level, title, content in self.parse_slides(text):
+                slides.append(u'\n'.join(html for html in (header, content)
+                                          if html))
+            return u'\n<hr />\n'.join(slides)
         else:
             raise NotImplementedError(u"Unsupported format %s, cannot parse"
                                       % self.format)
+
+    def parse_slides(self, text):
+        """Parses a text into the ``(header, level, title, content)`` of its
+        slides. ``header`` is the html code of the first heading of a slide,
+        and ``content`` that following it."""
+        if self.format == 'restructuredtext':
+            try:
+                from landslide.rst import html_slides
+            except ImportError:
+                raise RuntimeError(u"Looks like docutils are not installed")
+            return html_slides(text, input_encoding=self.encoding)
+        return split_html_slides(self.parse(text))
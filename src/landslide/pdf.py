@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import errno
+import shlex
+import shutil
+import tempfile
+import subprocess
+
+from logging import getLogger
+logger = getLogger('landslide.pdf')
+
+# commands reading html on their standard input and writing PDF to their
+# standard output, by backend name
+BACKENDS = {
+    'prince': 'prince - -o -',
+    'weasyprint': 'weasyprint - -',
+    'wkhtmltopdf': 'wkhtmltopdf --quiet --enable-local-file-access - -',
+}
+DEFAULT_BACKEND = 'prince'
+# merges the PDF files of chunks converted separately
+DEFAULT_MERGE_COMMAND = 'pdfunite {inputs} {output}'
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class PDFBackend(object):
+    """Converts html to PDF by running a command, either one of the
+    ``BACKENDS`` or a command line template. The html code is written to
+    the standard input of the command as it is rendered, and the PDF it
+    writes to its standard output goes straight to the destination.
+    """
+    def __init__(self, backend=DEFAULT_BACKEND):
+        self.name = backend
+        command = BACKENDS.get(backend, backend)
+        self.args = shlex.split(command)
+        if not self.args:
+            raise ValueError(u"Empty PDF backend command")
+        if backend not in BACKENDS:
+            self.name = os.path.basename(self.args[0])
+
+    def check(self):
+        """Raises ``EnvironmentError`` if the command cannot be found, so
+        that it is reported before any output is written"""
+        command = self.args[0]
+        if os.path.dirname(command):
+            directories = ['']
+        else:
+            directories = os.environ.get('PATH', os.defpath).split(os.pathsep)
+        extensions = ['']
+        if os.name == 'nt':
+            extensions += os.environ.get('PATHEXT', '').split(os.pathsep)
+        for directory in directories:
+            for extension in extensions:
+                path = os.path.join(directory, command + extension)
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    return
+        raise EnvironmentError(u"Unable to generate PDF file using %s (%s "
+                               u"not found). Is it installed and available?"
+                               % (self.name, command))
+
+    def start(self, output):
+        """Starts a conversion writing PDF to ``output``, a file object
+        backed by a file descriptor. Returns the conversion, whose html is
+        written by ``feed()`` and which is completed by ``finish()``."""
+        errors = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(self.args, stdin=subprocess.PIPE,
+                                       stdout=output, stderr=errors)
+        except OSError, e:
+            errors.close()
+            raise EnvironmentError(u"Unable to generate PDF file using %s "
+                                   u"(%s). Is it installed and available?"
+                                   % (self.name, e))
+        return (process, errors)
+
+    def feed(self, conversion, html):
+        """Writes html code, a string or an iterable of strings, to a
+        conversion, then closes its input. Returns False if the command
+        stopped reading it."""
+        process, errors = conversion
+        if isinstance(html, basestring):
+            html = [html]
+        try:
+            for chunk in html:
+                process.stdin.write(chunk.encode('utf-8'))
+            process.stdin.close()
+        except IOError, e:
+            if e.errno != errno.EPIPE:
+                raise
+            return False
+        return True
+
+    def finish(self, conversion):
+        """Waits for a conversion to complete, raising ``EnvironmentError``
+        if it failed"""
+        process, errors = conversion
+        try:
+            if not process.stdin.closed:
+                try:
+                    process.stdin.close()
+                except IOError:
+                    pass
+            returncode = process.wait()
+            if returncode:
+                errors.seek(0)
+                raise EnvironmentError(u"Unable to generate PDF file using "
+                                       u"%s, which exited with status %d: %s"
+                                       % (self.name, returncode,
+                                          errors.read().strip()))
+        finally:
+            errors.close()
+
+    def convert(self, html, output):
+        """Converts html code, a string or an iterable of strings, to PDF
+        written to ``output``"""
+        conversion = self.start(output)
+        try:
+            self.feed(conversion, html)
+        finally:
+            self.finish(conversion)
+
+
+def convert(backend, html, output):
+    """Converts html code to PDF written to ``output``, which may be any
+    file-like object"""
+    if has_fileno(output):
+        output.flush()
+        backend.convert(html, output)
+        return
+    pdf = tempfile.TemporaryFile()
+    try:
+        backend.convert(html, pdf)
+        pdf.seek(0)
+        shutil.copyfileobj(pdf, output, COPY_BUFFER_SIZE)
+    finally:
+        pdf.close()
+
+
+def convert_chunks(backend, chunks, output, jobs=1,
+                   merge_command=DEFAULT_MERGE_COMMAND):
+    """Converts each html document of ``chunks`` to PDF, up to ``jobs``
+    at once, then merges the resulting files into ``output`` using
+    ``merge_command``, a command line template in which ``{inputs}`` and
+    ``{output}`` are replaced by the paths of the files. Documents are
+    rendered one at a time as their conversion starts, while previously
+    started conversions run."""
+    directory = tempfile.mkdtemp(prefix='landslide-pdf-')
+    try:
+        paths = []
+        running = []
+        try:
+            for html in chunks:
+                if len(running) >= max(jobs, 1):
+                    backend.finish(running.pop(0))
+                path = os.path.join(directory, '%06d.pdf' % len(paths))
+                paths.append(path)
+                with open(path, 'wb') as fh:
+                    conversion = backend.start(fh)
+                running.append(conversion)
+                if not backend.feed(conversion, html):
+                    # the command failed, its error is reported now
+                    backend.finish(running.pop())
+        finally:
+            while running:
+                backend.finish(running.pop(0))
+        logger.debug(u"Merging  %d PDF files", len(paths))
+        merged = os.path.join(directory, 'merged.pdf')
+        merge(paths, merged, merge_command)
+        output.flush()
+        with open(merged, 'rb') as fh:
+            shutil.copyfileobj(fh, output, COPY_BUFFER_SIZE)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def merge(paths, output_path, merge_command=DEFAULT_MERGE_COMMAND):
+    """Merges PDF files into ``output_path`` using a command line
+    template"""
+    if len(paths) == 1:
+        shutil.copyfile(paths[0], output_path)
+        return
+    args = []
+    for arg in shlex.split(merge_command):
+        if arg == '{inputs}':
+            args.extend(paths)
+        else:
+            args.append(arg.replace('{output}', output_path))
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+    except OSError, e:
+        raise EnvironmentError(u"Unable to merge PDF files using %s (%s). "
+                               u"Is it installed and available?"
+                               % (args[0], e))
+    messages = process.communicate()[0]
+    if process.returncode:
+        raise EnvironmentError(u"Unable to merge PDF files using %s, which "
+                               u"exited with status %d: %s"
+                               % (args[0], process.returncode,
+                                  messages.strip()))
+
+
+def has_fileno(fh):
+    try:
+        fh.fileno()
+    except (AttributeError, IOError, ValueError):
+        return False
+    return True
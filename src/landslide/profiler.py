@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import sys
+import json
+import time
+import thread
+
+
+def get_memory():
+    """Returns the resident memory of the current process in bytes: the
+    current one if it can be read from /proc, or else the peak one"""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS X
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class Profiler(object):
+    """Collects the timings of the phases of builds, as events.
+
+    Each event is a dict holding the ``name`` and ``category`` of the phase
+    (``build`` or ``macro``), its ``start`` time and ``duration`` in
+    seconds, its ``self`` time (the duration of the events it contains
+    excluded), the ``pid`` and ``tid`` it ran in, and ``args`` such as the
+    source file or slide it applies to. If ``memory`` is set, events also
+    hold the growth of the resident memory of the process during the phase
+    in bytes, as ``memory``, and excluding that of the events it contains,
+    as ``self_memory``. Callbacks are called with each event once it is
+    complete, including those sent by worker processes.
+    """
+    def __init__(self, callback=None, memory=False):
+        self.events = []
+        self.callbacks = []
+        self.stack = []
+        self.memory = memory
+        if callback:
+            self.add_callback(callback)
+
+    def add_callback(self, callback):
+        """Registers a function to be called with each event"""
+        self.callbacks.append(callback)
+
+    def span(self, name, category='build', **args):
+        """Returns a context manager timing a phase. Its ``args`` are
+        returned on entering, so that they can be completed."""
+        return _Span(self, name, category, args)
+
+    def add(self, event):
+        """Adds a complete event"""
+        self.events.append(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    def merge(self, events):
+        """Adds events collected by another profiler, eg. in a worker
+        process"""
+        for event in events:
+            self.add(event)
+
+    def clear(self):
+        self.events = []
+
+    def get_totals(self):
+        """Returns the number of calls, total and self time of each phase,
+        and its self memory if measured"""
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event['name'], {
+                'category': event['category'], 'calls': 0, 'time': 0.0,
+                'self': 0.0})
+            total['calls'] += 1
+            total['time'] += event['duration']
+            total['self'] += event['self']
+            if 'self_memory' in event:
+                total['memory'] = (total.get('memory', 0)
+                                   + event['self_memory'])
+        return totals
+
+    def get_slowest(self, name, key, top=10):
+        """Returns the ``top`` values of the ``key`` arg of the events named
+        ``name`` they spent the most time in, along with this time"""
+        times = {}
+        for event in self.events:
+            if event['name'] == name and key in event['args']:
+                value = event['args'][key]
+                times[value] = times.get(value, 0.0) + event['duration']
+        slowest = sorted(times.items(), key=lambda item: -item[1])
+        return slowest[:top]
+
+    def get_slowest_slides(self, top=10):
+        """Returns the ``(duration, args)`` of the ``top`` slowest slides"""
+        slides = [(event['duration'], event['args'])
+                  for event in self.events if event['name'] == 'slide']
+        slides.sort(key=lambda slide: -slide[0])
+        return slides[:top]
+
+    def summary(self, top=10):
+        """Returns a human readable report of the time spent in each phase,
+        and in the ``top`` slowest source files and slides"""
+        totals = self.get_totals()
+        lines = [u"%-30s %7s %11s %11s" % (u"Phase", u"calls", u"self (ms)",
+                                           u"total (ms)")]
+        if self.memory:
+            lines[0] += u" %11s" % u"self (kB)"
+        for name, total in sorted(totals.items(),
+                                  key=lambda item: -item[1]['self']):
+            if total['category'] != 'build':
+                name = u"%s:%s" % (total['category'], name)
+            line = (u"%-30s %7d %11.1f %11.1f"
+                    % (name, total['calls'], total['self'] * 1000,
+                       total['time'] * 1000))
+            if self.memory:
+                line += u" %11d" % (total.get('memory', 0) // 1024)
+            lines.append(line)
+        sources = self.get_slowest('source', 'source', top)
+        if sources:
+            lines.append(u"Slowest source files (ms):")
+            for source, duration in sources:
+                lines.append(u"%10.1f  %s" % (duration * 1000, source))
+        slides = self.get_slowest_slides(top)
+        if slides:
+            lines.append(u"Slowest slides (ms):")
+            for duration, args in slides:
+                lines.append(u"%10.1f  %s #%d %s"
+                             % (duration * 1000, args.get('source'),
+                                args.get('index', 0) + 1,
+                                args.get('title') or u''))
+        return u'\n'.join(lines)
+
+    def to_chrome_trace(self):
+        """Returns the events in the Trace Event Format, which
+        chrome://tracing and other trace viewers load, along with the phase
+        totals"""
+        origin = min([event['start'] for event in self.events] or [0])
+        trace_events = []
+        for event in self.events:
+            args = event['args']
+            if 'memory' in event:
+                args = dict(args, memory=event['memory'],
+                            self_memory=event['self_memory'])
+            trace_events.append({'name': event['name'],
+                                 'cat': event['category'], 'ph': 'X',
+                                 'ts': (event['start'] - origin) * 1e6,
+                                 'dur': event['duration'] * 1e6,
+                                 'pid': event['pid'], 'tid': event['tid'],
+                                 'args': args})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms',
+                'otherData': {'start': origin, 'totals': self.get_totals()}}
+
+    def write(self, path):
+        """Writes the events to a JSON file, in the Trace Event Format"""
+        with open(path, 'w') as fh:
+            json.dump(self.to_chrome_trace(), fh)
+
+
+class _Span(object):
+    __slots__ = ('profiler', 'name', 'category', 'args', 'start', 'children',
+                 'memory', 'children_memory')
+
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.children = 0.0
+        self.children_memory = 0
+
+    def __enter__(self):
+        self.profiler.stack.append(self)
+        if self.profiler.memory:
+            self.memory = get_memory()
+        self.start = time.time()
+        return self.args
+
+    def __exit__(self, *exc_info):
+        duration = time.time() - self.start
+        stack = self.profiler.stack
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        event = {'name': self.name, 'category': self.category,
+                 'start': self.start, 'duration': duration,
+                 'self': max(0.0, duration - self.children),
+                 'pid': os.getpid(), 'tid': thread.get_ident(),
+                 'args': self.args}
+        if self.profiler.memory:
+            memory = get_memory() - self.memory
+            if stack:
+                stack[-1].children_memory += memory
+            event['memory'] = memory
+            event['self_memory'] = memory - self.children_memory
+        self.profiler.add(event)
+
+
+class _NullSpan(object):
+    """Stands for a span when profiling is disabled"""
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        pass
+
+null_span = _NullSpan()
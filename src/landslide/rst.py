@@ -14,15 +14,16 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from docutils import core, nodes
-from docutils.parsers.rst import directives, Directive
+import threading
 
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name, TextLexer
+from docutils import core, io, nodes, writers
+from docutils.parsers.rst import directives, Directive
+from docutils.writers import html4css1
 
+from landslide.highlight import highlight
 
-DEFAULT = HtmlFormatter(noclasses=False)
+# html formatter options, by directive flag
+DEFAULT = {'noclasses': False}
 VARIANTS = {}
 
 
@@ -36,14 +37,11 @@ class Pygments(Directive):
 
     def run(self):
         self.assert_has_content()
-        try:
-            lexer = get_lexer_by_name(self.arguments[0])
-        except ValueError:
-            # no lexer found - use the text one instead of an exception
-            lexer = TextLexer()
         # take an arbitrary option if more than one is given
-        formatter = self.options and VARIANTS[self.options.keys()[0]] or DEFAULT
-        parsed = highlight(u'\n'.join(self.content), lexer, formatter)
+        options = self.options and VARIANTS[self.options.keys()[0]] or DEFAULT
+        # no lexer found - use the text one instead of an exception
+        parsed = highlight(u'\n'.join(self.content), self.arguments[0],
+                           fallback=True, **options)
         return [nodes.raw('', parsed, format='html')]
 
 
@@ -51,6 +49,178 @@ directives.register_directive('sourcecode', Pygments)
 directives.register_directive('code-block', Pygments)
 
 
+class SlidesTranslator(html4css1.HTMLTranslator):
+    """Translates a document into landslide slides rather than into a
+    single html body: each transition starts a new slide, sections are not
+    wrapped in divs, and the first heading of each slide is kept apart
+    along with its level and title. System messages are left out, docutils
+    reporting them already.
+    """
+    def __init__(self, document):
+        html4css1.HTMLTranslator.__init__(self, document)
+        self.slides = []
+        self.heading = None
+
+    def end_slide(self):
+        """Adds the html code translated since the previous slide as a
+        ``(header, level, title, content)`` slide"""
+        if self.heading is None or 'end' not in self.heading:
+            header = level = title = None
+            content = u''.join(self.body).strip()
+        else:
+            heading = self.heading
+            header = u''.join(self.body[heading['start']:heading['end']])
+            level = heading['level']
+            title = u''.join(self.body[heading['start'] + 1:
+                                       heading['end'] - 1])
+            content = u''.join(self.body[heading['end']:]).strip() or None
+        self.slides.append((header, level, title, content))
+        self.body = []
+        self.heading = None
+
+    def visit_heading(self, node, level):
+        if self.heading is None:
+            self.heading = {'start': len(self.body), 'level': level}
+        self.body.append(u'<h%d>' % level)
+        if node.hasattr('refid'):
+            self.body.append(u'<a class="toc-backref" href="#%s">'
+                             % node['refid'])
+            self.context.append((level, u'</a>'))
+        else:
+            self.context.append((level, u''))
+
+    def depart_heading(self, node):
+        level, close_link = self.context.pop()
+        self.body.append(close_link)
+        self.body.append(u'</h%d>' % level)
+        if 'end' not in self.heading:
+            self.heading['end'] = len(self.body)
+        self.body.append(u'\n')
+
+    def visit_title(self, node):
+        if isinstance(node.parent, nodes.document):
+            self.visit_heading(node, 1)
+        elif isinstance(node.parent, nodes.section):
+            self.visit_heading(node, self.section_level
+                                     + self.initial_header_level - 1)
+        else:
+            html4css1.HTMLTranslator.visit_title(self, node)
+
+    def depart_title(self, node):
+        if isinstance(node.parent, (nodes.document, nodes.section)):
+            self.depart_heading(node)
+        else:
+            html4css1.HTMLTranslator.depart_title(self, node)
+
+    def visit_subtitle(self, node):
+        if isinstance(node.parent, nodes.document):
+            self.visit_heading(node, 2)
+        else:
+            html4css1.HTMLTranslator.visit_subtitle(self, node)
+
+    def depart_subtitle(self, node):
+        if isinstance(node.parent, nodes.document):
+            self.depart_heading(node)
+        else:
+            html4css1.HTMLTranslator.depart_subtitle(self, node)
+
+    def depart_docinfo(self, node):
+        # kept in place instead of moved ahead of the body
+        self.body.append('</tbody>\n</table>\n')
+        self.in_docinfo = False
+        self.context.pop()
+
+    def visit_section(self, node):
+        if 'system-messages' in node['classes']:
+            raise nodes.SkipNode
+        self.section_level += 1
+
+    def depart_section(self, node):
+        self.section_level -= 1
+
+    def visit_transition(self, node):
+        self.end_slide()
+        raise nodes.SkipNode
+
+    def visit_system_message(self, node):
+        raise nodes.SkipNode
+
+    def depart_document(self, node):
+        html4css1.HTMLTranslator.depart_document(self, node)
+        self.end_slide()
+
+
+class SlidesWriter(html4css1.Writer):
+    """Writes a document as the list of ``(header, level, title, content)``
+    of its slides, in the ``slides`` part, instead of as html"""
+    def __init__(self):
+        html4css1.Writer.__init__(self)
+        self.translator_class = SlidesTranslator
+        self.slides = []
+
+    def translate(self):
+        visitor = self.translator_class(self.document)
+        self.document.walkabout(visitor)
+        self.slides = visitor.slides
+        self.output = u''
+
+    def assemble_parts(self):
+        writers.Writer.assemble_parts(self)
+        self.parts['slides'] = self.slides
+
+
+# publishers of each thread, by writer and settings
+_local = threading.local()
+
+
+def get_publisher(input_encoding='unicode', doctitle=1,
+                  initial_header_level=1, writer='html'):
+    """Returns the publisher of the current thread converting reST using
+    a ``writer``, ``html`` or ``slides``, and some settings, creating it on
+    first use. Its settings are computed and its reader, parser and writer
+    instantiated once, then reused for every document.
+    """
+    key = (input_encoding, doctitle, initial_header_level, writer)
+    publishers = getattr(_local, 'publishers', None)
+    if publishers is None:
+        publishers = _local.publishers = {}
+    publisher = publishers.get(key)
+    if publisher is None:
+        overrides = {'input_encoding': input_encoding,
+                     'doctitle_xform': doctitle,
+                     'initial_header_level': initial_header_level}
+        if writer == 'slides':
+            publisher = core.Publisher(writer=SlidesWriter(),
+                                       source_class=io.StringInput,
+                                       destination_class=io.StringOutput)
+            # slides have no use for the stylesheet
+            overrides['embed_stylesheet'] = False
+        else:
+            publisher = core.Publisher(source_class=io.StringInput,
+                                       destination_class=io.StringOutput)
+        publisher.set_components('standalone', 'restructuredtext', 'html')
+        publisher.process_programmatic_settings(None, overrides, None)
+        publishers[key] = publisher
+    return publisher
+
+
+def publish(publisher, input_string, source_path=None,
+            destination_path=None):
+    """Converts a document using a publisher, and returns the parts of its
+    writer output"""
+    # paths otherwise default to those of the previous document
+    publisher.settings._source = source_path
+    publisher.settings._destination = destination_path
+    publisher.set_source(input_string, source_path)
+    publisher.set_destination(None, destination_path)
+    try:
+        publisher.publish()
+        return dict(publisher.writer.parts)
+    finally:
+        # the document tree is not needed anymore
+        publisher.document = publisher.writer.document = None
+
+
 def html_parts(input_string, source_path=None, destination_path=None,
                input_encoding='unicode', doctitle=1, initial_header_level=1):
     """
@@ -76,14 +246,8 @@ def html_parts(input_string, source_path=None, destination_path=None,
     - `initial_header_level`: The initial level for header elements (e.g. 1
       for "<h1>").
     """
-    overrides = {'input_encoding': input_encoding,
-                 'doctitle_xform': doctitle,
-                 'initial_header_level': initial_header_level}
-    parts = core.publish_parts(
-        source=input_string, source_path=source_path,
-        destination_path=destination_path,
-        writer_name='html', settings_overrides=overrides)
-    return parts
+    publisher = get_publisher(input_encoding, doctitle, initial_header_level)
+    return publish(publisher, input_string, source_path, destination_path)
 
 
 def html_body(input_string, source_path=None, destination_path=None,
@@ -105,3 +269,18 @@ def html_body(input_string, source_path=None, destination_path=None,
         initial_header_level=initial_header_level)
     fragment = parts['html_body']
     return fragment
+
+
+def html_slides(input_string, source_path=None, input_encoding='unicode',
+                doctitle=1, initial_header_level=1):
+    """
+    Given an input string, returns the ``(header, level, title, content)``
+    of its slides, separated by transitions. ``header`` is the html code of
+    the first heading of a slide, and ``content`` that following it; both
+    are None if missing.
+
+    Parameters: see `html_parts()`.
+    """
+    publisher = get_publisher(input_encoding, doctitle, initial_header_level,
+                              writer='slides')
+    return publish(publisher, input_string, source_path)['slides']
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+
+from landslide import utils
+
+# words, as the search box of slides.js splits queries
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# shorter words are left out of the index, they still match as prefixes
+MIN_TERM_LENGTH = 2
+DIGITS36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def get_terms(*htmls):
+    """Returns the sorted distinct lowercase words of some html code, None
+    values being skipped"""
+    text = u' '.join([utils.get_text(html) for html in htmls if html])
+    return sorted(set([term for term in TOKEN_RE.findall(text.lower())
+                       if len(term) >= MIN_TERM_LENGTH]))
+
+
+class SearchIndex(object):
+    """An inverted index of the words of slides, mapping each word to the
+    numbers of the slides it appears in. Its JSON form holds the sorted
+    ``terms``, so that words can be looked up by prefix, and their
+    ``postings``: the gaps between the slide numbers of each term, in base
+    36, separated by commas.
+    """
+    def __init__(self):
+        self.postings = {}
+        self.num_slides = 0
+
+    def add(self, number, terms):
+        """Indexes the ``terms`` of a slide; slides must be added in
+        order"""
+        self.num_slides += 1
+        for term in terms:
+            self.postings.setdefault(term, []).append(number)
+
+    def to_json(self):
+        terms = sorted(self.postings)
+        return {'terms': terms,
+                'postings': [encode_postings(self.postings[term])
+                             for term in terms]}
+
+
+def encode_postings(numbers):
+    """Encodes ascending numbers as the base 36 gaps between them"""
+    gaps = []
+    previous = 0
+    for number in numbers:
+        gaps.append(to_base36(number - previous))
+        previous = number
+    return ','.join(gaps)
+
+
+def decode_postings(postings):
+    numbers = []
+    number = 0
+    for gap in postings.split(','):
+        number += int(gap, 36)
+        numbers.append(number)
+    return numbers
+
+
+def to_base36(number):
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(DIGITS36[digit])
+        if not number:
+            return ''.join(reversed(digits))
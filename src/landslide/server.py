@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+import json
+import time
+import urllib
+import hashlib
+import mimetypes
+import threading
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from logging import getLogger
+logger = getLogger('landslide.server')
+
+FILES_PREFIX = '/_files'
+EVENTS_PATH = '/_events'
+SEARCH_INDEX_PATH = '/_search-index'
+# seconds between two keep alive comments sent to browsers, which also
+# detect closed connections
+KEEP_ALIVE = 15
+
+slide_wrapper_re = re.compile(r'<div class="slide-wrapper">')
+div_tag_re = re.compile(r'<(/?)div\b')
+search_index_re = re.compile(r'(<script type="application/json" '
+                             r'id="search-index">)(.*?)(</script>)',
+                             re.DOTALL)
+
+# keeps in place the slides whose html did not change, and the navigation
+# state (current slide and neighbours) of the changed ones, which the theme
+# script sets up again (listeners, embedded images, lazy contents) if it
+# provides refreshSlide(); the search index of the changed slides is loaded
+# again
+LIVE_SCRIPT = u"""<script>
+  (function(version) {
+    if (!window.EventSource) {
+      return;
+    }
+    var states = /\\s(far-past|past|current|future|far-future)(?=\\s|$)/g;
+    var source = new EventSource('%s?version=' + version);
+    source.addEventListener('reload', function() {
+      location.reload();
+    });
+    source.addEventListener('slides', function(event) {
+      var changes = JSON.parse(event.data);
+      var wrappers = document.querySelectorAll('div.slides > .slide-wrapper');
+      for (var i = 0; i < changes.length; i++) {
+        var old = wrappers[changes[i].index];
+        var holder = document.createElement('div');
+        holder.innerHTML = changes[i].html;
+        var wrapper = holder.querySelector('.slide-wrapper');
+        var slide = wrapper.querySelector('.slide');
+        var state = old.querySelector('.slide').className.match(states);
+        if (state) {
+          slide.className += state.join('');
+        }
+        old.parentNode.replaceChild(wrapper, old);
+        if (window.refreshSlide) {
+          refreshSlide(wrapper);
+        }
+      }
+      var index = document.getElementById('search-index');
+      if (index) {
+        var request = new XMLHttpRequest();
+        request.open('GET', '%s');
+        request.onload = function() {
+          index.textContent = request.responseText;
+        };
+        request.send();
+      }
+    });
+  })(%d);
+</script>
+"""
+
+
+def split_slides(html):
+    """Splits the html code of a presentation into its slide wrappers, and
+    its layout where each of them is replaced by a placeholder. Returns None
+    if slide wrappers cannot be told apart."""
+    layout = []
+    slides = []
+    position = 0
+    for match in slide_wrapper_re.finditer(html):
+        if match.start() < position:
+            # wrapper nested in a slide
+            return None
+        depth = 0
+        for tag in div_tag_re.finditer(html, match.start()):
+            depth += -1 if tag.group(1) else 1
+            if not depth:
+                break
+        else:
+            return None
+        end = html.index('>', tag.end()) + 1
+        layout.append(html[position:match.start()])
+        layout.append(u'<!-- slide -->')
+        slides.append(html[match.start():end])
+        position = end
+    layout.append(html[position:])
+    return u''.join(layout), slides
+
+
+class Preview(object):
+    """Builds a presentation in memory, again each time its sources change.
+    Slides of unchanged sources are reused from the generator cache, and the
+    slides which changed since the previous build are pushed as a ``slides``
+    event; other changes trigger a ``reload`` event.
+    """
+    def __init__(self, get_generator):
+        self.get_generator = get_generator
+        self.generator = get_generator()
+        self.condition = threading.Condition()
+        self.version = 0
+        self.event = None
+        self.html = None
+        self.etag = None
+        self.search_index = None
+        self.search_index_etag = None
+        self.layout = None
+        self.slides = None
+        self.roots = []
+        self.build()
+
+    def build(self, changed=()):
+        """Builds the presentation again, recreating the generator if its
+        configuration file is among the ``changed`` paths"""
+        generator = self.generator
+        if (generator.config_file
+            and os.path.abspath(generator.config_file) in changed):
+            generator = self.get_generator()
+        html = generator.render()
+        # the search index changes along with slides, it is sent apart
+        search_index = search_index_re.search(html)
+        if search_index:
+            search_index = search_index.group(2)
+        split = split_slides(search_index_re.sub(r'\1\3', html))
+        event = ('reload', '')
+        if split and self.slides is not None and split[0] == self.layout \
+           and len(split[1]) == len(self.slides):
+            changes = [{'index': index, 'html': slide}
+                       for index, (slide, old_slide)
+                       in enumerate(zip(split[1], self.slides))
+                       if slide != old_slide]
+            # otherwise a stylesheet or an image changed
+            if changes:
+                event = ('slides', json.dumps(changes))
+        self.layout, self.slides = split or (None, None)
+        self.generator = generator
+        self.roots = self.get_roots()
+        with self.condition:
+            self.version += 1
+            self.event = event
+            self.search_index = search_index
+            self.search_index_etag = search_index and '"%s"' % hashlib.sha1(
+                search_index.encode('utf-8')).hexdigest()
+            script = LIVE_SCRIPT % (EVENTS_PATH, SEARCH_INDEX_PATH,
+                                    self.version)
+            position = html.rfind(u'</body>')
+            if position == -1:
+                position = len(html)
+            html = html[:position] + script + html[position:]
+            self.html = html.encode('utf-8')
+            self.etag = '"%s"' % hashlib.sha1(self.html).hexdigest()
+            self.condition.notify_all()
+
+    def get_roots(self):
+        """Returns the directories local files may be served from"""
+        roots = []
+        for path in self.generator.get_watched_paths():
+            path = os.path.abspath(path)
+            roots.append(path if os.path.isdir(path) else
+                         os.path.dirname(path))
+        return roots
+
+    def is_served(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return True
+        return False
+
+    def wait_event(self, version, timeout=None):
+        """Returns the event to send to a browser showing ``version``, and
+        the version it shows afterwards. The event is None if no build
+        happened within ``timeout`` seconds."""
+        with self.condition:
+            if self.version == version:
+                self.condition.wait(timeout)
+            if self.version == version:
+                return None, version
+            if self.version == version + 1:
+                return self.event, self.version
+            return ('reload', ''), self.version
+
+    def watch(self):
+        """Builds the presentation again on each change, forever"""
+        from landslide.watcher import get_watcher
+        watcher = get_watcher()
+        while True:
+            watcher.watch(self.generator.get_watched_paths())
+            changed = watcher.wait()
+            for path in sorted(changed):
+                logger.info(u"Changed  %s", path)
+            start = time.time()
+            try:
+                self.build(changed)
+            except Exception, e:
+                logger.error(u"Build failed: %s", e)
+            else:
+                logger.info(u"Done.    Built in %.2fs", time.time() - start)
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Serves the presentation, the local files it links to and its change
+    events"""
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path in ('/', '/index.html'):
+            preview = self.server.preview
+            with preview.condition:
+                contents, etag = preview.html, preview.etag
+            self.send_contents(contents, etag, 'text/html; charset=utf-8')
+        elif path == SEARCH_INDEX_PATH:
+            preview = self.server.preview
+            with preview.condition:
+                contents, etag = (preview.search_index,
+                                  preview.search_index_etag)
+            if contents is None:
+                self.send_error(404)
+            else:
+                self.send_contents(contents.encode('utf-8'), etag,
+                                   'application/json')
+        elif path == EVENTS_PATH:
+            match = re.search(r'(?:^|&)version=(\d+)', query)
+            self.send_events(int(match.group(1)) if match else 0)
+        elif path.startswith(FILES_PREFIX + '/'):
+            self.send_file(urllib.unquote(path[len(FILES_PREFIX):]))
+        else:
+            self.send_error(404)
+
+    def send_contents(self, contents, etag, content_type):
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(contents)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(contents)
+
+    def send_file(self, path):
+        path = os.path.normpath(path)
+        if not self.server.preview.is_served(path) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        etag = '"%x-%x"' % (int(stat.st_mtime * 1000), stat.st_size)
+        content_type = mimetypes.guess_type(path)[0]
+        fh = open(path, 'rb')
+        try:
+            contents = fh.read()
+        finally:
+            fh.close()
+        self.send_contents(contents, etag,
+                           content_type or 'application/octet-stream')
+
+    def send_events(self, version):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                event, version = self.server.preview.wait_event(version,
+                                                                KEEP_ALIVE)
+                if event is None:
+                    self.wfile.write(': keep-alive\n\n')
+                else:
+                    self.wfile.write('event: %s\ndata: %s\n\n' % event)
+                self.wfile.flush()
+        except (IOError, OSError):
+            # the browser went away
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug(u"%s - %s", self.address_string(), format % args)
+
+
+class PreviewServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, preview):
+        HTTPServer.__init__(self, address, PreviewRequestHandler)
+        self.preview = preview
+
+
+def serve(get_generator, host='127.0.0.1', port=8000):
+    """Serves the presentation built by the generators ``get_generator``
+    returns until interrupted, building it again on each change"""
+    preview = Preview(get_generator)
+    server = PreviewServer((host, port), preview)
+    watcher = threading.Thread(target=preview.watch)
+    watcher.daemon = True
+    watcher.start()
+    logger.info(u"Serving  on http://%s:%d/, press Ctrl-C to stop",
+                host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class SlideSpool(object):
+    """A sequence of slides vars stored in a temporary file as they are
+    computed. Only what is needed to number slides and build the table of
+    contents is kept in memory, in ``metadata``; slides, including their
+    search ``terms``, are loaded back one at a time when accessed, so memory
+    usage does not grow with the size of the presentation.
+    """
+    def __init__(self, slides=()):
+        self.file = tempfile.TemporaryFile()
+        self.offsets = []
+        self.metadata = []
+        for slide_vars in slides:
+            self.append(slide_vars)
+
+    def append(self, slide_vars):
+        self.file.seek(0, 2)
+        self.offsets.append(self.file.tell())
+        pickle.dump(slide_vars, self.file, pickle.HIGHEST_PROTOCOL)
+        if slide_vars:
+            slide_vars = {'title': slide_vars['title'],
+                          'level': slide_vars['level']}
+        self.metadata.append(slide_vars)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        self.file.seek(self.offsets[index])
+        slide_vars = pickle.load(self.file)
+        metadata = self.metadata[index]
+        if slide_vars and 'number' in metadata:
+            slide_vars['number'] = metadata['number']
+        return slide_vars
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.file.close()
@@ -19,10 +19,34 @@ import os
 import re
 import unittest
 import codecs
+import base64
+import json
+import shutil
 import tempfile
+import subprocess
+import threading
+import time
+import urllib2
 
-from landslide.generator import HTMLGenerator as Generator
-from landslide.parser import Parser
+from StringIO import StringIO
+
+from landslide.generator import HTMLGenerator as Generator, get_generator
+from landslide.parser import (Parser, split_header, get_markdown,
+                              parse_extension_configs)
+from landslide.profiler import Profiler
+from landslide.assets import AssetCache, minify_css, minify_js
+from landslide.batch import find_decks, build_decks
+from landslide.bench import make_deck, run, compare
+from landslide.cache import FileCache
+from landslide.manifest import SourceManifest
+from landslide.watcher import Watcher
+from landslide.server import Preview, PreviewServer, split_slides
+from landslide.images import ImageTable, optimize_image
+from landslide.search import (SearchIndex, get_terms, encode_postings,
+                              decode_postings)
+from landslide.spool import SlideSpool
+from landslide.theme import get_theme, THEMES_DIR
+from landslide import highlight, parser
 from landslide.macro import (Macro, CodeHighlightingMacro,
                              EmbedImagesMacro, FixImagePathsMacro,
                              FxMacro, NotesMacro)
@@ -97,6 +121,21 @@ class GeneratorTest(unittest.TestCase):
         # check that the file was properly encoded in utf_8
         self.assertTrue(re.findall(u'русский', file_contents, flags=re.UNICODE))
 
+    def test_jobs(self):
+        source = os.path.join(SAMPLES_DIR, 'example2')
+        g = Generator(source, destination_file=self.destination_file)
+        html = g.render()
+        g = Generator(source, destination_file=self.destination_file, jobs=4)
+        self.assertEqual(g.render(), html)
+
+    def test_execute(self):
+        g = Generator(os.path.join(SAMPLES_DIR, 'example3', 'slides.rst'),
+                      destination_file=self.destination_file)
+        g.execute()
+        self.destination_file.seek(0)
+        self.assertEqual(self.destination_file.read(),
+                         g.render().encode('utf-8'))
+
     def test_get_template_vars(self):
         g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
                       destination_file=self.destination_file)
@@ -107,6 +146,73 @@ class GeneratorTest(unittest.TestCase):
         self.assertEqual(svars['head_title'], 'slide1')
 
 
+    def test_lazy(self):
+        g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
+                      lazy=True)
+        html = g.render()
+        fragments = re.findall(r'<script type="application/json" '
+                               r'class="slide-fragment">(.*?)</script>', html)
+        self.assertTrue(len(fragments) > 1)
+        self.assertFalse('<section><p>' in html)
+        contents = [json.loads(fragment) for fragment in fragments]
+        self.assertTrue(u'<p>Generates a slideshow' in contents[0])
+
+    def test_markdown_extensions_config(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'slides.md'), 'w') as fh:
+                fh.write('# Title\n\nTerm\n:   Definition\n')
+            config_file = os.path.join(directory, 'deck.cfg')
+            with open(config_file, 'w') as fh:
+                fh.write('[landslide]\nsource = %s\n'
+                         'markdown_extensions = def_list, toc\n'
+                         'markdown_extension_configs = toc:anchorlink=true\n'
+                         % os.path.join(directory, 'slides.md'))
+            g = Generator(config_file)
+            self.assertEqual(g.markdown_extensions, ['def_list', 'toc'])
+            html = g.render()
+            self.assertTrue('<dl>' in html)
+            self.assertTrue('class="toclink"' in html)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_slides_metadata(self):
+        g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'))
+        html = g.render()
+        metadata = json.loads(re.search(r'<script type="application/json" '
+                                        r'id="slides-metadata">(.*?)</script>',
+                                        html).group(1))
+        self.assertEqual(len(metadata),
+                         html.count('<div class="slide-wrapper">'))
+        self.assertEqual(metadata[0], {'number': 1, 'title': 'Landslide'})
+        self.assertEqual([slide['number'] for slide in metadata],
+                         range(1, len(metadata) + 1))
+
+    def test_get_template_vars_spool(self):
+        g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
+                      destination_file=self.destination_file)
+        slides = SlideSpool([{'title': "slide1", 'level': 1, 'content': 'a',
+                              'terms': [u'alpha']},
+                             None,
+                             {'title': "slide2", 'level': 2, 'content': 'b',
+                              'terms': [u'alpha', u'beta']},
+                            ])
+        # search terms are only kept in the spool file
+        self.assertFalse('terms' in slides.metadata[0])
+        svars = g.get_template_vars(slides)
+        self.assertEqual(json.loads(svars['search_index']),
+                         {'terms': [u'alpha', u'beta'],
+                          'postings': ['1,1', '2']})
+        self.assertEqual(svars['head_title'], 'slide1')
+        self.assertEqual(svars['num_slides'], '2')
+        self.assertEqual(len(svars['toc']), 1)
+        self.assertEqual(len(svars['toc'][0]['sub']), 1)
+        slides = list(svars['slides'])
+        self.assertEqual(len(slides), 3)
+        self.assertEqual(slides[1], None)
+        self.assertEqual(slides[2]['content'], 'b')
+        self.assertEqual(slides[2]['number'], 2)
+
     def test_process_macros(self):
         g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
                       destination_file=self.destination_file)
@@ -121,6 +227,19 @@ class GeneratorTest(unittest.TestCase):
         self.assertEqual(r[1][0], 'blah')
         self.assertEqual(r[1][1], 'blob')
 
+    def test_process_macros_triggers(self):
+        g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
+                      destination_file=self.destination_file)
+        g.process_macros('<p>foo</p>')
+        g.process_macros('<p>.notes: bar</p>')
+        self.assertEqual(g.macro_stats['NotesMacro']['hits'], 1)
+        self.assertEqual(g.macro_stats['NotesMacro']['misses'], 1)
+        self.assertEqual(g.macro_stats['FxMacro']['hits'], 0)
+        self.assertEqual(g.macro_stats['FxMacro']['misses'], 2)
+        macros = g.get_macros()
+        g.process_macros('<p>foo</p>')
+        self.assertTrue(g.get_macros() is macros)
+
     def test_register_macro(self):
         g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
                       destination_file=self.destination_file)
@@ -137,6 +256,405 @@ class GeneratorTest(unittest.TestCase):
         self.assertRaises(TypeError, g.register_macro, plop)
 
 
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.decks_dir = tempfile.mkdtemp()
+        for name, source in (('a', 'example1'), ('b', 'example2'),
+                             ('broken', 'missing.md')):
+            os.mkdir(os.path.join(self.decks_dir, name))
+            with open(os.path.join(self.decks_dir, name, 'deck.cfg'),
+                      'w') as fh:
+                fh.write('[landslide]\nsource = %s\ndestination = out.html\n'
+                         % os.path.abspath(os.path.join(SAMPLES_DIR, source)))
+
+    def tearDown(self):
+        shutil.rmtree(self.decks_dir)
+
+    def test_find_decks(self):
+        pattern = os.path.join(self.decks_dir, '*', 'deck.cfg')
+        paths = find_decks([os.path.join(self.decks_dir, 'b', 'deck.cfg'),
+                            pattern])
+        self.assertEqual([os.path.basename(os.path.dirname(path))
+                          for path in paths], ['b', 'a', 'broken'])
+
+    def test_build_decks(self):
+        paths = find_decks([os.path.join(self.decks_dir, '*', 'deck.cfg')])
+        for jobs in (1, 2):
+            results = list(build_decks(paths, jobs=jobs))
+            self.assertEqual([result['path'] for result in results], paths)
+            self.assertEqual(results[0]['error'], None)
+            self.assertTrue(results[0]['slides'] > 0)
+            self.assertEqual(results[0]['destination'],
+                             os.path.join(self.decks_dir, 'a', 'out.html'))
+            self.assertTrue(os.path.exists(results[1]['destination']))
+            self.assertTrue(results[2]['error'].startswith('IOError'))
+            self.assertFalse(os.path.exists(
+                os.path.join(self.decks_dir, 'broken', 'out.html')))
+
+
+class ThemeTest(unittest.TestCase):
+    def test_get_path(self):
+        theme = get_theme(os.path.join(THEMES_DIR, 'light'))
+        self.assertTrue(get_theme(os.path.join(THEMES_DIR, 'light')) is theme)
+        self.assertEqual(theme.get_path('css/screen.css'),
+                         os.path.join(theme.theme_dir, 'css', 'screen.css'))
+        self.assertEqual(theme.get_path('base.html'),
+                         os.path.join(THEMES_DIR, 'default', 'base.html'))
+        self.assertEqual(theme.get_path('base.html', fallback=False), None)
+        self.assertEqual(theme.get_path('foo.html'), None)
+
+    def test_get_template(self):
+        theme_dir = tempfile.mkdtemp()
+        try:
+            fh = open(os.path.join(theme_dir, 'base.html'), 'w')
+            fh.write('{% extends "default/base.html" %}')
+            fh.close()
+            theme = get_theme(theme_dir)
+            template = theme.get_template('base.html')
+            self.assertTrue(theme.get_template('base.html') is template)
+            html = template.render(css={'print': {}, 'screen': {}}, js={},
+                                   slides=[])
+            self.assertTrue(html.find('<body>') != -1)
+        finally:
+            shutil.rmtree(theme_dir)
+
+    def test_added_files(self):
+        theme_dir = tempfile.mkdtemp()
+        try:
+            theme = get_theme(theme_dir)
+            self.assertEqual(theme.get_path('css/extra.css'), None)
+            os.mkdir(os.path.join(theme_dir, 'css'))
+            open(os.path.join(theme_dir, 'css', 'extra.css'), 'w').close()
+            theme = get_theme(theme_dir)
+            self.assertEqual(theme.get_path('css/extra.css'),
+                             os.path.join(theme_dir, 'css', 'extra.css'))
+            self.assertTrue(get_theme(theme_dir) is theme)
+        finally:
+            shutil.rmtree(theme_dir)
+
+    def test_rebuild_added_files(self):
+        theme_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(theme_dir, 'css'))
+            open(os.path.join(theme_dir, 'css', 'screen.css'), 'w').close()
+            # adding a file changes the time, whatever its resolution
+            os.utime(os.path.join(theme_dir, 'css'), (0, 0))
+            g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
+                          theme=theme_dir)
+            print_css = os.path.join(theme_dir, 'css', 'print.css')
+            self.assertFalse(print_css in g.render())
+            open(print_css, 'w').close()
+            # the same generator builds again, eg. in --watch mode
+            self.assertTrue(print_css in g.render())
+        finally:
+            shutil.rmtree(theme_dir)
+
+    def test_unwritable_cache_dir(self):
+        theme_dir = tempfile.mkdtemp()
+        try:
+            # the cache directory cannot be created below a file
+            blocker = os.path.join(theme_dir, 'blocker')
+            open(blocker, 'w').close()
+            theme = get_theme(os.path.join(THEMES_DIR, 'light'))
+            template = theme.get_template(
+                'base.html', cache_dir=os.path.join(blocker, 'templates'))
+            self.assertTrue(template is not None)
+        finally:
+            shutil.rmtree(theme_dir)
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.destination_file = tempfile.NamedTemporaryFile()
+
+    def tearDown(self):
+        self.destination_file.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_file_cache(self):
+        cache = FileCache(self.cache_dir)
+        self.assertEqual(cache.get('foo'), None)
+        cache.set('foo', {'bar': u'baz'})
+        self.assertEqual(cache.get('foo'), {'bar': u'baz'})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.max_size = 1
+        cache.prune()
+        self.assertEqual(cache.get('foo'), None)
+
+    def test_cached_build(self):
+        source = os.path.join(SAMPLES_DIR, 'example2')
+        g = Generator(source, destination_file=self.destination_file,
+                      cache_dir=self.cache_dir)
+        html = g.render()
+        self.assertEqual(g.cache.hits, 0)
+        misses = g.cache.misses
+        self.assertTrue(misses > 0)
+        g = Generator(source, destination_file=self.destination_file,
+                      cache_dir=self.cache_dir)
+        self.assertEqual(g.render(), html)
+        self.assertEqual(g.cache.hits, misses)
+        self.assertEqual(g.cache.misses, 0)
+        g = Generator(source, destination_file=self.destination_file,
+                      cache_dir=self.cache_dir, embed=True)
+        g.render()
+        self.assertEqual(g.cache.hits, 0)
+
+    def test_library_versions(self):
+        # slides converted by another version of a library are not reused
+        source = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+        g = Generator(source, destination_file=self.destination_file)
+        contents = open(source, 'rb').read()
+        key = g.get_cache_key(source, contents)
+        versions = parser.get_library_versions('markdown')
+        self.assertEqual([name for name, version in versions],
+                         ['markdown', 'pygments'])
+        parser._versions['markdown'] = (('markdown', '0.0'),) + versions[1:]
+        try:
+            self.assertNotEqual(g.get_cache_key(source, contents), key)
+        finally:
+            parser._versions['markdown'] = versions
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for path in ('a/1.md', 'a/2.rst', 'a/image.png', 'b/drafts/3.md',
+                     'b/4.md', 'c.md'):
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fh:
+                fh.write('# Title\n')
+        # links back to its own directory
+        os.symlink(os.path.join(self.directory, 'b'),
+                   os.path.join(self.directory, 'b', 'loop'))
+        self.set_old_mtimes()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def set_old_mtimes(self):
+        # listings of directories changed just now are not cached
+        mtime = time.time() - 60
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            os.utime(dirpath, (mtime, mtime))
+
+    def relative(self, files):
+        return [(os.path.relpath(path, self.directory), format)
+                for path, format in files]
+
+    def test_resolve(self):
+        manifest = SourceManifest(self.directory)
+        self.assertEqual(self.relative(manifest.resolve()),
+                         [('a/1.md', 'markdown'),
+                          ('a/2.rst', 'restructuredtext'),
+                          ('b/4.md', 'markdown'),
+                          ('b/drafts/3.md', 'markdown'),
+                          ('c.md', 'markdown')])
+        manifest = SourceManifest([os.path.join(self.directory, '[bc]*'),
+                                   os.path.join(self.directory, 'a')],
+                                  include=['*.md'], exclude=['drafts'])
+        self.assertEqual(self.relative(manifest.resolve()),
+                         [('b/4.md', 'markdown'), ('c.md', 'markdown'),
+                          ('a/1.md', 'markdown')])
+        manifest = SourceManifest(self.directory, include=['a/*'])
+        self.assertEqual(self.relative(manifest.resolve()),
+                         [('a/1.md', 'markdown'),
+                          ('a/2.rst', 'restructuredtext')])
+        self.assertEqual(manifest.get_watched_paths(), set([self.directory]))
+        self.assertEqual(SourceManifest(os.path.join(self.directory, '*.md'))
+                         .get_watched_paths(), set([self.directory]))
+        self.assertRaises(IOError, SourceManifest(
+            os.path.join(self.directory, 'missing.md')).resolve)
+
+    def test_shared_directories(self):
+        # a directory reached by two patterns, or through a link which does
+        # not lead back to a parent directory, is walked each time
+        os.symlink(os.path.join(self.directory, 'a'),
+                   os.path.join(self.directory, 'b', 'drafts', 'alias'))
+        self.set_old_mtimes()
+        manifest = SourceManifest([os.path.join(self.directory, '[ab]'),
+                                   os.path.join(self.directory, 'a*')],
+                                  include=['*.md'])
+        for iteration in range(2):
+            self.assertEqual(self.relative(manifest.resolve()),
+                             [('a/1.md', 'markdown'),
+                              ('b/4.md', 'markdown'),
+                              ('b/drafts/3.md', 'markdown'),
+                              ('b/drafts/alias/1.md', 'markdown'),
+                              ('a/1.md', 'markdown')])
+
+    def test_cached_listings(self):
+        cache = FileCache(self.directory + '-cache')
+        try:
+            manifest = SourceManifest(self.directory, cache=cache)
+            files = manifest.resolve()
+            self.assertEqual(manifest.stats, {'listed': 4, 'cached': 0})
+            manifest = SourceManifest(self.directory, cache=cache)
+            self.assertEqual(manifest.resolve(), files)
+            self.assertEqual(manifest.stats, {'listed': 0, 'cached': 4})
+            os.remove(os.path.join(self.directory, 'b', 'drafts', '3.md'))
+            os.utime(os.path.join(self.directory, 'b', 'drafts'),
+                     (time.time() - 10, time.time() - 10))
+            self.assertEqual(len(manifest.resolve()), len(files) - 1)
+            self.assertEqual(manifest.stats, {'listed': 1, 'cached': 3})
+        finally:
+            shutil.rmtree(self.directory + '-cache')
+
+    def test_generator_config(self):
+        config_file = os.path.join(self.directory, 'deck.cfg')
+        with open(config_file, 'w') as fh:
+            fh.write('[landslide]\nsource = %s\n  %s\n'
+                     'exclude = drafts 4.md\n'
+                     % (os.path.join(self.directory, '[ab]'),
+                        os.path.join(self.directory, 'c.md')))
+        g = Generator(config_file)
+        self.assertEqual(g.exclude, ['drafts', '4.md'])
+        self.assertEqual([os.path.relpath(path, self.directory)
+                          for path, parser in g.walk_sources(g.source)],
+                         ['a/1.md', 'a/2.rst', 'c.md'])
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.source_dir, 'slides.md')
+        self.write(self.source, '# foo\n\n---\n\n# bar\n')
+        self.destination_file = tempfile.NamedTemporaryFile()
+
+    def tearDown(self):
+        self.destination_file.close()
+        shutil.rmtree(self.source_dir)
+
+    def write(self, path, contents):
+        fh = open(path, 'w')
+        fh.write(contents)
+        fh.close()
+        # makes sure the modification time changes
+        mtime = os.stat(path).st_mtime + 1
+        os.utime(path, (mtime, mtime))
+
+    def test_poll(self):
+        watcher = Watcher(ignore=[os.path.join(self.source_dir, 'out.html')])
+        watcher.watch([self.source_dir])
+        self.assertEqual(watcher.poll(), set())
+        self.write(self.source, '# baz\n')
+        self.write(os.path.join(self.source_dir, 'out.html'), '')
+        self.write(os.path.join(self.source_dir, '.slides.md.swp'), '')
+        self.assertEqual(watcher.poll(), set([self.source]))
+        os.remove(self.source)
+        self.assertEqual(watcher.poll(), set([self.source]))
+
+    def test_rebuild(self):
+        g = Generator(self.source_dir, destination_file=self.destination_file,
+                      memory_cache=True)
+        self.assertTrue(g.render().find('<h1>bar</h1>') != -1)
+        self.assertTrue(self.source_dir in g.get_watched_paths())
+        other_source = os.path.join(self.source_dir, 'other.md')
+        self.write(other_source, '# baz\n')
+        html = g.render()
+        self.assertEqual(g.num_slides, 3)
+        self.assertEqual(len(g.toc), 3)
+        self.assertEqual((g.cache.hits, g.cache.misses), (1, 2))
+        self.write(other_source, '# qux\n')
+        html = g.render()
+        self.assertTrue(html.find('<h1>qux</h1>') != -1)
+        self.assertEqual((g.cache.hits, g.cache.misses), (2, 3))
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.source_dir, 'slides.md')
+        with open(self.source, 'w') as fh:
+            fh.write('# Title\n\n---\n\n## First\n\nfoo\n\n---\n\n'
+                     '## Second\n\nbar\n')
+        self.preview = Preview(lambda: Generator(self.source, None,
+                                                 memory_cache=True,
+                                                 url_prefix='/_files'))
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def test_split_slides(self):
+        layout, slides = split_slides(
+            u'<div class="slides"><div class="slide-wrapper"><div>a</div>'
+            u'</div> <div class="slide-wrapper">b</div></div>')
+        self.assertEqual(layout, u'<div class="slides"><!-- slide --> '
+                                 u'<!-- slide --></div>')
+        self.assertEqual(slides, [u'<div class="slide-wrapper"><div>a</div>'
+                                  u'</div>', u'<div class="slide-wrapper">b'
+                                  u'</div>'])
+        self.assertEqual(split_slides(u'<div class="slide-wrapper">'), None)
+
+    def test_build(self):
+        self.assertEqual(self.preview.version, 1)
+        self.assertEqual(len(self.preview.slides), 3)
+        with open(self.source, 'w') as fh:
+            fh.write('# Title\n\n---\n\n## First\n\nfoo\n\n---\n\n'
+                     '## Second\n\nbaz\n')
+        self.preview.build()
+        event, version = self.preview.wait_event(1)
+        self.assertEqual(version, 2)
+        self.assertEqual(event[0], 'slides')
+        changes = json.loads(event[1])
+        self.assertEqual([change['index'] for change in changes], [2])
+        self.assertTrue('baz' in changes[0]['html'])
+        self.assertEqual(self.preview.wait_event(0), (('reload', ''), 2))
+        self.assertEqual(self.preview.wait_event(2, 0), (None, 2))
+        with open(self.source, 'w') as fh:
+            fh.write('# Title\n\n---\n\n## First\n\nfoo\n')
+        self.preview.build()
+        self.assertEqual(self.preview.wait_event(2)[0], ('reload', ''))
+
+    def test_serve(self):
+        server = PreviewServer(('127.0.0.1', 0), self.preview)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d' % server.server_address[1]
+            response = urllib2.urlopen(url + '/')
+            html = response.read()
+            etag = response.info()['ETag']
+            self.assertTrue('<h2>Second</h2>' in html)
+            self.assertTrue('/_events' in html)
+            request = urllib2.Request(url + '/',
+                                      headers={'If-None-Match': etag})
+            try:
+                urllib2.urlopen(request)
+                self.fail('Unchanged presentation sent again')
+            except urllib2.HTTPError, e:
+                self.assertEqual(e.code, 304)
+            response = urllib2.urlopen(url + '/_search-index')
+            index = json.loads(response.read())
+            self.assertTrue(u'second' in index['terms'])
+            index_etag = response.info()['ETag']
+            self.assertNotEqual(index_etag, etag)
+            # the index does not change along with the rest of the page
+            self.preview.build()
+            request = urllib2.Request(url + '/_search-index',
+                                      headers={'If-None-Match': index_etag})
+            try:
+                urllib2.urlopen(request)
+                self.fail('Unchanged search index sent again')
+            except urllib2.HTTPError, e:
+                self.assertEqual(e.code, 304)
+            js = re.search(r'src="(/_files[^"]+slides\.js)"', html).group(1)
+            self.assertEqual(urllib2.urlopen(url + js).read(),
+                             open(os.path.join(THEMES_DIR, 'default', 'js',
+                                               'slides.js')).read())
+            try:
+                urllib2.urlopen(url + '/_files/etc/passwd')
+                self.fail('File outside of the presentation served')
+            except urllib2.HTTPError, e:
+                self.assertEqual(e.code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
 class CodeHighlightingMacroTest(unittest.TestCase):
     def setUp(self):
         self.sample_html = '''<p>Let me give you this snippet:</p>
@@ -191,6 +709,15 @@ echo $bar;
         self.assertEqual(m.process(input)[0], input)
         self.assertEqual(m.process(input)[1], [])
 
+    def test_process_unknown_lexer(self):
+        m = CodeHighlightingMacro()
+        content = ("<pre><code>!foobarbaz\nfoo</code></pre>\n"
+                   "<pre><code>!python\nbar</code></pre>")
+        hl = m.process(content)
+        self.assertTrue(hl[0].startswith('<pre><code>!foobarbaz'))
+        self.assertTrue(hl[0].find('<div class="highlight"><pre') > 0)
+        self.assertEquals(hl[1], [u'has_code'])
+
     def test_process_rst_code_blocks(self):
         m = CodeHighlightingMacro()
         hl = m.process(self.sample_html)
@@ -201,6 +728,41 @@ echo $bar;
         self.assertEquals(hl[1][0], u'has_code')
 
 
+class HighlightTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        highlight.memory_cache.clear()
+        highlight.set_cache_dir(self.cache_dir)
+
+    def tearDown(self):
+        highlight.set_cache_dir(None)
+        shutil.rmtree(self.cache_dir)
+
+    def test_highlight(self):
+        html = highlight.highlight(u'print 42', 'python', linenos='inline')
+        self.assertTrue(html.startswith('<div class="highlight"><pre>'))
+        self.assertEqual(highlight.highlight(u'print 42', 'python',
+                                             linenos='inline'), html)
+        highlight.memory_cache.clear()
+        self.assertEqual(highlight.highlight(u'print 42', 'python',
+                                             linenos='inline'), html)
+        self.assertEqual(highlight.disk_cache.hits, 1)
+        self.assertRaises(ValueError, highlight.highlight, u'foo', 'foobarbaz')
+        self.assertTrue(highlight.highlight(u'foo', 'foobarbaz', fallback=True))
+
+    def test_generator_cache_dir(self):
+        source = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+        g = Generator(source, cache_dir=self.cache_dir)
+        self.assertEqual(highlight.disk_cache.directory,
+                         os.path.join(self.cache_dir, 'highlight'))
+        # a generator without cache never uses the one of another
+        Generator(source)
+        self.assertEqual(highlight.disk_cache.directory, None)
+        g.render()
+        self.assertEqual(highlight.disk_cache.directory,
+                         os.path.join(self.cache_dir, 'highlight'))
+
+
 class EmbedImagesMacroTest(unittest.TestCase):
     def test_process(self):
         base_dir = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
@@ -210,6 +772,413 @@ class EmbedImagesMacroTest(unittest.TestCase):
         self.assertTrue(re.match(r'<img src="data:image/jpeg;base64,(.+?)"/>',
                         content))
 
+    def test_process_image_table(self):
+        base_dir = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+        m = EmbedImagesMacro(True)
+        m.images = ImageTable()
+        m.inline = False
+        content, classes = m.process('<img src="monkey.jpg"/>', base_dir)
+        image_id = re.match(r'<img src="data:," '
+                            r'data-embedded-image="(\w+)"/>', content).group(1)
+        m.process('<p><img src="monkey.jpg"/></p>', base_dir)
+        self.assertEqual(len(m.images), 1)
+        self.assertTrue(m.images.data_urls[image_id].startswith(
+                        'data:image/jpeg;base64,'))
+
+    def test_embedded_once(self):
+        source_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(os.path.join(SAMPLES_DIR, 'example1', 'monkey.jpg'),
+                        source_dir)
+            fh = open(os.path.join(source_dir, 'slides.md'), 'w')
+            fh.write('# foo\n\n![monkey](monkey.jpg)\n\n---\n\n'
+                     '# bar\n\n![monkey](monkey.jpg)\n')
+            fh.close()
+            g = Generator(source_dir, embed=True,
+                          destination_file=tempfile.TemporaryFile())
+            html = g.render()
+            self.assertEqual(html.count('data:image/jpeg;base64,'), 1)
+            self.assertEqual(html.count('<img alt="monkey" src="data:," '
+                                        'data-embedded-image='), 2)
+            # a theme of its own, which does not output the image table
+            theme_dir = os.path.join(source_dir, 'theme')
+            os.mkdir(theme_dir)
+            with open(os.path.join(theme_dir, 'base.html'), 'w') as fh:
+                fh.write('{% for slide in slides %}'
+                         '{{ slide.content }}{% endfor %}')
+            g = Generator(source_dir, embed=True, theme=theme_dir,
+                          destination_file=tempfile.TemporaryFile())
+            self.assertFalse(g.share_embedded_images)
+            html = g.render()
+            self.assertEqual(html.count('src="data:image/jpeg;base64,'), 2)
+            self.assertFalse('data-embedded-image' in html)
+            # or which extends the default one
+            with open(os.path.join(theme_dir, 'base.html'), 'w') as fh:
+                fh.write('{% extends "default/base.html" %}')
+            g = Generator(source_dir, embed=True, theme=theme_dir,
+                          destination_file=tempfile.TemporaryFile())
+            self.assertTrue(g.share_embedded_images)
+        finally:
+            shutil.rmtree(source_dir)
+
+
+class ImageTableTest(unittest.TestCase):
+    def test_optimize(self):
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        path = os.path.join(SAMPLES_DIR, 'example1', 'monkey.jpg')
+        size = os.path.getsize(path)
+        table = ImageTable(max_size=64, quality=50)
+        image_id = table.add(path, 'image/jpeg')
+        data_url = table.data_urls[image_id]
+        self.assertTrue(data_url.startswith('data:image/jpeg;base64,'))
+        contents = base64.b64decode(data_url.split(',', 1)[1])
+        self.assertTrue(len(contents) < size)
+        image = Image.open(StringIO(contents))
+        self.assertEqual(max(image.size), 64)
+
+    def test_optimize_orientation(self):
+        try:
+            from PIL import Image
+            exif = Image.Exif()
+        except (ImportError, AttributeError):
+            return
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        exif[0x010f] = 'Camera'
+        output = StringIO()
+        Image.new('RGB', (40, 20)).save(output, 'JPEG', quality=10,
+                                        exif=exif.tobytes())
+        contents = optimize_image(output.getvalue(), 'image/jpeg',
+                                  quality=95)
+        image = Image.open(StringIO(contents))
+        self.assertEqual(image.size, (20, 40))
+        self.assertFalse(image.info.get('exif'))
+
+
+class AssetsTest(unittest.TestCase):
+    def test_minify_css(self):
+        css = (u'/* comment */\na > b {\n  content: "  /* kept */ ";\n}\n'
+               u'.k { color: red; }\n.nf { color: blue; } /* Name */\n')
+        self.assertEqual(minify_css(css), u'a>b{content: "  /* kept */ "}'
+                                          u'.k{color: red}.nf{color: blue}')
+        self.assertEqual(minify_css(css, ['k']),
+                         u'a>b{content: "  /* kept */ "}.k{color: red}')
+
+    def test_minify_js(self):
+        js = (u'// comment\nvar a = "// kept",\n    b = /\\/*x/g; /* c */\n'
+              u'\n  return a / b;\n')
+        self.assertEqual(minify_js(js), u'var a = "// kept",\n'
+                                        u'b = /\\/*x/g;\nreturn a / b;')
+        self.assertEqual(minify_js(u'var a = "unterminated;'),
+                         u'var a = "unterminated;')
+
+    def test_asset_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = AssetCache(cache_dir)
+            css = '/* comment */\n.k { color: red; }\n'
+            self.assertEqual(cache.minify('screen.css', css), '.k{color: red}')
+            # stored as a plain file, named after the original contents
+            names = os.listdir(cache_dir)
+            self.assertEqual(len(names), 1)
+            self.assertTrue(names[0].endswith('.css'))
+            cache = AssetCache(cache_dir)
+            self.assertEqual(cache.minify('screen.css', css), '.k{color: red}')
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_minified_build(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+            g = Generator(source, embed=True, cache_dir=cache_dir,
+                          minify=True, screen_only=True)
+            html = g.render()
+            self.assertFalse('media="print"' in html)
+            self.assertFalse('Pygments default theme' in html)
+            self.assertTrue('.k{' in html)
+            self.assertFalse('.nd{' in html)
+            self.assertEqual(len(os.listdir(os.path.join(cache_dir,
+                                                         'assets'))), 2)
+            destination = os.path.join(cache_dir, 'out', 'slides.html')
+            os.mkdir(os.path.dirname(destination))
+            g = Generator(source, destination, cache_dir=cache_dir,
+                          minify=True)
+            g.execute()
+            # linked copies live next to the presentation, clearing the
+            # cache leaves them alone
+            shutil.rmtree(os.path.join(cache_dir, 'assets'))
+            path_url = g.get_js()['path_url']
+            self.assertTrue(path_url.endswith('/out/slides.slides.min.js'))
+            self.assertTrue(path_url in open(destination).read())
+            names = sorted(os.listdir(os.path.dirname(destination)))
+            self.assertEqual(names, ['slides.html', 'slides.print.min.css',
+                                     'slides.screen.min.css',
+                                     'slides.slides.min.js'])
+            self.assertTrue(os.path.isfile(path_url[len('file://'):]))
+            # other highlighting classes replace the copies of the
+            # previous build
+            with open(os.path.join(cache_dir, 'slides.md'), 'w') as fh:
+                fh.write('# Title\n\n    !c\n    int main;\n')
+            g = Generator(os.path.join(cache_dir, 'slides.md'), destination,
+                          cache_dir=cache_dir, minify=True)
+            g.execute()
+            self.assertEqual(sorted(os.listdir(os.path.dirname(destination))),
+                             names)
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+class BenchTest(unittest.TestCase):
+    def test_make_deck(self):
+        directory = tempfile.mkdtemp()
+        try:
+            source = make_deck(directory, slides=7, slides_per_file=3,
+                               files_per_dir=2, images=2, format='rst')
+            self.assertEqual(sorted(os.listdir(source)),
+                             ['part0000', 'part0001'])
+            self.assertEqual(len(os.listdir(os.path.join(directory,
+                                                         'images'))), 2)
+            g = Generator(source, embed=True)
+            g.render()
+            self.assertEqual(g.num_slides, 7)
+            self.assertEqual(len(g.embedded_images), 2)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_run(self):
+        results = run(slides=4, slides_per_file=2, code_blocks=2,
+                      languages=['python', 'c'], images=1, embed=True)
+        self.assertEqual(results['slides'], 4)
+        self.assertEqual(results['files'], 2)
+        names = [phase['name'] for phase in results['phases']]
+        # phases of the generator itself, timed by its profiler
+        self.assertEqual(names[:5], ['contents', 'walk', 'read', 'source',
+                                     'parse'])
+        for name in ('slide', 'macro:CodeHighlightingMacro', 'index',
+                     'search_index', 'render', 'write'):
+            self.assertTrue(name in names, name)
+        phases = dict((phase['name'], phase) for phase in results['phases'])
+        self.assertEqual(phases['read']['calls'], 2)
+        self.assertEqual(phases['slide']['calls'], 4)
+        self.assertTrue(sum(phase['time'] for phase in results['phases'])
+                        <= results['total'])
+        for phase in results['phases']:
+            self.assertTrue(isinstance(phase['memory'], (int, long)))
+        self.assertEqual(json.loads(json.dumps(results)), results)
+
+    def test_compare(self):
+        baseline = {'total': 1.0, 'phases': [
+            {'name': 'parse', 'time': 0.5, 'calls': 1},
+            {'name': 'split', 'time': 0.001, 'calls': 1}]}
+        results = {'total': 1.1, 'phases': [
+            {'name': 'parse', 'time': 0.7, 'calls': 1},
+            {'name': 'split', 'time': 0.005, 'calls': 1},
+            {'name': 'write', 'time': 0.1, 'calls': 1}]}
+        self.assertEqual(compare(results, baseline), [('parse', 0.5, 0.7)])
+        self.assertEqual(compare(results, baseline, threshold=0.05),
+                         [('parse', 0.5, 0.7), ('total', 1.0, 1.1)])
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_profile_build(self):
+        events = []
+        profiler = Profiler(events.append)
+        output = StringIO()
+        g = Generator(os.path.join(SAMPLES_DIR, 'example1', 'slides.md'),
+                      output, embed=True, profiler=profiler)
+        g.execute()
+        self.assertEqual(events, profiler.events)
+        names = set(event['name'] for event in events)
+        for name in ('contents', 'walk', 'source', 'parse', 'slide',
+                     'CodeHighlightingMacro', 'template_vars', 'render',
+                     'write'):
+            self.assertTrue(name in names, name)
+        totals = profiler.get_totals()
+        self.assertEqual(totals['slide']['calls'], 9)
+        self.assertEqual(totals['CodeHighlightingMacro']['category'],
+                         'macro')
+        self.assertTrue(totals['source']['self'] < totals['source']['time'])
+        slides = profiler.get_slowest_slides(2)
+        self.assertEqual(len(slides), 2)
+        self.assertTrue(slides[0][0] >= slides[1][0])
+        summary = profiler.summary(2)
+        self.assertTrue('macro:CodeHighlightingMacro' in summary)
+        self.assertTrue('slides.md #' in summary)
+        trace = json.loads(json.dumps(profiler.to_chrome_trace()))
+        self.assertEqual(len(trace['traceEvents']), len(events))
+        self.assertEqual(trace['traceEvents'][0]['ph'], 'X')
+
+    def test_profile_memory(self):
+        profiler = Profiler(memory=True)
+        with profiler.span('outer'):
+            with profiler.span('inner'):
+                data = 'x' * (32 * 1024 * 1024)
+        inner, outer = profiler.events
+        self.assertTrue(inner['memory'] >= 16 * 1024 * 1024)
+        self.assertEqual(inner['self_memory'], inner['memory'])
+        self.assertEqual(outer['self_memory'],
+                         outer['memory'] - inner['memory'])
+        totals = profiler.get_totals()
+        self.assertEqual(totals['inner']['memory'], inner['memory'])
+        self.assertTrue('self (kB)' in profiler.summary())
+        args = profiler.to_chrome_trace()['traceEvents'][0]['args']
+        self.assertEqual(args['memory'], inner['memory'])
+        del data
+        # memory is only measured when asked for
+        profiler = Profiler()
+        with profiler.span('phase'):
+            pass
+        self.assertFalse('memory' in profiler.events[0])
+        self.assertFalse('memory' in profiler.get_totals()['phase'])
+
+    def test_profile_workers(self):
+        events = []
+        g = Generator(SAMPLES_DIR, jobs=2, profiler=Profiler(events.append))
+        g.render()
+        pids = set(event['pid'] for event in events
+                   if event['name'] == 'parse')
+        self.assertTrue(os.getpid() not in pids)
+        self.assertEqual(len([event for event in events
+                              if event['name'] == 'source']), 9)
+
+
+class SearchTest(unittest.TestCase):
+    def test_get_terms(self):
+        self.assertEqual(get_terms(u'<h1>Caf&eacute; Title</h1>',
+                                   u'<p>A <em>caf\xe9</em> to_go, 42 x</p>',
+                                   None),
+                         [u'42', u'caf\xe9', u'title', u'to_go'])
+
+    def test_postings(self):
+        numbers = [1, 2, 40, 1000, 1001]
+        self.assertEqual(encode_postings(numbers), '1,1,12,qo,1')
+        self.assertEqual(decode_postings(encode_postings(numbers)), numbers)
+
+    def test_index(self):
+        index = SearchIndex()
+        index.add(1, [u'alpha', u'beta'])
+        index.add(2, [])
+        index.add(3, [u'beta'])
+        self.assertEqual(index.to_json(), {'terms': [u'alpha', u'beta'],
+                                           'postings': ['1', '1,2']})
+
+    def test_generator(self):
+        source = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+        html = Generator(source).render()
+        index = json.loads(re.search(r'<script type="application/json" '
+                                     r'id="search-index">(.*?)</script>',
+                                     html).group(1))
+        postings = dict(zip(index['terms'], index['postings']))
+        # the title slide, and the slide about it
+        self.assertEqual(decode_postings(postings['landslide'])[0], 1)
+        self.assertTrue('id="search-input"' in html)
+        html = Generator(source, search=False).render()
+        self.assertFalse('id="search-index"' in html)
+        self.assertFalse('id="search-input"' in html)
+
+    def test_empty_slide(self):
+        # empty slides are output but not numbered, slides.js maps the
+        # numbers of the index to positions in the page using the metadata
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'slides.md')
+            with open(source, 'w') as fh:
+                fh.write('# First\n\nalpha\n\n---\n\n---\n\n'
+                         '# Second\n\nbeta\n')
+            html = Generator(source).render()
+            self.assertEqual(html.count('<div class="slide-wrapper">'), 3)
+            metadata = json.loads(re.search(
+                r'id="slides-metadata">(.*?)</script>', html).group(1))
+            self.assertEqual(metadata, [{'number': 1, 'title': 'First'},
+                                        None,
+                                        {'number': 2, 'title': 'Second'}])
+            index = json.loads(re.search(r'id="search-index">(.*?)</script>',
+                                         html).group(1))
+            postings = dict(zip(index['terms'], index['postings']))
+            self.assertEqual(decode_postings(postings['beta']), [2])
+        finally:
+            shutil.rmtree(directory)
+
+
+class PDFTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # stand-in converter, writing the page numbers of the slides
+        converter = os.path.join(self.directory, 'converter.py')
+        with open(converter, 'w') as fh:
+            fh.write('import re, sys\n'
+                     'html = sys.stdin.read()\n'
+                     'numbers = re.findall(r"(\\d+)/\\d+\\s*</aside>", html)\n'
+                     'sys.stdout.write("%%PDF %s\\n" % ",".join(numbers))\n')
+        merger = os.path.join(self.directory, 'merger.py')
+        with open(merger, 'w') as fh:
+            fh.write('import sys\n'
+                     'with open(sys.argv[1], "w") as fh:\n'
+                     '    for path in sys.argv[2:]:\n'
+                     '        fh.write(open(path).read())\n')
+        self.backend = '"%s" "%s"' % (sys.executable, converter)
+        self.merge_command = '"%s" "%s" {output} {inputs}' % (sys.executable,
+                                                              merger)
+        self.source = os.path.join(SAMPLES_DIR, 'example1', 'slides.md')
+        self.destination = os.path.join(self.directory, 'slides.pdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_generator(self, **options):
+        return get_generator('pdf')(self.source, self.destination,
+                                    pdf_backend=self.backend, **options)
+
+    def test_convert(self):
+        g = self.get_generator()
+        g.execute()
+        numbers = u','.join([str(n) for n in range(1, g.num_slides + 1)])
+        with open(self.destination) as fh:
+            self.assertEqual(fh.read(), '%%PDF %s\n' % numbers)
+        output = StringIO()
+        g.destination_file = output
+        g.execute()
+        self.assertEqual(output.getvalue(), '%%PDF %s\n' % numbers)
+
+    def test_convert_chunks(self):
+        g = self.get_generator(pdf_chunk_size=2, jobs=2,
+                               pdf_merge_command=self.merge_command)
+        g.execute()
+        with open(self.destination) as fh:
+            pdfs = fh.read().splitlines()
+        self.assertEqual(len(pdfs), (g.num_slides + 1) // 2)
+        self.assertEqual(pdfs[0], '%PDF 1,2')
+        self.assertEqual(u','.join([pdf[5:] for pdf in pdfs]),
+                         u','.join([str(n) for n
+                                    in range(1, g.num_slides + 1)]))
+
+    def test_errors(self):
+        self.backend = ('"%s" -c "import sys; sys.stderr.write(\'boom\'); '
+                        'sys.exit(3)"' % sys.executable)
+        try:
+            self.get_generator().execute()
+        except EnvironmentError, e:
+            self.assertTrue('status 3: boom' in unicode(e))
+        else:
+            self.fail("failed conversion not reported")
+        # incomplete files are removed
+        self.assertFalse(os.path.exists(self.destination))
+        with open(self.destination, 'w') as fh:
+            fh.write('%PDF previous')
+        self.backend = os.path.join(self.directory, 'missing')
+        self.assertRaises(EnvironmentError, self.get_generator().execute)
+        self.assertRaises(EnvironmentError,
+                          self.get_generator(pdf_chunk_size=2).execute)
+        self.backend = 'landslide-missing-converter --quiet'
+        self.assertRaises(EnvironmentError, self.get_generator().execute)
+        # previous files are left untouched when the converter is missing
+        with open(self.destination) as fh:
+            self.assertEqual(fh.read(), '%PDF previous')
+
 
 class FixImagePathsMacroTest(unittest.TestCase):
     def test_process(self):
@@ -245,6 +1214,107 @@ class ParserTest(unittest.TestCase):
         self.assertEqual(Parser('.rst').format, 'restructuredtext')
         self.assertRaises(NotImplementedError, Parser, '.txt')
 
+    def test_markdown_extensions(self):
+        text = u'# Title\n\nTerm\n:   Definition\n'
+        self.assertFalse('<dl>' in Parser('.md').parse(text))
+        p = Parser('.md', markdown_extensions=['def_list', 'toc'],
+                   markdown_extension_configs={'toc': {'anchorlink': True}})
+        html = p.parse(text)
+        self.assertTrue('<dl>' in html)
+        self.assertTrue('<a class="toclink" href="#title">' in html)
+        # converters are reused, and reset between documents
+        self.assertTrue(get_markdown(['def_list', 'toc'],
+                                     {'toc': {'anchorlink': True}})
+                        is get_markdown(['def_list', 'toc'],
+                                        {'toc': {'anchorlink': True}}))
+        self.assertEqual(p.parse(text), html)
+        self.assertRaises(RuntimeError,
+                          Parser('.md', markdown_extensions=['missing'])
+                          .parse, text)
+
+    def test_rst_publisher(self):
+        from docutils.core import publish_parts
+        from landslide.rst import get_publisher, html_body
+        texts = [u'Title\n=====\n\nSome *text* [1]_.\n\n.. [1] Note\n',
+                 u'----\n\n`unclosed\n', u'Other\n=====\n\n- item\n']
+        overrides = {'input_encoding': 'utf8', 'doctitle_xform': 1,
+                     'initial_header_level': 1}
+        for text in texts * 2:
+            self.assertEqual(html_body(text, input_encoding='utf8'),
+                             publish_parts(text, writer_name='html',
+                                           settings_overrides=overrides)
+                             ['html_body'])
+        self.assertTrue(get_publisher('utf8') is get_publisher('utf8'))
+        self.assertFalse(get_publisher('utf8') is get_publisher())
+
+    def test_rst_slides(self):
+        from landslide.rst import html_slides
+        slides = html_slides(u'Title\n=====\n\n----\n\nOne\n---\n\n'
+                             u'.. note:: a note\n\n`unclosed\n\n----\n\n'
+                             u'Two\n---\n\nText\n\nSub\n~~~\n\nMore\n\n'
+                             u'----\n\nNo heading\n')
+        self.assertEqual(len(slides), 4)
+        self.assertEqual(slides[0], (u'<h1>Title</h1>', 1, u'Title', None))
+        header, level, title, content = slides[1]
+        self.assertEqual((header, level, title),
+                         (u'<h1>One</h1>', 1, u'One'))
+        self.assertTrue(u'<div class="admonition note">' in content)
+        self.assertFalse(u'system-message' in content)
+        self.assertEqual(slides[2][:3], (u'<h1>Two</h1>', 1, u'Two'))
+        self.assertEqual(slides[2][3], u'<p>Text</p>\n<h2>Sub</h2>\n'
+                                       u'<p>More</p>')
+        self.assertEqual(slides[3], (None, None, None,
+                                     u'<p>No heading</p>'))
+        p = Parser('.rst')
+        self.assertEqual(p.parse_slides(u'A\n=\n\ntext\n'),
+                         [(u'<h1>A</h1>', 1, u'A', u'<p>text</p>')])
+
+    def test_parse_extension_configs(self):
+        self.assertEqual(parse_extension_configs(
+                             ['toc:permalink=true', 'toc:title=Contents',
+                              'markdown.extensions.extra:x=[1]']),
+                         {'toc': {'permalink': True, 'title': u'Contents'},
+                          'markdown.extensions.extra': {'x': [1]}})
+        self.assertRaises(ValueError, parse_extension_configs, ['toc'])
+
+    def test_split_slides(self):
+        split_slides = parser.split_slides
+        self.assertEqual(split_slides(u'<p>a</p>\n<hr />\n<p>b</p>'),
+                         [u'<p>a</p>\n', u'\n<p>b</p>'])
+        # markup following a <hr> on its line is kept
+        self.assertEqual(split_slides(u'a<hr>b<hr class="x"/><p>c</p>'),
+                         [u'a', u'b', u'<p>c</p>'])
+        self.assertEqual(split_slides(u'<html><hr'), [u'<html><hr'])
+        self.assertEqual(split_slides(u''), [u''])
+
+    def test_split_header(self):
+        self.assertEqual(split_header(u'<h2 id="t">A <em>b</em></h2>\n'
+                                      u'<p>c</p>\n'),
+                         (u'<h2 id="t">A <em>b</em></h2>', 2,
+                          u'A <em>b</em>', u'<p>c</p>'))
+        self.assertEqual(split_header(u'<h1>A</h1>'),
+                         (u'<h1>A</h1>', 1, u'A', None))
+        self.assertEqual(split_header(u'<hr /><p>a</p>'), None)
+        self.assertEqual(split_header(u'<h1>unclosed'), None)
+        # linear time on pathological input
+        self.assertEqual(split_header(u'<h1' * 100000), None)
+        self.assertEqual(len(parser.split_slides(u'<hr' * 100000)), 1)
+
+
+class ImportTest(unittest.TestCase):
+    def test_lazy_imports(self):
+        # heavy dependencies must not slow down the command line startup
+        code = ('import sys, landslide.main; '
+                'print(" ".join(sorted(sys.modules)))')
+        src_dir = os.path.join(os.path.dirname(__file__), '..')
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   cwd=src_dir, stdout=subprocess.PIPE)
+        modules = process.communicate()[0].split()
+        self.assertEqual(process.returncode, 0)
+        for module in ('jinja2', 'pygments', 'docutils', 'markdown',
+                       'multiprocessing', 'mimetypes'):
+            self.assertFalse(module in modules, module)
+
 
 if __name__ == '__main__':
     unittest.main()
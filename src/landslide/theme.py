@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+
+from logging import getLogger
+logger = getLogger('landslide.theme')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THEMES_DIR = os.path.join(BASE_DIR, 'themes')
+DEFAULT_THEME_DIR = os.path.join(THEMES_DIR, 'default')
+
+template_reference_re = re.compile(r'\{%-?\s*(?:extends|include|import|from)'
+                                   r'\s+["\']([^"\']+)["\']')
+
+# themes and template environments are shared by every presentation built by
+# the current process, so that templates are compiled only once; themes are
+# indexed again when one of their directories changes
+_themes = {}
+_environments = {}
+
+
+def get_theme(theme_dir):
+    """Returns the theme living in a directory"""
+    theme_dir = os.path.abspath(theme_dir)
+    theme = _themes.get(theme_dir)
+    if theme is None or theme.is_stale():
+        theme = _themes[theme_dir] = Theme(theme_dir)
+    return theme
+
+
+def get_signature(dirs):
+    """Returns the modification times of some directories and of all their
+    subdirectories, which change as files are added or removed"""
+    signature = []
+    for directory in dirs:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            try:
+                signature.append((dirpath, os.stat(dirpath).st_mtime))
+            except OSError:
+                pass
+    return signature
+
+
+class Theme(object):
+    """A landslide theme directory. Files missing from a theme are looked up
+    in the default theme.
+
+    Theme files are indexed when the theme is created, along with the
+    modification times of its directories so that ``get_theme()`` can tell
+    when files are added or removed.
+    """
+    def __init__(self, theme_dir):
+        self.theme_dir = theme_dir
+        self.dirs = [theme_dir]
+        if os.path.realpath(theme_dir) != os.path.realpath(DEFAULT_THEME_DIR):
+            self.dirs.append(DEFAULT_THEME_DIR)
+        self.assets = {}
+        self.signature = get_signature(self.dirs)
+        for directory in self.dirs:
+            for dirpath, dirnames, filenames in os.walk(directory):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    relative_path = os.path.relpath(path, directory)
+                    self.assets.setdefault(relative_path, []).append(path)
+
+    def is_stale(self):
+        """Tells whether files were added to or removed from the theme
+        since it was indexed"""
+        return get_signature(self.dirs) != self.signature
+
+    def get_path(self, relative_path, fallback=True):
+        """Returns the path of a theme file, or None if not found in this
+        theme or, if ``fallback`` is set, in the default one"""
+        relative_path = os.path.normpath(relative_path)
+        for path in self.assets.get(relative_path, []):
+            if fallback or path.startswith(self.theme_dir + os.sep):
+                return path
+        return None
+
+    def find_template(self, name):
+        """Returns the path of a template as the template loader finds it,
+        or None"""
+        path = self.get_path(name)
+        if path is None and os.path.isfile(os.path.join(THEMES_DIR, name)):
+            path = os.path.join(THEMES_DIR, name)
+        return path
+
+    def uses_variable(self, variable, name='base.html'):
+        """Tells whether a template of this theme, or one of the templates it
+        extends, includes or imports, mentions a template variable. Sources
+        are only scanned, templates are not compiled."""
+        names = [name]
+        seen = set()
+        while names:
+            path = self.find_template(names.pop())
+            if path is None or path in seen:
+                continue
+            seen.add(path)
+            try:
+                with open(path, 'rb') as fh:
+                    source = fh.read()
+            except IOError:
+                continue
+            if re.search(r'\b%s\b' % re.escape(variable), source):
+                return True
+            names.extend(template_reference_re.findall(source))
+        return False
+
+    def get_template(self, name, encoding='utf8', cache_dir=None):
+        """Returns a compiled template of this theme. Compiled templates are
+        stored in ``cache_dir`` if provided.
+
+        Templates can include or extend any template of this theme or of the
+        default one, the latter being also available with a ``default/``
+        prefix (eg. ``{% extends "default/base.html" %}``).
+        """
+        key = (self.theme_dir, encoding, cache_dir)
+        environment = _environments.get(key)
+        if environment is None:
+            import jinja2
+            bytecode_cache = None
+            if cache_dir and is_writable_dir(cache_dir):
+                bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+            loader = jinja2.FileSystemLoader(self.dirs + [THEMES_DIR],
+                                             encoding=encoding)
+            environment = _environments[key] = jinja2.Environment(
+                loader=loader, bytecode_cache=bytecode_cache)
+        return environment.get_template(name)
+
+
+def is_writable_dir(directory):
+    """Creates a directory if needed, and tells whether files can be written
+    there; failures are logged but never fatal"""
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError, e:
+        logger.warning(u"Unable to cache compiled templates in %s: %s",
+                       directory, e)
+        return False
+    if not os.access(directory, os.W_OK):
+        logger.warning(u"Unable to cache compiled templates in %s: "
+                       u"directory is not writable", directory)
+        return False
+    return True
@@ -5,13 +5,30 @@ function main() {
   if (document.all) { return; }
 
   var currentSlideNo;
+  // the slide whose neighbours have their past / current / future classes
+  var classedSlideNo;
+  var activeTocRow = null;
   var notesOn = false;
   var slides = document.getElementsByClassName('slide');
+  // per slide titles and numbers, output by the generator
+  var slidesMetadata = null;
+  var lazy = document.querySelector('script.slide-fragment') !== null;
+  var thumbnailsObserver = null;
   var touchStartX = 0;
   var spaces = /\s+/, a1 = [""];
   var tocOpened = false;
   var helpOpened = false;
+  var searchOpened = false;
+  // the words of the slides along with the numbers of the slides they
+  // appear in, output by the generator, and loaded on first search or once
+  // updated
+  var searchIndex = null;
+  var MAX_SEARCH_RESULTS = 100;
   var overviewActive = false;
+  // lazy presentations only keep the contents of the slides at most this
+  // far from the current one in the page
+  var LAZY_DISTANCE = 2;
+  var materializedSlides = [];
 
   var str2array = function(s) {
     if (typeof s == "string" || s instanceof String) {
@@ -66,7 +83,36 @@ function main() {
     }
   };
 
+  var getSlideMetadata = function(slideNo) {
+    if (slidesMetadata && slideNo > 0) {
+      return slidesMetadata[slideNo - 1] || null;
+    }
+    return null;
+  };
+
+  // Empty slides are output, but not numbered: numbers of the table of
+  // contents and of the search index are converted to positions in the page
+  var getSlideNoByNumber = function(number) {
+    if (!slidesMetadata) {
+      return number;
+    }
+    if (!slidesMetadata.slideNos) {
+      var slideNos = [];
+      for (var i = 0; i < slidesMetadata.length; i++) {
+        if (slidesMetadata[i]) {
+          slideNos[slidesMetadata[i].number] = i + 1;
+        }
+      }
+      slidesMetadata.slideNos = slideNos;
+    }
+    return slidesMetadata.slideNos[number] || number;
+  };
+
   var getSlideTitle = function(slideNo) {
+    var metadata = getSlideMetadata(slideNo);
+    if (metadata) {
+      return metadata.title;
+    }
     var el = getSlideEl(slideNo);
     if (el) {
       var headers = el.getElementsByTagName('header');
@@ -77,6 +123,51 @@ function main() {
     return null;
   };
 
+  var materializeSlide = function(slideNo) {
+    var el = getSlideEl(slideNo);
+    if (!el || el.materialized || el.fragment === null) {
+      return;
+    }
+    if (el.fragment === undefined) {
+      var script = el.getElementsByClassName('slide-fragment')[0];
+      if (!script) {
+        el.fragment = null;
+        return;
+      }
+      el.fragment = JSON.parse(script.textContent);
+      el.fragmentSection = script.parentNode;
+    }
+    el.fragmentSection.innerHTML = el.fragment;
+    if (window.resolveEmbeddedImages) {
+      resolveEmbeddedImages(el.fragmentSection);
+    }
+    el.materialized = true;
+    materializedSlides.push(slideNo);
+  };
+
+  var dematerializeSlide = function(slideNo) {
+    var el = getSlideEl(slideNo);
+    if (el && el.materialized) {
+      el.fragmentSection.innerHTML = '';
+      el.materialized = false;
+    }
+  };
+
+  var updateFragments = function() {
+    var kept = [];
+    for (var i = 0; i < materializedSlides.length; i++) {
+      if (Math.abs(materializedSlides[i] - currentSlideNo) > LAZY_DISTANCE) {
+        dematerializeSlide(materializedSlides[i]);
+      } else {
+        kept.push(materializedSlides[i]);
+      }
+    }
+    materializedSlides = kept;
+    for (i = currentSlideNo - LAZY_DISTANCE; i <= currentSlideNo + LAZY_DISTANCE; i++) {
+      materializeSlide(i);
+    }
+  };
+
   var changeSlideElClass = function(slideNo, className) {
     var el = getSlideEl(slideNo);
     if (el) {
@@ -85,40 +176,46 @@ function main() {
     }
   };
 
+  // Only the slides from the previous current one to the new one, and their
+  // neighbours, are updated: all the slides before that range are already
+  // far past, and all the ones after it far future. Moving to the next or
+  // previous slide touches a few slides whatever the size of the
+  // presentation, a jump the slides it crosses.
   var updateSlideClasses = function() {
     window.location.hash = "slide" + currentSlideNo;
 
-    for (var i=1; i<currentSlideNo-1; i++) {
-      changeSlideElClass(i, 'far-past');
+    if (classedSlideNo !== undefined) {
+      var first = Math.max(Math.min(classedSlideNo, currentSlideNo) - 1, 1);
+      var last = Math.min(Math.max(classedSlideNo, currentSlideNo) + 1, slides.length);
+      for (var i = first; i <= last; i++) {
+        changeSlideElClass(i, i < currentSlideNo ? 'far-past' : 'far-future');
+      }
     }
 
     changeSlideElClass(currentSlideNo - 1, 'past');
     changeSlideElClass(currentSlideNo, 'current');
     changeSlideElClass(currentSlideNo + 1, 'future');
-
-    for (i=currentSlideNo+2; i<slides.length+1; i++) {
-      changeSlideElClass(i, 'far-future');
-    }
+    classedSlideNo = currentSlideNo;
 
     highlightCurrentTocLink();
 
+    updateFragments();
+
     document.getElementsByTagName('title')[0].innerText = getSlideTitle(currentSlideNo);
   };
 
   var highlightCurrentTocLink = function() {
-    var toc = document.getElementById('toc');
-
-    if (toc) {
-      var tocRows = toc.getElementsByTagName('tr');
-      for (var i=0; i<tocRows.length; i++) {
-        removeClass(tocRows.item(i), 'active');
-      }
+    var metadata = getSlideMetadata(currentSlideNo);
+    var number = metadata ? metadata.number : currentSlideNo;
+    var currentTocRow = document.getElementById('toc-row-' + number);
 
-      var currentTocRow = document.getElementById('toc-row-' + currentSlideNo);
-      if (currentTocRow) {
-        addClass(currentTocRow, 'active');
-      }
+    if (activeTocRow) {
+      removeClass(activeTocRow, 'active');
     }
+    if (currentTocRow) {
+      addClass(currentTocRow, 'active');
+    }
+    activeTocRow = currentTocRow;
   };
 
   var nextSlide = function() {
@@ -163,6 +260,9 @@ function main() {
     if (helpOpened) {
         showHelp();
     }
+    if (searchOpened) {
+        showSearch();
+    }
 
     var toc = document.getElementById('toc');
 
@@ -178,6 +278,9 @@ function main() {
     if (tocOpened) {
         showToc();
     }
+    if (searchOpened) {
+        showSearch();
+    }
 
     var help = document.getElementById('help');
 
@@ -187,6 +290,171 @@ function main() {
     }
   };
 
+  var showSearch = function() {
+    var search = document.getElementById('search');
+
+    if (!search) {
+      return;
+    }
+    if (!searchOpened) {
+      if (tocOpened) {
+        showToc();
+      }
+      if (helpOpened) {
+        showHelp();
+      }
+    }
+
+    var input = document.getElementById('search-input');
+    search.style.marginLeft = searchOpened ? '-' + search.clientWidth + 'px' : '0px';
+    searchOpened = !searchOpened;
+    if (searchOpened) {
+      input.focus();
+      input.select();
+    } else {
+      input.blur();
+    }
+  };
+
+  var loadSearchIndex = function() {
+    var text = document.getElementById('search-index').textContent;
+    if (!searchIndex || searchIndex.text !== text) {
+      searchIndex = JSON.parse(text);
+      searchIndex.text = text;
+      searchIndex.decoded = [];
+    }
+    return searchIndex;
+  };
+
+  // Postings are the gaps between the numbers of the slides a word appears
+  // in, in base 36
+  var getPostings = function(index, termNo) {
+    var numbers = index.decoded[termNo];
+    if (!numbers) {
+      var gaps = index.postings[termNo].split(',');
+      var number = 0;
+      numbers = [];
+      for (var i = 0; i < gaps.length; i++) {
+        number += parseInt(gaps[i], 36);
+        numbers.push(number);
+      }
+      index.decoded[termNo] = numbers;
+    }
+    return numbers;
+  };
+
+  var splitWords = (function() {
+    var words;
+    try {
+      words = new RegExp('[\\p{L}\\p{N}_]+', 'gu');
+    } catch (e) {
+      words = /\w+/g;
+    }
+    return function(text) {
+      return text.toLowerCase().match(words) || [];
+    };
+  })();
+
+  // Returns the numbers of the slides holding words starting with each
+  // word of a query, looking up the sorted words of the index; empty slides
+  // have no number (see getSlideNoByNumber)
+  var searchSlides = function(query) {
+    var index = loadSearchIndex();
+    var terms = index.terms;
+    var words = splitWords(query);
+    var counts = {};
+    var searched = {};
+    var numWords = 0;
+    for (var i = 0; i < words.length; i++) {
+      var word = words[i];
+      if (searched[word]) {
+        continue;
+      }
+      searched[word] = true;
+      numWords++;
+      var low = 0, high = terms.length;
+      while (low < high) {
+        var middle = (low + high) >> 1;
+        if (terms[middle] < word) {
+          low = middle + 1;
+        } else {
+          high = middle;
+        }
+      }
+      var found = {};
+      for (var termNo = low; termNo < terms.length && terms[termNo].lastIndexOf(word, 0) === 0; termNo++) {
+        var numbers = getPostings(index, termNo);
+        for (var j = 0; j < numbers.length; j++) {
+          if (!found[numbers[j]]) {
+            found[numbers[j]] = true;
+            counts[numbers[j]] = (counts[numbers[j]] || 0) + 1;
+          }
+        }
+      }
+    }
+    var results = [];
+    if (numWords) {
+      for (var number in counts) {
+        if (counts[number] == numWords) {
+          results.push(Number(number));
+        }
+      }
+    }
+    return results.sort(function(a, b) { return a - b; });
+  };
+
+  var goToSlide = function(slideNo) {
+    currentSlideNo = slideNo;
+    updateSlideClasses();
+  };
+
+  var showSearchResults = function() {
+    var table = document.getElementById('search-results');
+    var results = searchSlides(document.getElementById('search-input').value);
+    while (table.rows.length) {
+      table.deleteRow(0);
+    }
+    table.results = results;
+    var onClick = function(e) {
+      goToSlide(this.slideNo);
+      e.preventDefault();
+    };
+    for (var i = 0; i < results.length && i < MAX_SEARCH_RESULTS; i++) {
+      var row = table.insertRow(-1);
+      var cells = [document.createElement('th'), document.createElement('td')];
+      var slideNo = getSlideNoByNumber(results[i]);
+      var texts = [getSlideTitle(slideNo) || 'Slide ' + results[i], String(results[i])];
+      for (var j = 0; j < cells.length; j++) {
+        var link = document.createElement('a');
+        link.href = '#slide' + slideNo;
+        link.slideNo = slideNo;
+        link.textContent = texts[j];
+        link.addEventListener('click', onClick, true);
+        cells[j].appendChild(link);
+        row.appendChild(cells[j]);
+      }
+    }
+    if (results.length > MAX_SEARCH_RESULTS) {
+      var more = table.insertRow(-1).insertCell(-1);
+      more.colSpan = 2;
+      more.textContent = (results.length - MAX_SEARCH_RESULTS) + ' more slides';
+    }
+  };
+
+  var handleSearchKeyDown = function(event) {
+    switch (event.keyCode) {
+      case 13: // Enter
+        var results = document.getElementById('search-results').results;
+        if (results && results.length) {
+          goToSlide(getSlideNoByNumber(results[0]));
+        }
+        break;
+      case 27: // ESC
+        showSearch();
+        break;
+    }
+  };
+
   var switch3D = function() {
     if (document.body.className.indexOf('three-d') == -1) {
       document.getElementsByClassName('presentation')[0].style.webkitPerspective = '1000px';
@@ -202,6 +470,50 @@ function main() {
     action(document.body, 'expose');
     overviewActive = !overviewActive;
     updateOverview();
+    updateThumbnails();
+  };
+
+  // In overview mode, the contents of slides are only shown once their
+  // thumbnail is scrolled into view: lazy slides are materialized then, and
+  // the others are hidden by the offscreen class until then
+  var updateThumbnails = function() {
+    if (!window.IntersectionObserver) {
+      return;
+    }
+    if (thumbnailsObserver) {
+      thumbnailsObserver.disconnect();
+      thumbnailsObserver = null;
+    }
+    if (!overviewActive) {
+      for (var i = 0; i < slides.length; i++) {
+        removeClass(slides.item(i), 'offscreen');
+      }
+      if (lazy) {
+        updateFragments();
+      }
+      return;
+    }
+    thumbnailsObserver = new IntersectionObserver(function(entries) {
+      for (var i = 0; i < entries.length; i++) {
+        if (entries[i].isIntersecting) {
+          if (lazy) {
+            materializeSlide(entries[i].target.num);
+          } else {
+            removeClass(entries[i].target, 'offscreen');
+          }
+          thumbnailsObserver.unobserve(entries[i].target);
+        }
+      }
+    });
+    for (var i = 0; i < slides.length; i++) {
+      var slide = slides.item(i);
+      if (!lazy) {
+        addClass(slide, 'offscreen');
+        thumbnailsObserver.observe(slide);
+      } else if (!slide.materialized && slide.fragment !== null) {
+        thumbnailsObserver.observe(slide);
+      }
+    }
   };
 
   var updateOverview = function() {
@@ -227,6 +539,10 @@ function main() {
   };
 
   var handleBodyKeyDown = function(event) {
+    if (event.target.id == 'search-input') {
+      handleSearchKeyDown(event);
+      return;
+    }
     switch (event.keyCode) {
       case 13: // Enter
         if (overviewActive) {
@@ -261,11 +577,18 @@ function main() {
       case 84: // t
         showToc();
         break;
+      case 191: // /
+        if (document.getElementById('search')) {
+          // not typed in the search box
+          event.preventDefault();
+          showSearch();
+        }
+        break;
     }
   };
 
   var handleWheel = function(event) {
-    if (tocOpened || helpOpened) {
+    if (tocOpened || helpOpened || searchOpened) {
       return;
     }
 
@@ -289,18 +612,58 @@ function main() {
     }
   };
 
+  var addSlideClickListener = function(slide, slideNo) {
+    slide.num = slideNo;
+    slide.addEventListener('click', function(e) {
+      if (overviewActive) {
+        currentSlideNo = this.num;
+        toggleOverview();
+        updateSlideClasses();
+      }
+      return false;
+    }, true);
+  };
+
   var addSlideClickListeners = function() {
     for (var i=0; i < slides.length; i++) {
-      var slide = slides.item(i);
-      slide.num = i + 1;
-      slide.addEventListener('click', function(e) {
-        if (overviewActive) {
-          currentSlideNo = this.num;
-          toggleOverview();
-          updateSlideClasses();
-        }
-        return false;
-      }, true);
+      addSlideClickListener(slides.item(i), i + 1);
+    }
+  };
+
+  // Sets up a slide wrapper which replaced one of the page, eg. by the live
+  // preview once its source changed, as the slides of the page were
+  // initially
+  var refreshSlide = function(wrapper) {
+    var slide = wrapper.getElementsByClassName('slide')[0];
+    var slideNo = Array.prototype.indexOf.call(slides, slide) + 1;
+    if (!slideNo) {
+      return;
+    }
+    var distance = slideNo - currentSlideNo;
+    removeClass(slide, 'far-past past current future far-future');
+    addClass(slide, distance < -1 ? 'far-past' : distance == -1 ? 'past' :
+             distance === 0 ? 'current' : distance == 1 ? 'future' : 'far-future');
+    addSlideClickListener(slide, slideNo);
+    var index = materializedSlides.indexOf(slideNo);
+    if (index != -1) {
+      materializedSlides.splice(index, 1);
+    }
+    if (lazy) {
+      if (Math.abs(distance) <= LAZY_DISTANCE) {
+        materializeSlide(slideNo);
+      } else if (overviewActive) {
+        updateThumbnails();
+      }
+    } else {
+      if (window.resolveEmbeddedImages) {
+        resolveEmbeddedImages(wrapper);
+      }
+      if (overviewActive) {
+        updateThumbnails();
+      }
+    }
+    if (!distance) {
+      document.getElementsByTagName('title')[0].innerText = getSlideTitle(currentSlideNo);
     }
   };
 
@@ -327,7 +690,7 @@ function main() {
       var tocLinks = toc.getElementsByTagName('a');
       for (var i=0; i < tocLinks.length; i++) {
         tocLinks.item(i).addEventListener('click', function(e) {
-          currentSlideNo = Number(this.attributes['href'].value.replace('#slide', ''));
+          currentSlideNo = getSlideNoByNumber(Number(this.attributes['href'].value.replace('#slide', '')));
           updateSlideClasses();
           return false;
         }, true);
@@ -348,9 +711,14 @@ function main() {
     document.addEventListener('DOMMouseScroll', handleWheel, false);
     window.onmousewheel = document.onmousewheel = handleWheel;
 
+    var metadataEl = document.getElementById('slides-metadata');
+    if (metadataEl) {
+      slidesMetadata = JSON.parse(metadataEl.textContent);
+    }
+
     var els = slides;
     for (var i = 0, el; el = els[i]; i++) {
-      addClass(el, 'slide far-future');
+      addClass(el, i + 1 < currentSlideNo ? 'slide far-past' : 'slide far-future');
     }
     updateSlideClasses();
 
@@ -359,6 +727,13 @@ function main() {
 
     addTocLinksListeners();
 
+    var searchInput = document.getElementById('search-input');
+    if (searchInput) {
+      searchInput.addEventListener('input', showSearchResults, false);
+    }
+
     addSlideClickListeners();
+
+    window.refreshSlide = refreshSlide;
   })();
 };
@@ -15,7 +15,50 @@
 #  limitations under the License.
 
 import os
+import re
+
+from logging import getLogger, Handler
 
 def get_abs_path_url(path):
     """Returns the absolute url for a given local path"""
     return "file://%s" % os.path.abspath(path)
+
+def get_text(html):
+    """Returns the text of some html code, without tags and entities"""
+    from HTMLParser import HTMLParser
+    return HTMLParser().unescape(re.sub(r'<[^>]*>', '', html))
+
+def get_path_url(path, prefix=None):
+    """Returns the url for a given local path, served by an http server
+    under ``prefix`` if given, or as a file:// url"""
+    if prefix is None:
+        return get_abs_path_url(path)
+    import urllib
+    path = os.path.abspath(path)
+    if isinstance(path, unicode):
+        path = path.encode('utf8')
+    return prefix + urllib.quote(path)
+
+class RecordingHandler(Handler):
+    """Keeps log records of a worker process, to be sent to the main
+    process"""
+    def __init__(self):
+        Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # formats the message now, as arguments may not be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+def record_logs(name='landslide'):
+    """Makes a logger, in a worker process, keep its records in a
+    ``RecordingHandler`` instead of emitting them, and returns the
+    handler"""
+    handler = RecordingHandler()
+    worker_logger = getLogger(name)
+    worker_logger.handlers = [handler]
+    worker_logger.propagate = False
+    return handler
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright 2010 Adam Zapletal
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import time
+
+from logging import getLogger
+logger = getLogger('landslide.watcher')
+
+
+class Watcher(object):
+    """Watches a set of files and directories, polling their modification
+    times. Directories are watched recursively; hidden files (editor swap
+    files and such) and ``ignore``'d paths are never reported.
+    """
+    def __init__(self, ignore=(), interval=0.25, delay=0.1):
+        self.ignore = set([os.path.abspath(path) for path in ignore])
+        self.interval = interval
+        self.delay = delay
+        self.paths = set()
+        self.mtimes = {}
+
+    def is_ignored(self, path):
+        return (path in self.ignore
+                or os.path.basename(path).startswith('.'))
+
+    def watch(self, paths):
+        """Sets the files and directories to watch. Changes happening
+        while the watched paths stay the same are never lost."""
+        paths = set([os.path.abspath(path) for path in paths])
+        if paths != self.paths:
+            self.paths = paths
+            self.mtimes = self.snapshot()
+
+    def snapshot(self):
+        mtimes = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = [name for name in dirnames
+                                   if not name.startswith('.')]
+                    for name in filenames:
+                        self._stat(os.path.join(dirpath, name), mtimes)
+            else:
+                self._stat(path, mtimes)
+        return mtimes
+
+    def _stat(self, path, mtimes):
+        if self.is_ignored(path):
+            return
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            pass
+
+    def poll(self):
+        """Returns the paths which changed since the previous call"""
+        mtimes = self.snapshot()
+        changed = set()
+        for path in set(mtimes) | set(self.mtimes):
+            if mtimes.get(path) != self.mtimes.get(path):
+                changed.add(path)
+        self.mtimes = mtimes
+        return changed
+
+    def wait(self):
+        """Blocks until some watched paths change, and returns them once no
+        other change happened for ``delay`` seconds, so that a burst of saves
+        only triggers a single rebuild."""
+        changed = set()
+        while not changed:
+            time.sleep(self.interval)
+            changed = self.poll()
+        while True:
+            time.sleep(self.delay)
+            more_changed = self.poll()
+            if not more_changed:
+                return changed
+            changed.update(more_changed)
+
+
+class InotifyWatcher(Watcher):
+    """A watcher relying on the Linux inotify API through ``pyinotify``
+    instead of polling."""
+    def __init__(self, ignore=(), interval=0.25, delay=0.1):
+        import pyinotify
+        Watcher.__init__(self, ignore, interval, delay)
+        self.mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE
+                     | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM
+                     | pyinotify.IN_MOVED_TO | pyinotify.IN_MODIFY)
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.manager, self._handle_event)
+        self.events = set()
+        self.directories = set()
+        self.files = set()
+
+    def watch(self, paths):
+        paths = set([os.path.abspath(path) for path in paths])
+        if paths == self.paths:
+            return
+        self.paths = paths
+        watches = self.manager.watches.keys()
+        if watches:
+            self.manager.rm_watch(watches, quiet=True)
+        self.directories = set()
+        self.files = set()
+        for path in paths:
+            if os.path.isdir(path):
+                self.directories.add(path)
+                self.manager.add_watch(path, self.mask, rec=True,
+                                       auto_add=True, quiet=True)
+            else:
+                # watching the parent directory also catches files being
+                # replaced on save, which many editors do
+                self.files.add(path)
+                self.manager.add_watch(os.path.dirname(path), self.mask,
+                                       quiet=True)
+
+    def _handle_event(self, event):
+        path = os.path.abspath(event.pathname)
+        if self.is_ignored(path):
+            return
+        if path in self.files:
+            self.events.add(path)
+            return
+        for directory in self.directories:
+            if path.startswith(directory + os.sep):
+                self.events.add(path)
+                return
+
+    def poll(self, timeout=0):
+        if self.notifier.check_events(timeout):
+            self.notifier.read_events()
+            self.notifier.process_events()
+        changed, self.events = self.events, set()
+        return changed
+
+    def wait(self):
+        changed = set()
+        while not changed:
+            changed = self.poll(None)
+        while True:
+            more_changed = self.poll(int(self.delay * 1000))
+            if not more_changed:
+                return changed
+            changed.update(more_changed)
+
+
+def get_watcher(ignore=(), interval=0.25, delay=0.1):
+    """Returns the most efficient watcher available on this system"""
+    try:
+        import pyinotify
+    except ImportError:
+        logger.debug(u"pyinotify is not available, polling for changes")
+        return Watcher(ignore, interval, delay)
+    return InotifyWatcher(ignore, interval, delay)